@@ -0,0 +1,226 @@
+import email.utils
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from ibm_watsonx_orchestrate.run import connections
+from tracing import redact_url, span
+
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------------- Shared OAuth2 HTTP client -------------------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+# Responses that are retried, with exponential backoff or as long as Retry-After asks
+RETRY_STATUSES = {429, 503}
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30
+# The circuit opens after this many consecutive failures and stays open this long
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+POOL_SIZE = 10
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend that has been failing."""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failures the
+    circuit opens and calls fail fast for `reset_seconds`; then a single trial call is
+    let through (half-open), whose outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Parses a Retry-After header given in seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, moment.timestamp() - time.time())
+
+
+_sessions: Dict[str, requests.Session] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_sessions_lock = threading.Lock()
+
+
+def session_for(base_url: str):
+    """
+    Returns the pooled session and circuit breaker for a base URL. They hold no
+    credentials, so all users of a backend share them.
+    """
+    with _sessions_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[base_url] = session
+            _breakers[base_url] = CircuitBreaker()
+        return session, _breakers[base_url]
+
+
+class ApiClient:
+    """
+    HTTP client for a backend reached through an OAuth2 connection.
+
+    - Credentials are read from the connection on every request. They belong to the
+      user of the current invocation, so they are never cached across calls.
+    - Each base URL gets one pooled, keep-alive session, shared by all clients.
+    - Every request has a timeout. 429/503 responses are retried with backoff,
+      honouring Retry-After. A 401 re-reads the credentials and retries once.
+    - A circuit breaker per base URL fails fast while the backend keeps failing.
+    """
+
+    def __init__(self, app_id: str, timeout=DEFAULT_TIMEOUT, max_retries: int = MAX_RETRIES,
+                 credentials_provider=None):
+        self.app_id = app_id
+        # Returns an object with `url` and `access_token`; the connection by default
+        self.credentials_provider = credentials_provider or connections.oauth2_auth_code
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def credentials(self):
+        """Returns the current invocation's connection credentials (an env read)."""
+        return self.credentials_provider(self.app_id)
+
+    @property
+    def base_url(self) -> str:
+        return self.credentials().url.rstrip("/")
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        delay = retry_after_seconds(response) if response is not None else None
+        if delay is None:
+            delay = BACKOFF_BASE_SECONDS * (2 ** attempt) * (0.5 + random.random())
+        return min(delay, MAX_BACKOFF_SECONDS)
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Sends a request to `path` (relative to the connection URL, or absolute) and
+        returns the response, raising requests.HTTPError for error statuses.
+        """
+        creds = self.credentials()
+        base_url = creds.url.rstrip("/")
+        url = path if path.startswith(("http://", "https://")) else f"{base_url}{path}"
+        session, breaker = session_for(base_url)
+        kwargs.setdefault("timeout", self.timeout)
+        extra_headers = kwargs.pop("headers", None) or {}
+        refreshed = False
+
+        with span(f"http {method.upper()}", {"app_id": self.app_id, "http.url": redact_url(url)}) as s:
+            attempt = 0
+            while True:
+                if not breaker.allow():
+                    raise CircuitOpenError(f"{base_url} is unavailable, not calling it for now")
+
+                headers = {
+                    "Authorization": f"Bearer {creds.access_token}",
+                    "Content-Type": "application/json",
+                    **extra_headers
+                }
+                try:
+                    response = session.request(method, url, headers=headers, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    breaker.record_failure()
+                    if method.upper() != "GET" or attempt >= self.max_retries:
+                        raise
+                    time.sleep(self._backoff(attempt, None))
+                    attempt += 1
+                    s.add("retries")
+                    continue
+
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+
+                if response.status_code == 401 and not refreshed:
+                    creds = self.credentials()
+                    refreshed = True
+                    s.set_attribute("credentials_refreshed", True)
+                    continue
+                if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                    time.sleep(self._backoff(attempt, response))
+                    attempt += 1
+                    s.add("retries")
+                    continue
+
+                s.set_attributes({"http.status_code": response.status_code, "bytes": len(response.content)})
+                response.raise_for_status()
+                return response
+
+    def get(self, path: str, params=None, **kwargs) -> requests.Response:
+        return self.request("GET", path, params=params, **kwargs)
+
+    def post(self, path: str, json=None, **kwargs) -> requests.Response:
+        return self.request("POST", path, json=json, **kwargs)
+
+
+_clients: Dict[str, ApiClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(app_id: str) -> ApiClient:
+    """Returns the shared client for a connection app id."""
+    with _clients_lock:
+        client = _clients.get(app_id)
+        if client is None:
+            client = _clients[app_id] = ApiClient(app_id)
+        return client
+
+
+def set_client(app_id: str, client: ApiClient):
+    """Replaces the shared client for a connection app id, e.g. with one for a stand-in server."""
+    with _clients_lock:
+        _clients[app_id] = client
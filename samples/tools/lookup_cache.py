@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from tracing import current_span
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------- Read-through cache for record lookups -------------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+
+# A record is trusted for this fraction of the time since it was last modified, between
+# the minimum and maximum TTL: a ticket edited a minute ago is re-checked within seconds,
+# one untouched for a day is served from the cache for the maximum TTL.
+# Set LOOKUP_CACHE_MAX_TTL=0 to disable the cache.
+MIN_TTL_SECONDS = float(os.getenv("LOOKUP_CACHE_MIN_TTL", "10"))
+MAX_TTL_SECONDS = float(os.getenv("LOOKUP_CACHE_MAX_TTL", "120"))
+FRESHNESS_FRACTION = 0.1
+CACHE_MAX_ENTRIES = int(os.getenv("LOOKUP_CACHE_SIZE", "1024"))
+# Cache statistics are logged every this many lookups
+STATS_LOG_INTERVAL = 100
+
+# Salesforce: 2025-01-31T12:00:00.000+0000, ServiceNow: 2025-01-31 12:00:00 (an internal
+# value, which is UTC; display values are in the API user's timezone and are not used)
+TIMESTAMP_FORMATS = ["%Y-%m-%dT%H:%M:%S.%f%z", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d %H:%M:%S"]
+
+logger = logging.getLogger(__name__)
+
+
+def parse_timestamp(value) -> Optional[float]:
+    """
+    Parses a Salesforce timestamp or an internal ServiceNow timestamp. A timestamp
+    without an offset is taken as UTC, so ServiceNow display values must not be passed.
+    """
+    if not isinstance(value, str):
+        return None
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            moment = datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+    return None
+
+
+def freshness_ttl(version: Optional[str], min_ttl: float = None, max_ttl: float = None) -> float:
+    """TTL for a record whose last modification time is `version`."""
+    min_ttl = MIN_TTL_SECONDS if min_ttl is None else min_ttl
+    max_ttl = MAX_TTL_SECONDS if max_ttl is None else max_ttl
+    modified_at = parse_timestamp(version)
+    if modified_at is None:
+        return min_ttl
+    age = time.time() - modified_at
+    return max(min_ttl, min(max_ttl, age * FRESHNESS_FRACTION))
+
+
+def user_scope(app_id: str, credentials_provider=None) -> str:
+    """
+    Cache scope of the user of the current invocation, so that users never see each
+    other's entries. It is derived from the token of this invocation's connection,
+    read by `credentials_provider` (connections.oauth2_auth_code by default).
+    """
+    if credentials_provider is None:
+        from ibm_watsonx_orchestrate.run import connections
+        credentials_provider = connections.oauth2_auth_code
+    creds = credentials_provider(app_id)
+    token = hashlib.sha256(creds.access_token.encode("utf-8")).hexdigest()[:16]
+    return f"{app_id}:{token}"
+
+
+class _Entry:
+    __slots__ = ("value", "version", "expires_at")
+
+    def __init__(self, value, version: Optional[str], expires_at: float):
+        self.value = value
+        self.version = version
+        self.expires_at = expires_at
+
+
+class LookupCache:
+    """
+    Read-through LRU cache for single-record lookups.
+
+    Entries live for a TTL derived from the record's last modification time. When an
+    entry expires and a `revalidate` function is given, the record's current
+    modification time is fetched (a much smaller request than the full record) and the
+    cached value is kept if it has not changed.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.changed = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, scope: str, key: str, fetch, revalidate=None):
+        """
+        Returns the value for key within scope.
+
+        - fetch() returns (value, version): the record and its last modification time,
+          or None as version if the record has none (e.g. it was not found).
+        - revalidate(value) returns the record's current version.
+        """
+        if MAX_TTL_SECONDS <= 0:
+            return fetch()[0]
+
+        cache_key = (scope, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry.expires_at > time.monotonic():
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                self._maybe_log_stats()
+                current_span().set_attribute("cache_hit", True)
+                return entry.value
+
+        if entry is not None and entry.version is not None and revalidate is not None:
+            if revalidate(entry.value) == entry.version:
+                with self._lock:
+                    entry.expires_at = time.monotonic() + freshness_ttl(entry.version)
+                    self.revalidated += 1
+                    self._maybe_log_stats()
+                current_span().set_attributes({"cache_hit": True, "cache_revalidated": True})
+                return entry.value
+            counter = "changed"
+        else:
+            counter = "misses"
+
+        current_span().set_attribute("cache_hit", False)
+        value, version = fetch()
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self._store(cache_key, value, version)
+            self._maybe_log_stats()
+        return value
+
+    def put(self, scope: str, key: str, value, version: Optional[str]):
+        """Stores a record fetched by another call, e.g. a bulk lookup."""
+        if MAX_TTL_SECONDS <= 0:
+            return
+        with self._lock:
+            self._store((scope, key), value, version)
+
+    def _store(self, cache_key, value, version: Optional[str]):
+        self._entries[cache_key] = _Entry(value, version, time.monotonic() + freshness_ttl(version))
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, scope: str, key: str):
+        with self._lock:
+            self._entries.pop((scope, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.revalidated + self.changed + self.misses
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "changed": self.changed,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.revalidated) / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "evictions": self.evictions,
+        }
+
+    def _maybe_log_stats(self):
+        lookups = self.hits + self.revalidated + self.changed + self.misses
+        if lookups % STATS_LOG_INTERVAL == 0:
+            logger.info("lookup cache stats: %s", self.stats())
+
+
+lookup_cache = LookupCache()
+
+
+def get_lookup_cache_stats() -> dict:
+    """Hit-rate metrics of the case and ticket lookup cache."""
+    return lookup_cache.stats()
+
+
+def run_standin_benchmark(lookups: int, hot_records: int, edit_rate: float):
+    """
+    Drives get_case_status, get_all_case_information and get_ticket_test against a
+    local stand-in Salesforce/ServiceNow server and reports how many requests reached it.
+    """
+    import salesforce
+    import servicenow
+    from standin_server import StandInRecords, install_standin_clients, start_standin_server
+
+    records = StandInRecords(hot_records)
+    server, url = start_standin_server(records)
+    install_standin_clients(url)
+
+    # One bulk call fetches (and caches) all the hot tickets
+    servicenow.get_tickets([ticket["number"] for ticket in records.tickets])
+    print(f"get_tickets: {hot_records} tickets in {records.requests['servicenow']} request(s)")
+
+    rng = random.Random(7)
+    start = time.perf_counter()
+    for _ in range(lookups):
+        index = rng.randint(1, hot_records)
+        if rng.random() < edit_rate:
+            records.touch_case(index)
+            records.touch_ticket(index)
+        salesforce.get_case_status(records.cases[index - 1]["CaseNumber"])
+        salesforce.get_all_case_information(records.cases[index - 1]["CaseNumber"])
+        servicenow.get_ticket_test(records.tickets[index - 1]["number"])
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"{3 * lookups} lookups in {elapsed:.2f}s")
+    print(f"Stand-in server requests: {records.requests}")
+    print("Cache stats:", get_lookup_cache_stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=300, help="Lookups per tool")
+    parser.add_argument("--hot", type=int, default=5, help="Number of distinct hot cases/tickets")
+    parser.add_argument("--edit_rate", type=float, default=0.02, help="Chance a record is edited before a lookup")
+    parser.add_argument("--ttl", type=float, help="Override the minimum and maximum TTL (seconds)")
+    args = parser.parse_args()
+
+    # The tools use the importable module, not this __main__ copy
+    import lookup_cache as cache_module
+
+    if args.ttl is not None:
+        cache_module.MIN_TTL_SECONDS = cache_module.MAX_TTL_SECONDS = args.ttl
+
+    cache_module.run_standin_benchmark(args.lookups, args.hot, args.edit_rate)
@@ -0,0 +1,552 @@
+import argparse
+import json
+import logging
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Set
+
+from lookup_cache import parse_timestamp
+from tracing import current_span
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------ Local mirror of Salesforce and ServiceNow ----------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+
+# The mirror is optional: set RECORD_MIRROR_PATH to a SQLite file kept up to date by the
+# sync worker (run this module, or call start_sync_worker()). The tools answer from the
+# mirror while its last successful sync is at most RECORD_MIRROR_MAX_STALENESS seconds
+# old, and call the live API otherwise, or when a record is not in the mirror.
+# The worker syncs with its own credentials, and the tools answer every user from that
+# data instead of calling the API with the user's connection, so the per-user scoping
+# of the lookup cache does not apply. The mirror is therefore only used when
+# RECORD_MIRROR_SHARED_ACCOUNT=true confirms that the connections use a shared service
+# account, whose cases and tickets every user of the agent may see anyway.
+MIRROR_PATH = os.getenv("RECORD_MIRROR_PATH", "")
+SHARED_ACCOUNT = os.getenv("RECORD_MIRROR_SHARED_ACCOUNT", "false").lower() in ("1", "true", "yes")
+MAX_STALENESS_SECONDS = float(os.getenv("RECORD_MIRROR_MAX_STALENESS", "60"))
+SYNC_INTERVAL_SECONDS = float(os.getenv("RECORD_MIRROR_SYNC_INTERVAL", "15"))
+# Each delta sync starts this long before the watermark, so that records saved in the
+# same second as the last synced one, or with a slightly skewed clock, are not missed
+SYNC_OVERLAP_SECONDS = 5
+# Delta syncs only see changed records, so every this often the ids of all records are
+# listed and the ones deleted at the source are removed from the mirror
+RECONCILE_INTERVAL_SECONDS = float(os.getenv("RECORD_MIRROR_RECONCILE_INTERVAL", "600"))
+UPSERT_BATCH_SIZE = 500
+TICKET_PAGE_SIZE = 500
+
+# Superset of the fields get_case_status and get_all_case_information return
+CASE_FIELDS = ["Id", "CaseNumber", "Status", "Description", "LastModifiedDate"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id TEXT PRIMARY KEY,
+    id15 TEXT NOT NULL,
+    case_number TEXT,
+    modified_at REAL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cases_case_number ON cases (case_number);
+CREATE INDEX IF NOT EXISTS cases_id15 ON cases (id15 COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS tickets (
+    sys_id TEXT PRIMARY KEY,
+    number TEXT,
+    modified_at REAL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tickets_number ON tickets (number);
+CREATE TABLE IF NOT EXISTS sync_state (
+    source TEXT PRIMARY KEY,
+    watermark REAL,
+    synced_at REAL NOT NULL
+);
+"""
+
+# Primary key column of each mirrored source
+ID_COLUMNS = {"cases": "id", "tickets": "sys_id"}
+
+logger = logging.getLogger(__name__)
+
+
+class RecordMirror:
+    """SQLite mirror of Cases and tickets, indexed by the identifiers the tools look up."""
+
+    def __init__(self, path: str, max_staleness: float = MAX_STALENESS_SECONDS):
+        self.path = path
+        self.max_staleness = max_staleness
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets the tools read while the sync worker (possibly another process) writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        self.served = 0
+        self.fallbacks = 0
+        self._reconciled_at: Dict[str, float] = {}
+
+    # ------------------------------------ Sync ------------------------------------
+
+    def watermark(self, source: str) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute("SELECT watermark FROM sync_state WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def mark_synced(self, source: str, watermark: Optional[float], synced_at: float):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sync_state (source, watermark, synced_at) VALUES (?, ?, ?)",
+                (source, watermark, synced_at)
+            )
+            self._db.commit()
+
+    def upsert_cases(self, records: Iterable[dict]):
+        rows = [
+            (r["Id"], r["Id"][:15], r.get("CaseNumber"), parse_timestamp(r.get("LastModifiedDate")), json.dumps(r))
+            for r in records
+        ]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO cases VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def upsert_tickets(self, records: Iterable[dict]):
+        """Stores sysparm_display_value=all records as the display values the tools return."""
+        from servicenow import flatten_ticket, ticket_version
+
+        rows = []
+        for record in records:
+            ticket = flatten_ticket(record)
+            rows.append((ticket["sys_id"], ticket.get("number"), parse_timestamp(ticket_version(record)),
+                         json.dumps(ticket)))
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO tickets VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def reconcile_due(self, source: str) -> bool:
+        return time.time() - self._reconciled_at.get(source, 0.0) >= RECONCILE_INTERVAL_SECONDS
+
+    def remove_missing(self, source: str, live_ids: Set[str], listed_at: float) -> int:
+        """
+        Deletes the records of `source` whose ids are not in `live_ids`, all ids at the
+        source as listed from `listed_at` on; returns how many were deleted.
+        """
+        column = ID_COLUMNS[source]
+        with self._lock:
+            mirrored = {row[0] for row in self._db.execute(f"SELECT {column} FROM {source}")}
+            deleted = [(record_id,) for record_id in mirrored - live_ids]
+            self._db.executemany(f"DELETE FROM {source} WHERE {column} = ?", deleted)
+            self._db.commit()
+        self._reconciled_at[source] = listed_at
+        return len(deleted)
+
+    # ----------------------------------- Lookups -----------------------------------
+
+    def is_fresh(self, source: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT synced_at FROM sync_state WHERE source = ?", (source,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.max_staleness
+
+    def find_case(self, case_identifier: str) -> Optional[dict]:
+        """
+        Returns the mirrored Case with this Case Number or Case ID (a Case Number match
+        wins), or None if the mirror is stale or does not have it.
+        """
+        identifier = case_identifier.strip()
+        record = None
+        if self.is_fresh("cases"):
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT record FROM cases WHERE case_number = ? LIMIT 1", (identifier,)
+                ).fetchone()
+                if row is None and len(identifier) in (15, 18):
+                    # 15 character Ids are case-sensitive, 18 character Ids are not
+                    rows = self._db.execute(
+                        "SELECT id, record FROM cases WHERE id15 = ? COLLATE NOCASE", (identifier[:15],)
+                    ).fetchall()
+                    for record_id, record_json in rows:
+                        if len(identifier) == 15 and record_id[:15] == identifier:
+                            row = (record_json,)
+                        elif len(identifier) == 18 and record_id.lower() == identifier.lower():
+                            row = (record_json,)
+            record = json.loads(row[0]) if row else None
+        self._count(record)
+        return record
+
+    def find_ticket(self, ticket_number: str) -> Optional[dict]:
+        """Returns the mirrored ticket, or None if the mirror is stale or does not have it."""
+        record = None
+        if self.is_fresh("tickets"):
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT record FROM tickets WHERE number = ? LIMIT 1", (ticket_number.strip(),)
+                ).fetchone()
+            record = json.loads(row[0]) if row else None
+        self._count(record)
+        return record
+
+    def _count(self, record):
+        if record is None:
+            self.fallbacks += 1
+        else:
+            self.served += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            cases = self._db.execute("SELECT COUNT(*) FROM cases").fetchone()[0]
+            tickets = self._db.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+            state = {
+                source: {"watermark": watermark, "age_seconds": round(time.time() - synced_at, 1)}
+                for source, watermark, synced_at in self._db.execute("SELECT * FROM sync_state")
+            }
+        return {
+            "cases": cases,
+            "tickets": tickets,
+            "served": self.served,
+            "fallbacks": self.fallbacks,
+            "sync_state": state,
+        }
+
+
+_mirror = None
+_mirror_lock = threading.Lock()
+_refusal_logged = False
+
+
+def get_mirror() -> Optional[RecordMirror]:
+    """
+    Returns the mirror configured with RECORD_MIRROR_PATH, or None if there is none or
+    RECORD_MIRROR_SHARED_ACCOUNT is not set.
+    """
+    global _mirror, _refusal_logged
+    if not MIRROR_PATH:
+        return None
+    with _mirror_lock:
+        if not SHARED_ACCOUNT:
+            if not _refusal_logged:
+                logger.warning("Record mirror disabled: RECORD_MIRROR_PATH is set, but "
+                               "RECORD_MIRROR_SHARED_ACCOUNT is not (see record_mirror.py)")
+                _refusal_logged = True
+            return None
+        if _mirror is None:
+            try:
+                _mirror = RecordMirror(MIRROR_PATH)
+            except sqlite3.Error as e:
+                logger.warning("Record mirror disabled (%s): %s", MIRROR_PATH, e)
+                return None
+        return _mirror
+
+
+def mirrored_case(case_identifier: str) -> Optional[dict]:
+    mirror = get_mirror()
+    if mirror is None:
+        return None
+    case = mirror.find_case(case_identifier)
+    current_span().set_attribute("mirror_hit", case is not None)
+    return case
+
+
+def mirrored_ticket(ticket_number: str) -> Optional[dict]:
+    mirror = get_mirror()
+    if mirror is None:
+        return None
+    ticket = mirror.find_ticket(ticket_number)
+    current_span().set_attribute("mirror_hit", ticket is not None)
+    return ticket
+
+
+# -------------------------------------- Sync worker --------------------------------------
+
+
+def _since(watermark: Optional[float]) -> Optional[datetime]:
+    if watermark is None:
+        return None
+    return datetime.fromtimestamp(watermark - SYNC_OVERLAP_SECONDS, tz=timezone.utc)
+
+
+def _minutes_since(since: datetime) -> int:
+    """Whole minutes from `since` to now, rounded up so that the window covers it."""
+    return max(1, math.ceil((time.time() - since.timestamp()) / 60))
+
+
+def sync_cases(mirror: RecordMirror) -> int:
+    """Copies the Cases modified since the last sync into the mirror; returns how many."""
+    from http_client import get_client
+    from salesforce import MY_APP_ID, iter_query_records
+
+    client = get_client(MY_APP_ID)
+    watermark = mirror.watermark("cases")
+    started = time.time()
+
+    soql_query = f"SELECT {', '.join(CASE_FIELDS)} FROM Case"
+    since = _since(watermark)
+    if since is not None:
+        soql_query += f" WHERE LastModifiedDate >= {since.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+    soql_query += " ORDER BY LastModifiedDate ASC"
+
+    synced = 0
+    batch = []
+    for record in iter_query_records(client, soql_query):
+        batch.append({field: record.get(field) for field in CASE_FIELDS})
+        modified_at = parse_timestamp(record.get("LastModifiedDate"))
+        if modified_at is not None and (watermark is None or modified_at > watermark):
+            watermark = modified_at
+        if len(batch) >= UPSERT_BATCH_SIZE:
+            mirror.upsert_cases(batch)
+            synced += len(batch)
+            batch = []
+    mirror.upsert_cases(batch)
+    synced += len(batch)
+
+    if mirror.reconcile_due("cases"):
+        listed_at = time.time()
+        live_ids = {record["Id"] for record in iter_query_records(client, "SELECT Id FROM Case")}
+        deleted = mirror.remove_missing("cases", live_ids, listed_at)
+        if deleted:
+            logger.info("Removed %d deleted Cases from the mirror", deleted)
+    mirror.mark_synced("cases", watermark, started)
+    return synced
+
+
+def iter_ticket_ids(client) -> Iterable[str]:
+    """Yields the sys_id of every ticket, paging by sys_id so that deletions do not shift pages."""
+    last = ""
+    while True:
+        query = f"sys_id>{last}^ORDERBYsys_id" if last else "ORDERBYsys_id"
+        params = {"sysparm_query": query, "sysparm_fields": "sys_id", "sysparm_limit": TICKET_PAGE_SIZE}
+        records = client.get("/api/now/table/ticket", params=params).json().get("result", [])
+        for record in records:
+            yield record["sys_id"]
+        if len(records) < TICKET_PAGE_SIZE:
+            break
+        last = records[-1]["sys_id"]
+
+
+def sync_tickets(mirror: RecordMirror) -> int:
+    """Copies the tickets updated since the last sync into the mirror; returns how many."""
+    from http_client import get_client
+    from servicenow import MY_APP_ID, TICKET_FIELDS, flatten_ticket, ticket_version
+
+    client = get_client(MY_APP_ID)
+    watermark = mirror.watermark("tickets")
+    started = time.time()
+
+    order = "ORDERBYsys_updated_on^ORDERBYsys_id"
+    window = None
+    since = _since(watermark)
+    if since is not None:
+        # A date-time literal in an encoded query is read in the API user's timezone, so
+        # the window is given relative to the instance's clock instead
+        window = f"sys_updated_on>=javascript:gs.minutesAgoStart({_minutes_since(since)})"
+
+    synced = 0
+    # Pages are keyed by the (sys_updated_on, sys_id) of the last synced ticket, not by
+    # offset: a ticket updated during the sync moves behind the cursor and is synced
+    # again, instead of shifting the pages after it and making the sync skip a ticket.
+    # (One updated in the same second as the cursor but sorting before it is picked up
+    # by the next sync, which starts SYNC_OVERLAP_SECONDS before the watermark.)
+    cursor = None
+    while True:
+        if cursor is None:
+            query = f"{window}^{order}" if window else order
+        else:
+            # GlideDateTime reads the internal (UTC) value the cursor holds
+            updated = f'javascript:new GlideDateTime("{cursor[0]}")'
+            query = f"sys_updated_on>{updated}^NQsys_updated_on={updated}^sys_id>{cursor[1]}^{order}"
+        params = {
+            "sysparm_query": query,
+            "sysparm_fields": ",".join(TICKET_FIELDS),
+            # Display values for the tools, internal (UTC) values for the watermark
+            "sysparm_display_value": "all",
+            "sysparm_exclude_reference_link": True,
+            "sysparm_limit": TICKET_PAGE_SIZE
+        }
+        records = client.get("/api/now/table/ticket", params=params).json().get("result", [])
+        for record in records:
+            modified_at = parse_timestamp(ticket_version(record))
+            if modified_at is not None and (watermark is None or modified_at > watermark):
+                watermark = modified_at
+        mirror.upsert_tickets(records)
+        synced += len(records)
+        if len(records) < TICKET_PAGE_SIZE:
+            break
+        cursor = (ticket_version(records[-1]), flatten_ticket(records[-1])["sys_id"])
+
+    if mirror.reconcile_due("tickets"):
+        listed_at = time.time()
+        deleted = mirror.remove_missing("tickets", set(iter_ticket_ids(client)), listed_at)
+        if deleted:
+            logger.info("Removed %d deleted tickets from the mirror", deleted)
+    mirror.mark_synced("tickets", watermark, started)
+    return synced
+
+
+def sync_once(mirror: RecordMirror) -> dict:
+    """Runs one delta sync of both sources; a failing source keeps its previous state."""
+    synced = {}
+    for source, sync in (("cases", sync_cases), ("tickets", sync_tickets)):
+        try:
+            synced[source] = sync(mirror)
+        except Exception as e:
+            logger.warning("Mirror sync of %s failed: %s", source, e)
+            synced[source] = None
+    return synced
+
+
+class MirrorSyncWorker(threading.Thread):
+    """Background thread that delta-syncs the mirror every `interval` seconds."""
+
+    def __init__(self, mirror: RecordMirror, interval: float = SYNC_INTERVAL_SECONDS):
+        super().__init__(name="record-mirror-sync", daemon=True)
+        self.mirror = mirror
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            synced = sync_once(self.mirror)
+            logger.info("Mirror sync: %s", synced)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def start_sync_worker(interval: float = SYNC_INTERVAL_SECONDS) -> Optional[MirrorSyncWorker]:
+    """Starts syncing the configured mirror in this process; returns None if there is no mirror."""
+    mirror = get_mirror()
+    if mirror is None:
+        return None
+    worker = MirrorSyncWorker(mirror, interval)
+    worker.start()
+    return worker
+
+
+def install_env_clients():
+    """
+    Outside Orchestrate there are no connections: the worker reads the instance URLs and
+    access tokens from SALESFORCE_URL/SALESFORCE_ACCESS_TOKEN and
+    SERVICENOW_URL/SERVICENOW_ACCESS_TOKEN instead.
+    """
+    import http_client
+    import salesforce
+    import servicenow
+
+    for app_id, prefix in ((salesforce.MY_APP_ID, "SALESFORCE"), (servicenow.MY_APP_ID, "SERVICENOW")):
+        creds = types.SimpleNamespace(url=os.getenv(f"{prefix}_URL", ""), access_token=os.getenv(f"{prefix}_ACCESS_TOKEN", ""))
+        http_client.set_client(app_id, http_client.ApiClient(app_id, credentials_provider=lambda _, c=creds: c))
+
+
+def run_standin_demo(records_count: int, lookups: int):
+    """Full sync, delta sync and mirror-served lookups against a local stand-in server."""
+    global MIRROR_PATH, SHARED_ACCOUNT, RECONCILE_INTERVAL_SECONDS, TICKET_PAGE_SIZE, _mirror
+    import salesforce
+    import servicenow
+    from standin_server import StandInRecords, install_standin_clients, start_standin_server
+
+    records = StandInRecords(records_count)
+    server, url = start_standin_server(records)
+    install_standin_clients(url)
+    MIRROR_PATH = os.path.join(tempfile.mkdtemp(), "record_mirror.sqlite3")
+    # The stand-in connections share one account
+    SHARED_ACCOUNT = True
+    _mirror = None
+    mirror = get_mirror()
+
+    start = time.perf_counter()
+    print(f"Full sync: {sync_once(mirror)} in {time.perf_counter() - start:.2f}s, requests {records.requests}")
+
+    for index in (3, 7, 11):
+        records.touch_case(index, status="Escalated")
+        records.touch_ticket(index, state="In Progress")
+    start = time.perf_counter()
+    print(f"Delta sync: {sync_once(mirror)} in {time.perf_counter() - start:.2f}s, requests {records.requests}")
+
+    # A ticket updated while a delta sync pages through the changed tickets is not skipped
+    for index in (20, 21, 22, 23):
+        records.touch_ticket(index, state="On Hold")
+    queries = []
+
+    def update_during_sync(params):
+        queries.append(params)
+        if len(queries) == 2:
+            records.touch_ticket(20, state="Resolved", updated_at=time.time() + 1)
+
+    page_size, TICKET_PAGE_SIZE = TICKET_PAGE_SIZE, 2
+    records.before_ticket_query = update_during_sync
+    sync_tickets(mirror)
+    records.before_ticket_query = None
+    TICKET_PAGE_SIZE = page_size
+    states = [mirror.find_ticket(f"INC{index:07d}")["state"] for index in (20, 21, 22, 23)]
+    print(f"Ticket updated during a paged delta sync ({len(queries)} pages), mirrored states: {states}")
+
+    before = dict(records.requests)
+    for i in range(lookups):
+        index = i % records_count + 1
+        salesforce.get_case_status(records.cases[index - 1]["CaseNumber"])
+        salesforce.get_all_case_information(records.cases[index - 1]["Id"])
+        servicenow.get_ticket_test(records.tickets[index - 1]["number"])
+    print(f"{3 * lookups} lookups from the mirror, live requests: "
+          f"{ {k: records.requests[k] - before[k] for k in before} }")
+    print(f"get_case_status('00000003'): {salesforce.get_case_status('00000003').content}")
+
+    # Deleted records are removed by the next reconciliation
+    records.delete_case(5)
+    records.delete_ticket(5)
+    RECONCILE_INTERVAL_SECONDS = 0
+    print(f"Reconciling sync: {sync_once(mirror)}, "
+          f"deleted ticket mirrored: {mirror.find_ticket('INC0000005') is not None}, "
+          f"deleted Case mirrored: {mirror.find_case('00000005') is not None}")
+
+    # A stale mirror is bypassed
+    mirror.max_staleness = 0
+    before = dict(records.requests)
+    servicenow.get_ticket_test(records.tickets[0]["number"])
+    salesforce.get_case_status("00000099999")
+    print(f"Stale mirror, live requests: { {k: records.requests[k] - before[k] for k in before} }")
+    print("Mirror stats:", mirror.stats())
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", help="SQLite file of the mirror (default: RECORD_MIRROR_PATH)")
+    parser.add_argument("--interval", type=float, default=SYNC_INTERVAL_SECONDS, help="Seconds between delta syncs")
+    parser.add_argument("--once", action="store_true", help="Run a single sync and exit")
+    parser.add_argument("--standin", action="store_true", help="Demonstrate the mirror against a local stand-in server")
+    parser.add_argument("--records", type=int, default=200, help="Stand-in records (with --standin)")
+    parser.add_argument("--lookups", type=int, default=100, help="Lookups per tool (with --standin)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # The tools use the importable module, not this __main__ copy
+    import record_mirror
+
+    if args.standin:
+        record_mirror.run_standin_demo(args.records, args.lookups)
+    else:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        record_mirror.install_env_clients()
+        if args.path:
+            record_mirror.MIRROR_PATH = args.path
+        mirror = record_mirror.get_mirror()
+        if mirror is None:
+            parser.error("Set RECORD_MIRROR_PATH (or pass --path) and RECORD_MIRROR_SHARED_ACCOUNT=true")
+        if args.once:
+            print(record_mirror.sync_once(mirror))
+        else:
+            worker = record_mirror.MirrorSyncWorker(mirror, args.interval)
+            worker.start()
+            try:
+                while worker.is_alive():
+                    worker.join(1)
+            except KeyboardInterrupt:
+                worker.stop()
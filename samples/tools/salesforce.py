@@ -1,7 +1,15 @@
+import re
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
 from ibm_watsonx_orchestrate.agent_builder.tools import tool
 from ibm_watsonx_orchestrate.agent_builder.connections import ConnectionType
-from ibm_watsonx_orchestrate.run import connections
+from http_client import ApiClient, get_client
+from lookup_cache import lookup_cache, user_scope
+from record_mirror import mirrored_case
+from tracing import traced
 
 # -----------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------
@@ -12,50 +20,273 @@ from ibm_watsonx_orchestrate.run import connections
 
 MY_APP_ID = 'salesforce_oauth2_auth_code_ibm_184bdbd3'
 
+# Salesforce record Ids are 15 (case-sensitive) or 18 (case-insensitive) alphanumeric
+# characters; Case records use the key prefix 500.
+RECORD_ID_PATTERN = re.compile(r"[a-zA-Z0-9]{15}(?:[a-zA-Z0-9]{3})?")
+CASE_KEY_PREFIX = "500"
+
+API_VERSION = "v61.0"
+
+# Multi-case lookups: identifiers per SOQL query (keeps the query URL short), and
+# subrequests per Composite API call (the API maximum).
+CASE_BATCH_SIZE = 200
+COMPOSITE_MAX_SUBREQUESTS = 25
+
+DEFAULT_CASE_FIELDS = ["Id", "CaseNumber", "Status"]
+FIELD_NAME_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*")
+
+SOQL_ESCAPES = {
+    "\\": "\\\\",
+    "'": "\\'",
+    '"': '\\"',
+    "\n": "\\n",
+    "\r": "\\r",
+    "\t": "\\t",
+    "\b": "\\b",
+    "\f": "\\f",
+}
+
+
+def soql_quote(value: str) -> str:
+    """Returns value as a quoted and escaped SOQL string literal."""
+    return "'" + "".join(SOQL_ESCAPES.get(ch, ch) for ch in value) + "'"
+
+
+def classify_case_identifier(identifier: str) -> Tuple[bool, bool]:
+    """
+    Returns (match_case_number, match_id) for a Case identifier.
+
+    - Numeric identifiers are Case Numbers, unless they also have the shape of a
+      record Id, in which case both fields are checked.
+    - Identifiers shaped like a Case record Id (15/18 characters, prefix 500) are Ids.
+    - Other Id-shaped identifiers are checked against both fields.
+    - Anything else can only be a Case Number; comparing it with Id would make
+      Salesforce reject the query as a malformed Id.
+    """
+    if RECORD_ID_PATTERN.fullmatch(identifier) is None:
+        return True, False
+    if identifier.startswith(CASE_KEY_PREFIX) and not identifier.isdigit():
+        return False, True
+    return True, True
+
+
+def case_lookup_condition(case_identifier: str) -> str:
+    """Builds the WHERE condition that finds a Case by Case Number or Case ID in one query."""
+    identifier = case_identifier.strip()
+    literal = soql_quote(identifier)
+    by_number, by_id = classify_case_identifier(identifier)
+
+    if not by_id:
+        return f"CaseNumber = {literal}"
+    if not by_number:
+        return f"Id = {literal}"
+    return f"CaseNumber = {literal} OR Id = {literal}"
+
+
+def cases_lookup_condition(case_identifiers: List[str]) -> str:
+    """Builds one WHERE condition that finds all the given Case Numbers and Case IDs."""
+    numbers = []
+    ids = []
+    for identifier in case_identifiers:
+        by_number, by_id = classify_case_identifier(identifier)
+        if by_number:
+            numbers.append(soql_quote(identifier))
+        if by_id:
+            ids.append(soql_quote(identifier))
+
+    conditions = []
+    if numbers:
+        conditions.append(f"CaseNumber IN ({', '.join(numbers)})")
+    if ids:
+        conditions.append(f"Id IN ({', '.join(ids)})")
+    return " OR ".join(conditions)
+
+
+def record_matches_id(record_id: str, identifier: str) -> bool:
+    """Compares a (18 character) record Id with a 15 or 18 character identifier."""
+    if len(identifier) == 15:
+        return record_id[:15] == identifier
+    return record_id.lower() == identifier.lower()
+
+
+def match_cases(case_identifiers: List[str], records: List[dict]) -> Dict[str, Optional[dict]]:
+    """Maps each identifier to its Case record (None if not found); Case Number matches win."""
+    by_number = {r.get("CaseNumber"): r for r in records}
+    # The first 15 characters of an Id identify the record (case-sensitively)
+    by_id_prefix = {r.get("Id", "")[:15]: r for r in records}
+    matches = {}
+    for identifier in case_identifiers:
+        record = by_number.get(identifier)
+        if record is None and classify_case_identifier(identifier)[1]:
+            candidate = by_id_prefix.get(identifier[:15])
+            if candidate is None and len(identifier) == 18:
+                # 18 character Ids are case-insensitive
+                candidate = next((r for r in records if record_matches_id(r.get("Id", ""), identifier)), None)
+            if candidate is not None and record_matches_id(candidate["Id"], identifier):
+                record = candidate
+        matches[identifier] = record
+    return matches
+
+
+def find_case(client: ApiClient, fields: str, case_identifier: str):
+    """
+    Looks up a Case by Case Number or Case ID with a single SOQL query.
+    Returns the Case record, or None if there is no match. If both a Case Number
+    and a Case ID match, the Case Number match wins.
+    """
+    soql_query = f"SELECT {fields} FROM Case WHERE {case_lookup_condition(case_identifier)} LIMIT 2"
+
+    response = client.get(f"/services/data/{API_VERSION}/query", params={"q": soql_query})
+    records = response.json().get("records", [])
+    if not records:
+        return None
+
+    identifier = case_identifier.strip()
+    for record in records:
+        if record.get("CaseNumber") == identifier:
+            return record
+    return records[0]
+
+
+def case_last_modified(client: ApiClient, case_id: str) -> Optional[str]:
+    """Returns the LastModifiedDate of a Case, or None if it no longer exists."""
+    soql_query = f"SELECT Id, LastModifiedDate FROM Case WHERE Id = {soql_quote(case_id)}"
+    response = client.get(f"/services/data/{API_VERSION}/query", params={"q": soql_query})
+    records = response.json().get("records", [])
+    return records[0].get("LastModifiedDate") if records else None
+
+
+def soql_datetime(value: str, end_of_day: bool = False) -> str:
+    """
+    Converts an ISO date ('2025-01-31') or datetime ('2025-01-31T12:00:00Z') into a
+    SOQL datetime literal. Dates expand to the start, or with end_of_day the end, of the day (UTC).
+    """
+    text = value.strip()
+    if len(text) == 10:
+        day = date.fromisoformat(text)
+        clock = "23:59:59" if end_of_day else "00:00:00"
+        return f"{day.isoformat()}T{clock}Z"
+    moment = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return moment.isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def build_case_query(fields: List[str], status: Optional[str] = None,
+                     created_after: Optional[str] = None, created_before: Optional[str] = None,
+                     limit: Optional[int] = None) -> str:
+    """Builds the SOQL query for a Case listing, with the filters and limit pushed down."""
+    for field in fields:
+        if not FIELD_NAME_PATTERN.fullmatch(field):
+            raise ValueError(f"Invalid field name: {field!r}")
+
+    conditions = []
+    if status:
+        conditions.append(f"Status = {soql_quote(status.strip())}")
+    if created_after:
+        conditions.append(f"CreatedDate >= {soql_datetime(created_after)}")
+    if created_before:
+        conditions.append(f"CreatedDate <= {soql_datetime(created_before, end_of_day=True)}")
+
+    soql_query = f"SELECT {', '.join(fields)} FROM Case"
+    if conditions:
+        soql_query += " WHERE " + " AND ".join(conditions)
+    soql_query += " ORDER BY CreatedDate DESC"
+    if limit is not None:
+        if limit <= 0:
+            raise ValueError("limit must be a positive number")
+        soql_query += f" LIMIT {int(limit)}"
+    return soql_query
+
+
+def iter_query_records(client: ApiClient, soql_query: str) -> Iterator[dict]:
+    """
+    Runs a SOQL query and yields its records page by page, following nextRecordsUrl
+    until the result set is exhausted. The next page is fetched in the background
+    while the records of the current page are being consumed.
+    """
+
+    def fetch(path, params=None):
+        return client.get(path, params=params).json()
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        page = fetch(f"/services/data/{API_VERSION}/query", {"q": soql_query})
+        while True:
+            next_url = page.get("nextRecordsUrl")
+            prefetch = executor.submit(fetch, next_url) if next_url else None
+            for record in page.get("records", []):
+                yield record
+            if prefetch is None:
+                break
+            page = prefetch.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_salesforce_cases(client: ApiClient, fields: Optional[List[str]] = None,
+                          status: Optional[str] = None, created_after: Optional[str] = None,
+                          created_before: Optional[str] = None,
+                          limit: Optional[int] = None) -> Iterator[dict]:
+    """Yields Case records with only the selected fields, across all result pages."""
+    fields = fields or DEFAULT_CASE_FIELDS
+    soql_query = build_case_query(fields, status, created_after, created_before, limit)
+    for record in iter_query_records(client, soql_query):
+        yield {field: record.get(field) for field in fields}
+
+
+@traced
 @tool(
     expected_credentials=[
         {"app_id": MY_APP_ID, "type": ConnectionType.OAUTH2_AUTH_CODE}
     ]
 )
-def get_salesforce_cases():
+def get_salesforce_cases(
+    status: Optional[str] = None,
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None
+):
     """
-    Fetch Case Id and Status from Salesforce using OAuth2 credentials. 
+    Fetch Cases from Salesforce using OAuth2 credentials, newest first.
+    All result pages are read, so no Cases are silently left out.
+
+    Args:
+        status: Only return Cases with this Status (e.g., 'New', 'Closed')
+        created_after: Only return Cases created on or after this date (YYYY-MM-DD)
+        created_before: Only return Cases created on or before this date (YYYY-MM-DD)
+        limit: Maximum number of Cases to return
+        fields: Case fields to return (default: Id, CaseNumber, Status)
+
     Return the information in Tabular format:
     | Case Number | Case ID | Status |
     |-----------------------|----------|
     | Case Number | Case ID | Status |
     """
-    # Get Salesforce OAuth2 connection credentials
-    creds = connections.oauth2_auth_code(MY_APP_ID)
-    base_url = creds.url
+    # Shared client: pooled connections, retries; credentials are read per call
+    client = get_client(MY_APP_ID)
 
-    headers = {
-        "Authorization": f"Bearer {creds.access_token}",
-        "Content-Type": "application/json"
-    }
-
-    # SOQL query for Case Number, Id, and Status
-    soql_query = "SELECT Id, CaseNumber, Status FROM Case"
-
-    response = requests.get(
-        f"{base_url}/services/data/v61.0/query",
-        headers=headers,
-        params={"q": soql_query}
-    )
-    response.raise_for_status()
+    # Return clean list of dictionaries
+    return list(iter_salesforce_cases(
+        client,
+        fields=fields,
+        status=status,
+        created_after=created_after,
+        created_before=created_before,
+        limit=limit
+    ))
 
-    records = response.json().get("records", [])
+def case_status(case: dict) -> dict:
+    """The fields get_case_status returns for a Case record."""
+    return {
+        "CaseNumber": case.get("CaseNumber"),
+        "Id": case["Id"],
+        "Status": case["Status"]
+    }
 
-    # Return clean list of dictionaries
-    return [
-        {
-            "CaseNumber": r.get("CaseNumber"),
-            "Id": r["Id"],
-            "Status": r["Status"]
-        }
-        for r in records
-    ]
 
+@traced
 @tool(
     expected_credentials=[
         {"app_id": MY_APP_ID, "type": ConnectionType.OAUTH2_AUTH_CODE}
@@ -64,7 +295,7 @@ def get_salesforce_cases():
 def get_case_status(case_identifier: str):
     """
     Fetch the status of a specific Salesforce Case by Case Number or Case ID.
-    Automatically searches by Case Number first, then falls back to Case ID if not found.
+    Searches both fields at once; a Case Number match takes precedence.
     
     Args:
         case_identifier: The Case Number (e.g., '00001234') or Case ID
@@ -72,62 +303,117 @@ def get_case_status(case_identifier: str):
     Returns information in tabular format:
     | Case Number | Case ID | Status |
     """
-    creds = connections.oauth2_auth_code(MY_APP_ID)
-    base_url = creds.url
+    identifier = case_identifier.strip()
 
-    headers = {
-        "Authorization": f"Bearer {creds.access_token}",
-        "Content-Type": "application/json"
-    }
+    # Answered locally while the optional mirror is fresh and has the Case
+    case = mirrored_case(identifier)
+    if case is not None:
+        return case_status(case)
 
-    # First, try searching by Case Number
-    soql_query = f"SELECT Id, CaseNumber, Status FROM Case WHERE CaseNumber = '{case_identifier}'"
-    
-    response = requests.get(
-        f"{base_url}/services/data/v61.0/query",
-        headers=headers,
-        params={"q": soql_query}
-    )
-    response.raise_for_status()
+    client = get_client(MY_APP_ID)
 
-    records = response.json().get("records", [])
+    def fetch():
+        # One query matches either the Case Number or the Case ID
+        case = find_case(client, "Id, CaseNumber, Status, LastModifiedDate", identifier)
 
-    # If found by Case Number, return immediately
-    if records:
-        case = records[0]
-        return {
-            "CaseNumber": case.get("CaseNumber"),
-            "Id": case["Id"],
-            "Status": case["Status"]
-        }
-
-    # Fall back to searching by Case ID
-    soql_query = f"SELECT Id, CaseNumber, Status FROM Case WHERE Id = '{case_identifier}'"
-    
-    response = requests.get(
-        f"{base_url}/services/data/v61.0/query",
-        headers=headers,
-        params={"q": soql_query}
+        if case is None:
+            return {
+                "CaseNumber": "N/A",
+                "Id": case_identifier,
+                "Status": "Not Found"
+            }, None
+
+        return case_status(case), case.get("LastModifiedDate")
+
+    # Served from the cache while the Case is unchanged
+    return lookup_cache.get(
+        user_scope(MY_APP_ID, client.credentials_provider),
+        f"case_status:{identifier}",
+        fetch,
+        revalidate=lambda status: case_last_modified(client, status["Id"])
     )
-    response.raise_for_status()
 
-    records = response.json().get("records", [])
 
-    if not records:
-        return {
-            "CaseNumber": "N/A",
-            "Id": case_identifier,
-            "Status": "Not Found"
-        }
+def query_cases_in_batches(client: ApiClient, fields: str, case_identifiers: List[str]) -> List[dict]:
+    """
+    Fetches the Cases for many identifiers. A single batch is one SOQL query; several
+    batches go out as Composite API requests of up to 25 queries each.
+    """
+    batches = [
+        case_identifiers[i:i + CASE_BATCH_SIZE]
+        for i in range(0, len(case_identifiers), CASE_BATCH_SIZE)
+    ]
+    queries = [
+        f"SELECT {fields} FROM Case WHERE {cases_lookup_condition(batch)}"
+        for batch in batches
+    ]
 
-    case = records[0]
-    return {
-        "CaseNumber": case.get("CaseNumber"),
-        "Id": case["Id"],
-        "Status": case["Status"]
-    }
+    if len(queries) == 1:
+        response = client.get(f"/services/data/{API_VERSION}/query", params={"q": queries[0]})
+        return response.json().get("records", [])
+
+    records = []
+    for start in range(0, len(queries), COMPOSITE_MAX_SUBREQUESTS):
+        subrequests = [
+            {
+                "method": "GET",
+                "url": f"/services/data/{API_VERSION}/query?q={quote(query)}",
+                "referenceId": f"batch{start + i}"
+            }
+            for i, query in enumerate(queries[start:start + COMPOSITE_MAX_SUBREQUESTS])
+        ]
+        response = client.post(
+            f"/services/data/{API_VERSION}/composite",
+            json={"allOrNone": False, "compositeRequest": subrequests}
+        )
+        for subresponse in response.json().get("compositeResponse", []):
+            if subresponse.get("httpStatusCode") != 200:
+                raise requests.HTTPError(
+                    f"Composite subrequest {subresponse.get('referenceId')} failed: {subresponse.get('body')}"
+                )
+            records.extend(subresponse.get("body", {}).get("records", []))
+    return records
 
 
+@traced
+@tool(
+    expected_credentials=[
+        {"app_id": MY_APP_ID, "type": ConnectionType.OAUTH2_AUTH_CODE}
+    ]
+)
+def get_case_statuses(case_identifiers: List[str]):
+    """
+    Fetch the status of several Salesforce Cases at once by Case Number or Case ID.
+    Use this instead of calling get_case_status once per case.
+
+    Args:
+        case_identifiers: The Case Numbers (e.g., '00001234') and/or Case IDs
+
+    Returns a dictionary keyed by each input identifier:
+    | Identifier | Case Number | Case ID | Status |
+    Cases that do not exist have Status 'Not Found'.
+    """
+    client = get_client(MY_APP_ID)
+
+    identifiers = list(dict.fromkeys(i.strip() for i in case_identifiers if i and i.strip()))
+    if not identifiers:
+        return {}
+
+    records = query_cases_in_batches(client, "Id, CaseNumber, Status", identifiers)
+    statuses = {}
+    for identifier, case in match_cases(identifiers, records).items():
+        if case is None:
+            statuses[identifier] = {"CaseNumber": "N/A", "Id": identifier, "Status": "Not Found"}
+        else:
+            statuses[identifier] = {
+                "CaseNumber": case.get("CaseNumber"),
+                "Id": case["Id"],
+                "Status": case["Status"]
+            }
+    return statuses
+
+
+@traced
 @tool(
     expected_credentials=[
         {"app_id": MY_APP_ID, "type": ConnectionType.OAUTH2_AUTH_CODE}
@@ -136,7 +422,7 @@ def get_case_status(case_identifier: str):
 def get_all_case_information(case_identifier: str):
     """
     Fetch all the case information of a specific Salesforce Case by Case Number or Case ID.
-    Automatically searches by Case Number first, then falls back to Case ID if not found.
+    Searches both fields at once; a Case Number match takes precedence.
     
     Args:
         case_identifier: The Case Number (e.g., '00001234') or Case ID
@@ -144,55 +430,39 @@ def get_all_case_information(case_identifier: str):
     Returns information in tabular format:
     | Case Number | Case ID | ... | Status |
     """
-    creds = connections.oauth2_auth_code(MY_APP_ID)
-    base_url = creds.url
-
-    headers = {
-        "Authorization": f"Bearer {creds.access_token}",
-        "Content-Type": "application/json"
-    }
-    fields = "Id, CaseNumber, Status, Description, LastModifiedDate"
+    identifier = case_identifier.strip()
 
-    # First, try searching by Case Number
-    soql_query = f"SELECT {fields} FROM Case WHERE CaseNumber = '{case_identifier}'"
-    
-    response = requests.get(
-        f"{base_url}/services/data/v61.0/query",
-        headers=headers,
-        params={"q": soql_query}
-    )
-    response.raise_for_status()
-
-    records = response.json().get("records", [])
-    
-    # If found by Case Number, return immediately
-    if records:
-        case = records[0]
+    # Answered locally while the optional mirror is fresh and has the Case
+    case = mirrored_case(identifier)
+    if case is not None:
         return case
 
-    # Fall back to searching by Case ID
-    soql_query = f"SELECT {fields} FROM Case WHERE Id = '{case_identifier}'"
-    
-    response = requests.get(
-        f"{base_url}/services/data/v61.0/query",
-        headers=headers,
-        params={"q": soql_query}
-    )
-    response.raise_for_status()
+    client = get_client(MY_APP_ID)
+    fields = "Id, CaseNumber, Status, Description, LastModifiedDate"
 
-    records = response.json().get("records", [])
+    def fetch():
+        # One query matches either the Case Number or the Case ID
+        case = find_case(client, fields, identifier)
 
-    if not records:
-        return {
-            "Status": "Not Found", 
-            "Message": f"Case matching '{case_identifier}' could not be found."
-        }
+        if case is None:
+            return {
+                "Status": "Not Found", 
+                "Message": f"Case matching '{case_identifier}' could not be found."
+            }, None
+
+        return case, case.get("LastModifiedDate")
 
-    case = records[0]
-    return case
+    # Served from the cache while the Case is unchanged
+    return lookup_cache.get(
+        user_scope(MY_APP_ID, client.credentials_provider),
+        f"case_information:{identifier}",
+        fetch,
+        revalidate=lambda case: case_last_modified(client, case["Id"])
+    )
     
 # orchestrate tools import \
 #   -k python \
 #   -f "tools/salesforce.py" \
 #   -r "tools/requirements.txt" \
+#   -p ./tools \
 #   -a "salesforce_oauth2_auth_code_ibm_184bdbd3=salesforce_oauth2_auth_code_ibm_184bdbd3"
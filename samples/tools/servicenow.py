@@ -1,7 +1,11 @@
-import requests
+import re
+from typing import Dict, Iterator, List, Optional
 from ibm_watsonx_orchestrate.agent_builder.tools import tool
 from ibm_watsonx_orchestrate.agent_builder.connections import ConnectionType
-from ibm_watsonx_orchestrate.run import connections
+from http_client import ApiClient, get_client
+from lookup_cache import lookup_cache, user_scope
+from record_mirror import mirrored_ticket
+from tracing import traced
 
 
 # -----------------------------------------------------------------------------------------
@@ -13,6 +17,81 @@ from ibm_watsonx_orchestrate.run import connections
 
 MY_APP_ID = 'servicenow_oauth2_auth_code_ibm_184bdbd3'
 
+# Only the columns map_ticket uses are requested (sys_updated_on feeds the lookup cache).
+# Records are requested with sysparm_display_value=all: the tools return the display
+# values, while the lookup cache and the mirror use the internal sys_updated_on, which
+# is in UTC (its display value is in the API user's timezone).
+TICKET_FIELDS = [
+    "number", "description", "short_description", "priority", "state",
+    "assignment_group", "assigned_to", "comments_and_work_notes", "sys_id",
+    "sys_created_on", "sys_updated_on", "opened_at", "closed_at", "due_date"
+]
+# Ticket numbers per numberIN query (keeps the query URL short), and records per page
+TICKET_BATCH_SIZE = 100
+TICKET_PAGE_SIZE = 100
+# Characters that would change the meaning of an encoded query are not allowed
+TICKET_NUMBER_PATTERN = re.compile(r"[A-Za-z0-9_.-]+")
+
+
+def flatten_ticket(record: dict) -> dict:
+    """Turns a sysparm_display_value=all record into the display values the tools return."""
+    return {
+        field: value.get("display_value", "") if isinstance(value, dict) else value
+        for field, value in record.items()
+    }
+
+
+def ticket_version(record: dict) -> Optional[str]:
+    """The internal (UTC) sys_updated_on of a sysparm_display_value=all record."""
+    updated = record.get("sys_updated_on")
+    return updated.get("value") if isinstance(updated, dict) else updated
+
+
+def ticket_last_updated(client: ApiClient, sys_id: str):
+    """Returns the internal sys_updated_on of a ticket, or None if it no longer exists."""
+    params = {
+        "sysparm_query": f"sys_id={sys_id}",
+        "sysparm_fields": "sys_updated_on",
+        "sysparm_display_value": False,
+        "sysparm_limit": 1
+    }
+    records = client.get("/api/now/table/ticket", params=params).json().get("result", [])
+    return records[0].get("sys_updated_on") if records else None
+
+
+def map_ticket(ticket: dict) -> dict:
+    """Maps a ServiceNow ticket record to the fields the tool returns."""
+    # Extract assignment group and assigned to (handle both dict and string)
+    assignment_group = (
+        ticket.get("assignment_group", {}).get("display_value", "")
+        if isinstance(ticket.get("assignment_group"), dict)
+        else ticket.get("assignment_group", "")
+    )
+    
+    assigned_to = (
+        ticket.get("assigned_to", {}).get("display_value", "")
+        if isinstance(ticket.get("assigned_to"), dict)
+        else ticket.get("assigned_to", "")
+    )
+
+    return {
+        "ticket_number": ticket.get("number", ""),
+        "description": ticket.get("description", ""),
+        "short_description": ticket.get("short_description", ""),
+        "priority": ticket.get("priority", ""),
+        "state": ticket.get("state", ""),
+        "assignment_group": assignment_group,
+        "assigned_to": assigned_to,
+        "comments_and_work_notes": ticket.get("comments_and_work_notes", ""),
+        "system_id": ticket.get("sys_id", ""),
+        "created_on": ticket.get("sys_created_on", ""),
+        "opened_at": ticket.get("opened_at", ""),
+        "closed_at": ticket.get("closed_at", ""),
+        "due_date": ticket.get("due_date", "")
+    }
+
+
+@traced
 @tool(
     name="get_ticket_test",
     description="Get service now tickets based off of ticket number.",
@@ -41,71 +120,130 @@ def get_ticket_test(ticket_number: str)-> dict:
     - Closed At
     - Due Date
     """
-    # Get ServiceNow OAuth2 connection credentials
-    creds = connections.oauth2_auth_code(MY_APP_ID)
-    base_url = creds.url
-
-    headers = {
-        "Authorization": f"Bearer {creds.access_token}",
-        "Content-Type": "application/json"
-    }
-
-    # Query parameters for ServiceNow API
-    params = {
-        "sysparm_query": f"number={ticket_number}",
-        "sysparm_display_value": True,
-        "sysparm_limit": 10,
-        "sysparm_offset": 0
-    }
-
-    response = requests.get(
-        f"{base_url}/api/now/table/ticket",
-        headers=headers,
-        params=params
-    )
-    response.raise_for_status()
-
-    records = response.json().get("result", [])
-
-    if not records:
+    # ServiceNow stores ticket numbers in upper case
+    number = ticket_number.strip().upper()
+    # Like get_tickets, a number that could change the encoded query is never sent
+    if not TICKET_NUMBER_PATTERN.fullmatch(number):
         return {
             "ticket_number": ticket_number,
             "status": "Not Found",
             "message": f"No ticket found with number: {ticket_number}"
         }
 
-    ticket = records[0]
-    
-    # Extract assignment group and assigned to (handle both dict and string)
-    assignment_group = (
-        ticket.get("assignment_group", {}).get("display_value", "")
-        if isinstance(ticket.get("assignment_group"), dict)
-        else ticket.get("assignment_group", "")
-    )
-    
-    assigned_to = (
-        ticket.get("assigned_to", {}).get("display_value", "")
-        if isinstance(ticket.get("assigned_to"), dict)
-        else ticket.get("assigned_to", "")
+    # Answered locally while the optional mirror is fresh and has the ticket
+    ticket = mirrored_ticket(number)
+    if ticket is not None:
+        return map_ticket(ticket)
+
+    # Shared client: pooled connections, retries; credentials are read per call
+    client = get_client(MY_APP_ID)
+
+    def fetch():
+        # Query parameters for ServiceNow API
+        params = {
+            "sysparm_query": f"number={number}",
+            "sysparm_fields": ",".join(TICKET_FIELDS),
+            "sysparm_display_value": "all",
+            "sysparm_exclude_reference_link": True,
+            "sysparm_limit": 1,
+            "sysparm_offset": 0
+        }
+
+        response = client.get("/api/now/table/ticket", params=params)
+        records = response.json().get("result", [])
+
+        if not records:
+            return {
+                "ticket_number": ticket_number,
+                "status": "Not Found",
+                "message": f"No ticket found with number: {ticket_number}"
+            }, None
+
+        ticket = records[0]
+        return map_ticket(flatten_ticket(ticket)), ticket_version(ticket)
+
+    # Served from the cache while the ticket is unchanged
+    return lookup_cache.get(
+        user_scope(MY_APP_ID, client.credentials_provider),
+        f"ticket:{number}",
+        fetch,
+        revalidate=lambda ticket: ticket_last_updated(client, ticket["system_id"])
     )
 
-    return {
-        "ticket_number": ticket.get("number", ""),
-        "description": ticket.get("description", ""),
-        "short_description": ticket.get("short_description", ""),
-        "priority": ticket.get("priority", ""),
-        "state": ticket.get("state", ""),
-        "assignment_group": assignment_group,
-        "assigned_to": assigned_to,
-        "comments_and_work_notes": ticket.get("comments_and_work_notes", ""),
-        "system_id": ticket.get("sys_id", ""),
-        "created_on": ticket.get("sys_created_on", ""),
-        "opened_at": ticket.get("opened_at", ""),
-        "closed_at": ticket.get("closed_at", ""),
-        "due_date": ticket.get("due_date", "")
-    }
+
+def iter_tickets(client: ApiClient, ticket_numbers: List[str]) -> Iterator[dict]:
+    """
+    Yields the tickets for many ticket numbers: one numberIN query per batch of
+    numbers, paged with sysparm_offset until the batch is exhausted.
+    """
+    for start in range(0, len(ticket_numbers), TICKET_BATCH_SIZE):
+        batch = ticket_numbers[start:start + TICKET_BATCH_SIZE]
+        offset = 0
+        while True:
+            params = {
+                # A stable order keeps the pages from overlapping
+                "sysparm_query": f"numberIN{','.join(batch)}^ORDERBYnumber",
+                "sysparm_fields": ",".join(TICKET_FIELDS),
+                "sysparm_display_value": "all",
+                "sysparm_exclude_reference_link": True,
+                "sysparm_limit": TICKET_PAGE_SIZE,
+                "sysparm_offset": offset
+            }
+            response = client.get("/api/now/table/ticket", params=params)
+            records = response.json().get("result", [])
+            yield from records
+            offset += len(records)
+            # Ticket numbers are unique, so a batch has at most one ticket per number
+            if len(records) < TICKET_PAGE_SIZE or offset >= len(batch):
+                break
+
+
+@traced
+@tool(
+    name="get_tickets",
+    description="Get several service now tickets at once based off of their ticket numbers.",
+    expected_credentials=[
+        {"app_id": MY_APP_ID, "type": ConnectionType.OAUTH2_AUTH_CODE}
+    ]
+)
+def get_tickets(ticket_numbers: List[str]) -> Dict[str, dict]:
+    """
+    Fetch several tickets from ServiceNow by ticket number in one request.
+    Use this instead of calling get_ticket_test once per ticket.
+
+    Args:
+        ticket_numbers: The ticket numbers to search for (e.g., ["INC0012345", "INC0012346"])
+
+    Returns a dictionary keyed by each ticket number with the same ticket information
+    as get_ticket_test. Tickets that do not exist have status 'Not Found'.
+    """
+    client = get_client(MY_APP_ID)
+    # The caller's spelling is only used as the key of the result; ServiceNow stores
+    # ticket numbers in upper case, and that is how they are queried and matched
+    requested = list(dict.fromkeys(n.strip() for n in ticket_numbers if n and n.strip()))
+    numbers = {n: n.upper() for n in requested}
+    valid = [n for n in dict.fromkeys(numbers.values()) if TICKET_NUMBER_PATTERN.fullmatch(n)]
+
+    scope = user_scope(MY_APP_ID, client.credentials_provider)
+    found = {}
+    for ticket in iter_tickets(client, valid) if valid else []:
+        found_ticket = map_ticket(flatten_ticket(ticket))
+        number = found_ticket["ticket_number"].upper()
+        found[number] = found_ticket
+        # Later get_ticket_test calls for these tickets are answered from the cache
+        lookup_cache.put(scope, f"ticket:{number}", found_ticket, ticket_version(ticket))
+
+    tickets = {}
+    for requested_number, number in numbers.items():
+        tickets[requested_number] = found.get(number) or {
+            "ticket_number": requested_number,
+            "status": "Not Found",
+            "message": f"No ticket found with number: {requested_number}"
+        }
+    return tickets
 
 # orchestrate tools import -k python \
-# -f ./tools/service_now_tool.py \
+# -f ./tools/servicenow.py \
 # -r tools/requirements.txt \
+# -p ./tools \
 # -a "servicenow_oauth2_auth_code_ibm_184bdbd3=servicenow_oauth2_auth_code_ibm_184bdbd3"
\ No newline at end of file
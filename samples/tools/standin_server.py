@@ -0,0 +1,326 @@
+import json
+import random
+import re
+import threading
+import time
+import types
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ---------------------- Local stand-in for Salesforce and ServiceNow ---------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+# Answers the Salesforce query/composite and ServiceNow table API requests the tools in
+# this folder make, from generated records, so they can be run and measured offline.
+
+SOQL_PATTERN = re.compile(
+    r"SELECT (?P<fields>.+?) FROM Case(?: WHERE (?P<where>.+?))?"
+    r"(?: ORDER BY (?P<order>\w+)(?: (?P<direction>ASC|DESC))?)?(?: LIMIT (?P<limit>\d+))?$"
+)
+SOQL_LITERAL_PATTERN = re.compile(r"'((?:[^'\\]|\\.)*)'")
+SOQL_DATETIME_PATTERN = re.compile(r"(LastModifiedDate|CreatedDate) (>=|<=) (\S+)")
+GLIDE_DATETIME_PATTERN = re.compile(r'(\w+)(>|=)javascript:new GlideDateTime\("([^"]+)"\)$')
+# Records per Salesforce query page before a nextRecordsUrl is returned
+SALESFORCE_PAGE_SIZE = 2000
+SERVICENOW_REFERENCE_FIELDS = ("assignment_group", "assigned_to")
+STATUSES = ["New", "Working", "Escalated", "Closed"]
+STATES = ["New", "In Progress", "On Hold", "Resolved"]
+
+
+def salesforce_timestamp(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000+0000")
+
+
+def servicenow_timestamp(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def parse_soql_datetime(literal: str) -> float:
+    return datetime.fromisoformat(literal.replace("Z", "+00:00")).timestamp()
+
+
+def parse_servicenow_datetime(literal: str) -> float:
+    return datetime.strptime(literal, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+
+
+class StandInRecords:
+    """Generated Salesforce Cases and ServiceNow tickets, with request counters."""
+
+    def __init__(self, count: int = 50, seed: int = 7):
+        rng = random.Random(seed)
+        now = time.time()
+        self.cases = []
+        self.tickets = []
+        for i in range(1, count + 1):
+            # Older records first, spread over the last few days (ServiceNow keeps whole seconds)
+            modified = int(now) - (count - i + 1) * 3600
+            self.cases.append({
+                "Id": f"500{i:012d}AAA",
+                "CaseNumber": f"{i:08d}",
+                "Status": rng.choice(STATUSES),
+                "Description": f"Store {rng.randint(100, 999)} reports a shelf outage",
+                "CreatedDate": modified - 3600,
+                "LastModifiedDate": modified,
+            })
+            self.tickets.append({
+                "number": f"INC{i:07d}",
+                "sys_id": f"{i:032x}",
+                "short_description": f"Register {rng.randint(1, 12)} is down",
+                "description": "The point of sale register does not start.",
+                "priority": str(rng.randint(1, 5)),
+                "state": rng.choice(STATES),
+                "assignment_group": ("Store IT", f"grp{i % 3:029x}"),
+                "assigned_to": (f"Technician {i % 7}", f"usr{i % 7:029x}"),
+                "comments_and_work_notes": "",
+                "sys_created_on": modified - 3600,
+                "sys_updated_on": modified,
+                "opened_at": modified - 3600,
+                "closed_at": "",
+                "due_date": "",
+            })
+        self.requests = {"salesforce": 0, "servicenow": 0}
+        # Called with the parameters of every ticket query before it is answered
+        self.before_ticket_query = None
+        self._lock = threading.Lock()
+
+    def touch_case(self, index: int, status: str = None):
+        """Edits a Case (1-based index) so that delta syncs and revalidations see it."""
+        with self._lock:
+            case = self.cases[index - 1]
+            case["LastModifiedDate"] = time.time()
+            if status:
+                case["Status"] = status
+
+    def touch_ticket(self, index: int, state: str = None, updated_at: float = None):
+        """Edits a ticket (1-based index), now or at `updated_at`."""
+        with self._lock:
+            ticket = self.tickets[index - 1]
+            ticket["sys_updated_on"] = int(time.time() if updated_at is None else updated_at)
+            if state:
+                ticket["state"] = state
+
+    def delete_case(self, index: int):
+        """Deletes a Case (1-based index of the generated Cases)."""
+        with self._lock:
+            case_id = f"500{index:012d}AAA"
+            self.cases = [c for c in self.cases if c["Id"] != case_id]
+
+    def delete_ticket(self, index: int):
+        """Deletes a ticket (1-based index of the generated tickets)."""
+        with self._lock:
+            sys_id = f"{index:032x}"
+            self.tickets = [t for t in self.tickets if t["sys_id"] != sys_id]
+
+    # ---------------------------------- Salesforce ----------------------------------
+
+    def soql(self, query: str):
+        """Runs the subset of SOQL the tools use and returns the matching Case records."""
+        match = SOQL_PATTERN.match(query.strip())
+        if match is None:
+            raise ValueError(f"Unsupported query: {query}")
+        fields = [f.strip() for f in match.group("fields").split(",")]
+        where = match.group("where") or ""
+
+        with self._lock:
+            records = list(self.cases)
+        literals = set(SOQL_LITERAL_PATTERN.findall(where))
+        if "CaseNumber" in where or re.search(r"\bId\b", where):
+            records = [
+                c for c in records
+                if c["CaseNumber"] in literals or c["Id"] in literals or c["Id"][:15] in literals
+            ]
+        if "Status = " in where:
+            status = re.search(r"Status = '([^']*)'", where).group(1)
+            records = [c for c in records if c["Status"] == status]
+        for field, operator, literal in SOQL_DATETIME_PATTERN.findall(where):
+            bound = parse_soql_datetime(literal)
+            if operator == ">=":
+                records = [c for c in records if c[field] >= bound]
+            else:
+                records = [c for c in records if c[field] <= bound]
+        if match.group("order"):
+            records.sort(key=lambda c: c[match.group("order")], reverse=match.group("direction") == "DESC")
+        if match.group("limit"):
+            records = records[:int(match.group("limit"))]
+
+        def project(case):
+            record = {"attributes": {"type": "Case"}}
+            for field in fields:
+                value = case.get(field)
+                if field in ("CreatedDate", "LastModifiedDate"):
+                    value = salesforce_timestamp(value)
+                record[field] = value
+            return record
+
+        return [project(c) for c in records]
+
+    def salesforce_page(self, query: str, offset: int = 0) -> dict:
+        records = self.soql(query)
+        page = records[offset:offset + SALESFORCE_PAGE_SIZE]
+        body = {"totalSize": len(records), "done": offset + len(page) >= len(records), "records": page}
+        if not body["done"]:
+            next_page = urlencode({"q": query, "offset": offset + len(page)})
+            body["nextRecordsUrl"] = f"/services/data/standin/query/next?{next_page}"
+        return body
+
+    # ---------------------------------- ServiceNow ----------------------------------
+
+    def servicenow_query(self, params: dict) -> list:
+        """Runs the subset of encoded queries the tools use: ^NQ groups of ^-joined terms."""
+        if self.before_ticket_query is not None:
+            self.before_ticket_query(params)
+        with self._lock:
+            records = list(self.tickets)
+        orders = []
+        groups = []
+        for group in params.get("sysparm_query", "").split("^NQ"):
+            terms = []
+            for term in group.split("^"):
+                if term.startswith("ORDERBY"):
+                    orders.append(term[len("ORDERBY"):])
+                elif term:
+                    terms.append(term)
+            groups.append(terms)
+        records = [t for t in records if any(all(self._ticket_matches(t, term) for term in terms) for terms in groups)]
+        if orders:
+            records.sort(key=lambda t: tuple(t[order] for order in orders))
+
+        offset = int(params.get("sysparm_offset", 0))
+        limit = int(params.get("sysparm_limit", 10000))
+        records = records[offset:offset + limit]
+
+        fields = params.get("sysparm_fields")
+        fields = fields.split(",") if fields else list(self.tickets[0].keys()) if self.tickets else []
+        display = params.get("sysparm_display_value", "false").lower()
+        exclude_links = params.get("sysparm_exclude_reference_link", "false").lower() == "true"
+        return [self._render_ticket(t, fields, display, exclude_links) for t in records]
+
+    @staticmethod
+    def _ticket_matches(ticket: dict, term: str) -> bool:
+        if term.startswith("numberIN"):
+            return ticket["number"] in term[len("numberIN"):].split(",")
+        if term.startswith("sys_updated_on>=javascript:gs.minutesAgoStart("):
+            minutes = int(term[len("sys_updated_on>=javascript:gs.minutesAgoStart("):-1])
+            return ticket["sys_updated_on"] >= (time.time() // 60 - minutes) * 60
+        glide = GLIDE_DATETIME_PATTERN.match(term)
+        if glide:
+            field, operator, literal = glide.groups()
+            bound = parse_servicenow_datetime(literal)
+            return ticket[field] > bound if operator == ">" else ticket[field] == bound
+        if term.startswith("sys_id>"):
+            return ticket["sys_id"] > term[len("sys_id>"):]
+        if "=" in term:
+            field, value = term.split("=", 1)
+            return str(ticket.get(field)) == value
+        raise ValueError(f"Unsupported query term: {term}")
+
+    @staticmethod
+    def _render_ticket(ticket: dict, fields: list, display: str, exclude_links: bool) -> dict:
+        record = {}
+        for field in fields:
+            value = ticket.get(field, "")
+            if field in ("sys_created_on", "sys_updated_on", "opened_at") and value != "":
+                value = servicenow_timestamp(value)
+            if field in SERVICENOW_REFERENCE_FIELDS:
+                name, sys_id = value
+                link = f"https://standin.service-now.com/api/now/table/sys_user/{sys_id}"
+                if display == "all":
+                    value = {"display_value": name, "value": sys_id}
+                elif display == "true":
+                    value = name if exclude_links else {"display_value": name, "link": link}
+                else:
+                    value = sys_id if exclude_links else {"value": sys_id, "link": link}
+            elif display == "all":
+                value = {"display_value": value, "value": value}
+            record[field] = value
+        return record
+
+
+def start_standin_server(records: StandInRecords, latency: float = 0.0, error_rate: float = 0.0,
+                         seed: int = 7):
+    """
+    Serves records on a local port and returns (server, url). Each request waits
+    `latency` seconds; a share of `error_rate` requests answer 503 with Retry-After.
+    """
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body=None, headers=None):
+            data = json.dumps(body).encode("utf-8") if body is not None else b""
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _injected_failure(self) -> bool:
+            if latency:
+                time.sleep(latency)
+            with rng_lock:
+                failed = rng.random() < error_rate
+            if failed:
+                self._send(503, {"error": "stand-in outage"}, {"Retry-After": "0"})
+            return failed
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            params = {k: v[0] for k, v in parse_qs(url.query).items()}
+            system = "servicenow" if url.path.startswith("/api/now/") else "salesforce"
+            with records._lock:
+                records.requests[system] += 1
+            if self._injected_failure():
+                return
+            try:
+                if system == "servicenow":
+                    body = {"result": records.servicenow_query(params)}
+                else:
+                    body = records.salesforce_page(params["q"], int(params.get("offset", 0)))
+            except (KeyError, ValueError) as e:
+                self._send(400, [{"message": str(e), "errorCode": "MALFORMED_QUERY"}])
+                return
+            self._send(200, body)
+
+        def do_POST(self):
+            with records._lock:
+                records.requests["salesforce"] += 1
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self._injected_failure():
+                return
+            responses = []
+            for subrequest in payload.get("compositeRequest", []):
+                query = parse_qs(urlsplit(subrequest["url"]).query)["q"][0]
+                responses.append({
+                    "body": records.salesforce_page(query),
+                    "httpStatusCode": 200,
+                    "referenceId": subrequest["referenceId"]
+                })
+            self._send(200, {"compositeResponse": responses})
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def install_standin_clients(url: str):
+    """Points the Salesforce and ServiceNow tools at a stand-in server."""
+    import http_client
+    import salesforce
+    import servicenow
+
+    creds = types.SimpleNamespace(url=url, access_token="standin")
+    for app_id in (salesforce.MY_APP_ID, servicenow.MY_APP_ID):
+        http_client.set_client(app_id, http_client.ApiClient(app_id, credentials_provider=lambda _: creds))
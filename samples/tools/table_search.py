@@ -6,6 +6,7 @@ from enum import Enum
 
 
 from ibm_watsonx_orchestrate.agent_builder.tools import tool, ToolPermission
+from tracing import current_span, traced
 
 
 # -----------------------------------------------------------------------------------------
@@ -24,6 +25,7 @@ class ProductSearchField(str, Enum):
     SUPPLIER = "supplier"
     REGION = "region"
 
+@traced
 @tool(
     name="search_product",
     description="""
@@ -136,6 +138,8 @@ def search_product(by: str, key: str) -> dict:
                 if match_found:
                     matching_products.append(row)
         
+        current_span().set_attributes({"rows_scanned": csv_reader.line_num - 1, "matches": len(matching_products)})
+
         if not matching_products:
             return {
                 "status": 404,
@@ -176,6 +180,7 @@ class BillSearchField(str, Enum):
     BILL_MONTH = "bill_month"
     PAYMENT_METHOD = "payment_method"
 
+@traced
 @tool(
     name="search_bill",
     description="""
@@ -289,6 +294,8 @@ def search_bill(by: str, key: str) -> dict:
                 if match_found:
                     matching_bills.append(row)
         
+        current_span().set_attributes({"rows_scanned": csv_reader.line_num - 1, "matches": len(matching_bills)})
+
         if not matching_bills:
             return {
                 "status": 404,
@@ -329,6 +336,7 @@ class EmployeeSearchField(str, Enum):
     DEPARTMENT = "department"
     REGION = "region"
 
+@traced
 @tool(
     name="search_employee",
     description="""
@@ -447,6 +455,8 @@ def search_employee(by: str, key: str) -> dict:
                 if match_found:
                     matching_employees.append(row)
         
+        current_span().set_attributes({"rows_scanned": csv_reader.line_num - 1, "matches": len(matching_employees)})
+
         if not matching_employees:
             return {
                 "status": 404,
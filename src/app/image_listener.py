@@ -1,18 +1,29 @@
 import requests
 import json
+import hashlib
 import os
 import re
 import time
 import argparse
 import pathlib
+import sys
 from dotenv import load_dotenv
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from results_store import ResultsStore
 
 agent_id=''
 url = ''
 bearer_token=''
 base_folder = ''
+# Indexed store of every processed image (None to only write the .txt files)
+results_store = None
+store_id = ''
+# The vision tool's extract_products_from_image, which names the products of each image
+# for the results store (None to record results without product names)
+extract_products = None
+# Where this program reads the new images from for the extraction
+products_image_url = ''
 
 def save_text_to_responses_file(text, image_filename=None):
 
@@ -31,6 +42,54 @@ def save_text_to_responses_file(text, image_filename=None):
 
     print(f"Saved to {full_path}")
 
+def image_sha256(file_path):
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_product_extraction():
+    # The tool runs in this process, with the watsonx.ai credentials from the .env file
+    os.environ.setdefault("TOOL_WARM_UP", "false")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tools"))
+    import generate_description_from_image as vision_tool
+
+    load_dotenv()
+    vision_tool.model_id = os.getenv("WATSONX_MODEL_ID")
+    vision_tool.api_key = os.getenv("WATSONX_APIKEY")
+    vision_tool.space_id = os.getenv("WATSONX_SPACE_ID")
+    vision_tool.is_called_from_orchestrate = False
+    return vision_tool.extract_products_from_image
+
+def image_products(filename):
+    if extract_products is None:
+        return []
+    try:
+        extraction = extract_products(f"{products_image_url}/{filename}").content
+    except Exception as e:
+        print(f"Could not extract the products of {filename}: {e}")
+        return []
+    if "error" in extraction:
+        print(f"Could not extract the products of {filename}: {extraction['error']}")
+        return []
+    return list(dict.fromkeys(product["product_name"] for product in extraction["products"]))
+
+def record_result(file_path, latency_ms, status=None, text=None, error=None):
+    if results_store is None:
+        return
+    try:
+        results_store.add(
+            image_sha256=image_sha256(file_path),
+            image_path=file_path,
+            response=text,
+            store=store_id,
+            latency_ms=latency_ms,
+            status=status,
+            error=error,
+            products=image_products(os.path.basename(file_path)) if error is None else [],
+            created_at=time.time()
+        )
+    except Exception as e:
+        print(f"Could not record the result in the results store: {e}")
+
 class NewFileHandler(FileSystemEventHandler):
     def on_created(self, event):
         if not event.is_directory:
@@ -44,6 +103,7 @@ class NewFileHandler(FileSystemEventHandler):
 
             print(f"New file detected: {file_path}")
 
+            started_at = time.time()
             try:
                 file_url = f"http://host.docker.internal:8002/{filename}"
                 payload = {
@@ -62,6 +122,7 @@ class NewFileHandler(FileSystemEventHandler):
                     data=json.dumps(payload)
                 )
                 status = response.status_code
+                latency_ms = (time.time() - started_at) * 1000
                 result = response.json()
                 text = result["choices"][0]["message"]["content"]
                 print(f"POST response: {status} - {text}")
@@ -72,9 +133,11 @@ New File Processed: {os.path.basename(file_path)}
 Response: {text}
 """
                 save_text_to_responses_file(answer, image_filename=filename)
+                record_result(file_path, latency_ms, status=status, text=text)
 
             except Exception as e:
                 print(f"Error during POST request: {e}")
+                record_result(file_path, (time.time() - started_at) * 1000, error=str(e))
 
 
 if __name__ == "__main__":
@@ -83,6 +146,13 @@ if __name__ == "__main__":
     parser.add_argument("--agent_id", required=True, help="The ID of the target agent.")
     parser.add_argument("--target_folder", required=True, help="The base folder for images and responses.")
     parser.add_argument("--token", required=True, help="The bearer token of the local instance.")
+    parser.add_argument("--results_db", help="Results store (default: <target_folder>/output/results.sqlite3).")
+    parser.add_argument("--no_results_db", action="store_true", help="Only write the .txt response files.")
+    parser.add_argument("--store", help="Store the images come from (default: the name of the target folder).")
+    parser.add_argument("--no_products", action="store_true",
+                        help="Record results without product names (saves a watsonx.ai call per image).")
+    parser.add_argument("--image_base_url", default="http://localhost:8002",
+                        help="URL of the target folder for this program, used to extract the product names.")
     args = parser.parse_args()
 
     agent_id = args.agent_id
@@ -90,6 +160,16 @@ if __name__ == "__main__":
     watched_folder = args.target_folder
     bearer_token = args.token
 
+    if not args.no_results_db:
+        results_db = args.results_db or os.path.join(watched_folder, "output", "results.sqlite3")
+        os.makedirs(os.path.dirname(os.path.abspath(results_db)), exist_ok=True)
+        results_store = ResultsStore(results_db)
+        store_id = args.store or os.path.basename(os.path.abspath(watched_folder))
+        print(f"Recording results in: {results_db}")
+        if not args.no_products:
+            extract_products = load_product_extraction()
+            products_image_url = args.image_base_url.rstrip("/")
+
     event_handler = NewFileHandler()
     observer = Observer()
     observer.schedule(event_handler, path=watched_folder, recursive=False)
@@ -0,0 +1,311 @@
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------------ Indexed store of listener results ------------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+# Every image the listener processes becomes one row of a SQLite database: the image's
+# hash, store and path, when it was processed, how long the agent took, its response and
+# the product names from the vision tool's structured extraction. The response and product names are full-text indexed
+# (FTS5), so questions like "all shelves mentioning product X this week" are answered
+# from the index instead of by reading the output folder:
+#
+#   python results_store.py --db output/results.sqlite3 --product "pike place" --since 7d
+#
+# Time ranges filter on the indexed created_at column, so results added out of order (a
+# backfill, an adjusted clock) are found by when they were processed. Results are listed
+# most recently added first, the order the full-text index returns them in.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    image_sha256 TEXT NOT NULL,
+    store TEXT,
+    image_path TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    latency_ms REAL,
+    status INTEGER,
+    error TEXT,
+    response TEXT,
+    products TEXT
+);
+CREATE INDEX IF NOT EXISTS results_created_at ON results (created_at);
+CREATE INDEX IF NOT EXISTS results_image ON results (image_sha256);
+CREATE INDEX IF NOT EXISTS results_store ON results (store, created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS results_fts USING fts5(
+    response, products, content='results', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS results_fts_insert AFTER INSERT ON results BEGIN
+    INSERT INTO results_fts (rowid, response, products) VALUES (new.id, new.response, new.products);
+END;
+CREATE TRIGGER IF NOT EXISTS results_fts_delete AFTER DELETE ON results BEGIN
+    INSERT INTO results_fts (results_fts, rowid, response, products)
+    VALUES ('delete', old.id, old.response, old.products);
+END;
+"""
+
+# "7d", "12h", "30m"
+AGE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([dhm])$")
+AGE_UNITS = {"d": 86400, "h": 3600, "m": 60}
+RESULT_COLUMNS = ["id", "image_sha256", "store", "image_path", "created_at", "latency_ms", "status",
+                  "error", "response", "products"]
+
+logger = logging.getLogger(__name__)
+
+
+def parse_moment(value: str) -> float:
+    """Epoch seconds from an age ("7d", "12h", "30m" ago) or an ISO date/time."""
+    match = AGE_PATTERN.match(value.strip())
+    if match:
+        return time.time() - float(match.group(1)) * AGE_UNITS[match.group(2)]
+    return datetime.fromisoformat(value.strip()).timestamp()
+
+
+def fts_phrase(text: str) -> str:
+    """Quotes text as one FTS5 phrase, so that user input is never parsed as query syntax."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+class ResultsStore:
+    """Append-only SQLite store of listener results with a full-text index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        # WAL lets queries run while the listener (possibly another process) writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def add(self, image_sha256: str, image_path: str, response: Optional[str], store: str = None,
+            latency_ms: float = None, status: int = None, error: str = None,
+            products: Optional[List[str]] = None, created_at: float = None) -> int:
+        """Appends one result and returns its id."""
+        row = (image_sha256, store, image_path, created_at or time.time(), latency_ms, status, error,
+               response, json.dumps(products or []))
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO results (image_sha256, store, image_path, created_at, latency_ms, status, "
+                "error, response, products) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row
+            )
+            self._db.commit()
+            return cursor.lastrowid
+
+    def add_many(self, rows: Iterable[dict]):
+        """Appends many results (dicts with the arguments of add) in one transaction."""
+        values = []
+        for row in rows:
+            values.append((row["image_sha256"], row.get("store"), row["image_path"],
+                           row.get("created_at") or time.time(), row.get("latency_ms"), row.get("status"),
+                           row.get("error"), row.get("response"), json.dumps(row.get("products") or [])))
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO results (image_sha256, store, image_path, created_at, latency_ms, status, "
+                "error, response, products) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                values
+            )
+            self._db.commit()
+
+    def search(self, product: str = None, text: str = None, store: str = None, since: float = None,
+               until: float = None, limit: int = 50) -> List[dict]:
+        """
+        Results, most recently added first, whose product names contain the phrase
+        `product` and whose response or product names contain the phrase `text`,
+        optionally only for one store and processing time range (epoch seconds).
+        """
+        terms = []
+        if product:
+            terms.append(f"products : {fts_phrase(product)}")
+        if text:
+            terms.append(fts_phrase(text))
+
+        if terms:
+            query = "SELECT r.* FROM results_fts f JOIN results r ON r.id = f.rowid WHERE results_fts MATCH ?"
+            params = [" AND ".join(terms)]
+        else:
+            query = "SELECT r.* FROM results r WHERE 1"
+            params = []
+        if since is not None:
+            query += " AND r.created_at >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND r.created_at < ?"
+            params.append(until)
+        if store:
+            query += " AND r.store = ?"
+            params.append(store)
+        # The full-text index returns rows most recently added first by itself, so the
+        # query stops after `limit` matches instead of sorting all of them
+        query += " ORDER BY f.rowid DESC LIMIT ?" if terms else " ORDER BY r.id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def by_image(self, image_sha256: str) -> List[dict]:
+        """Every result for one image, e.g. to find out whether it was already processed."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM results WHERE image_sha256 = ? ORDER BY id DESC", (image_sha256,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        result = {column: row[column] for column in RESULT_COLUMNS}
+        result["products"] = json.loads(result["products"] or "[]")
+        return result
+
+    def compact(self, retention_days: float = None, vacuum: bool = False) -> dict:
+        """
+        Deletes results older than retention_days (if given), merges the full-text index
+        segments into one, and checkpoints the WAL. vacuum also returns free pages to the
+        file system, which rewrites the whole database.
+        """
+        deleted = 0
+        with self._lock:
+            if retention_days is not None:
+                cutoff = time.time() - retention_days * 86400
+                deleted = self._db.execute("DELETE FROM results WHERE created_at < ?", (cutoff,)).rowcount
+            self._db.execute("INSERT INTO results_fts (results_fts) VALUES ('optimize')")
+            self._db.commit()
+            if vacuum:
+                self._db.execute("VACUUM")
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"deleted": deleted, **self.stats()}
+
+    def stats(self) -> dict:
+        row = self._db.execute("SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM results").fetchone()
+        return {
+            "results": row[0],
+            "oldest": datetime.fromtimestamp(row[1]).isoformat(timespec="seconds") if row[1] else None,
+            "newest": datetime.fromtimestamp(row[2]).isoformat(timespec="seconds") if row[2] else None,
+            "size_mb": round(os.path.getsize(self.path) / 1e6, 2) if os.path.exists(self.path) else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# ----------------------------------------- Benchmark ---------------------------------------
+
+
+BENCHMARK_PRODUCTS = [
+    "Starbucks Pike Place Roast", "Lavazza Espresso Italiano", "Folgers Classic Roast", "Dunkin Original Blend",
+    "Nike Air Max 90", "Adidas Ultraboost", "New Balance 574", "Barefoot Merlot", "Yellow Tail Shiraz",
+    "Kendall-Jackson Chardonnay", "Cheerios", "Kellogg's Frosted Flakes", "Tide Pods", "Bounty Paper Towels",
+]
+BENCHMARK_ISSUES = ["is running low", "is out of stock", "is misplaced", "has a missing price tag", "looks fine"]
+
+
+def run_benchmark(results: int, days: int, repeat: int):
+    """Fills a temporary store with `results` synthetic results over `days` days and times queries."""
+    path = os.path.join(tempfile.mkdtemp(prefix="results-store-"), "results.sqlite3")
+    store = ResultsStore(path)
+    rng = random.Random(7)
+    start_at = time.time() - days * 86400
+
+    start = time.perf_counter()
+    batch = []
+    for i in range(results):
+        products = rng.sample(BENCHMARK_PRODUCTS, 3)
+        response = " ".join(f"{p} {rng.choice(BENCHMARK_ISSUES)}." for p in products)
+        batch.append({
+            "image_sha256": f"{rng.getrandbits(256):064x}",
+            "store": f"store-{rng.randint(1, 50):03d}",
+            "image_path": f"/shelves/image-{i:07d}.jpg",
+            "created_at": start_at + i * days * 86400 / results,
+            "latency_ms": rng.uniform(2000, 9000),
+            "status": 200,
+            "response": response,
+            "products": products,
+        })
+        if len(batch) == 10000:
+            store.add_many(batch)
+            batch = []
+    store.add_many(batch)
+    print(f"Inserted {results} results in {time.perf_counter() - start:.1f}s ({store.stats()['size_mb']} MB)")
+
+    # A backfilled result: appended last, but processed 20 days ago
+    week = time.time() - 7 * 86400
+    store.add("0" * 64, "/shelves/backfill.jpg", "Backfill Blend is running low.", store="store-001",
+              products=["Backfill Blend"], created_at=time.time() - 20 * 86400)
+    assert not store.search(product="backfill blend", since=week)
+    assert len(store.search(product="backfill blend", since=week - 14 * 86400, until=week)) == 1
+
+    queries = {
+        "product X this week": dict(product="pike place", since=week),
+        "product X, one store, this week": dict(product="ultraboost", store="store-007", since=week),
+        "text anywhere, all time": dict(text="out of stock", limit=50),
+        "product X, all time": dict(product="merlot", limit=1000),
+        "one store, last day": dict(store="store-001", since=time.time() - 86400),
+    }
+    for name, kwargs in queries.items():
+        timings = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            found = store.search(**kwargs)
+            timings.append((time.perf_counter() - t) * 1000)
+        timings.sort()
+        print(f"{name:<34} {len(found):>5} results  p50 {timings[len(timings) // 2]:7.2f} ms  max {timings[-1]:7.2f} ms")
+
+    t = time.perf_counter()
+    print(f"compact: {store.compact()} in {time.perf_counter() - t:.1f}s")
+    store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the image listener's results store.")
+    parser.add_argument("--db", help="Results database (the listener writes output/results.sqlite3)")
+    parser.add_argument("--product", help="Product name phrase, e.g. \"pike place\"")
+    parser.add_argument("--text", help="Phrase anywhere in the response")
+    parser.add_argument("--store", help="Only results of this store")
+    parser.add_argument("--since", help="Age (7d, 12h, 30m) or ISO date")
+    parser.add_argument("--until", help="Age (7d, 12h, 30m) or ISO date")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--compact", action="store_true", help="Merge index segments and checkpoint the WAL")
+    parser.add_argument("--retention_days", type=float, help="With --compact, delete older results")
+    parser.add_argument("--vacuum", action="store_true", help="With --compact, also shrink the file")
+    parser.add_argument("--benchmark", type=int, metavar="RESULTS", help="Time queries on a synthetic store")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark, days=30, repeat=20)
+    elif not args.db:
+        parser.error("--db is required")
+    elif args.compact:
+        print(json.dumps(ResultsStore(args.db).compact(args.retention_days, args.vacuum), indent=2))
+    else:
+        results_store = ResultsStore(args.db)
+        found = results_store.search(
+            product=args.product,
+            text=args.text,
+            store=args.store,
+            since=parse_moment(args.since) if args.since else None,
+            until=parse_moment(args.until) if args.until else None,
+            limit=args.limit,
+        )
+        for result in found:
+            when = datetime.fromtimestamp(result["created_at"]).isoformat(sep=" ", timespec="seconds")
+            print(f"{when}  {result['store'] or '-':<12} {result['image_path']}")
+            print(f"    products: {', '.join(result['products']) or '-'}")
+        print(f"{len(found)} result(s)")
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------------ Import time of the tool modules --------------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+# Imports every tool module in a fresh interpreter with `python -X importtime` and
+# reports what its cold start costs on top of the ADK itself, broken down by package.
+#
+#   python src/benchmark/import_profile.py            # report
+#   python src/benchmark/import_profile.py --check    # exit 1 on a regression, for CI
+#
+# --check fails if a tool module imports one of the DEFERRED_PACKAGES when it is loaded
+# (they must only be imported on first use), or if its import takes more than
+# --budget_ms longer than importing the ADK alone.
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# (folder, module) of every tool and plugin module
+TOOL_MODULES = [
+    ("src/tools", "generate_description_from_image"),
+    ("src/tools", "web_search"),
+    ("src/tools", "recall_lookup"),
+    ("src/tools", "product_resolver"),
+    ("src/tools", "link_safety_plugin"),
+    ("src/tools", "add_disclaimer_plugin"),
+    ("samples/tools", "salesforce"),
+    ("samples/tools", "servicenow"),
+    ("samples/tools", "table_search"),
+    ("src/ibm_knowledge/tools", "knowledge_search"),
+]
+# What every tool module imports anyway; the budget applies to the time on top of it
+BASELINE_MODULE = "ibm_watsonx_orchestrate.agent_builder.tools"
+# Imported on first use only
+DEFERRED_PACKAGES = ["langchain_ibm", "ibm_watsonx_ai", "langchain_core", "langchain_community", "langchain_tavily"]
+DEFAULT_BUDGET_MS = 250
+IMPORTTIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def profile_import(module: str, folder: str = ".") -> Dict[str, object]:
+    """
+    Imports module in a fresh interpreter and returns its total import time and the
+    self time of every package it loaded (both in milliseconds).
+    """
+    env = dict(os.environ, TOOL_WARM_UP="false", OTEL_SDK_DISABLED="true", PYTHONDONTWRITEBYTECODE="1")
+    completed = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.join(ROOT_DIR, folder), env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    packages = defaultdict(float)
+    total_ms = 0.0
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, _, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us) / 1000
+        if name == module:
+            total_ms = int(cumulative_us) / 1000
+    return {"total_ms": total_ms, "packages": dict(packages)}
+
+
+def best_of(module: str, folder: str, repeat: int) -> Dict[str, object]:
+    """The fastest of `repeat` imports, which is the least disturbed by other processes."""
+    return min((profile_import(module, folder) for _ in range(repeat)), key=lambda p: p["total_ms"])
+
+
+def build_report(modules: List[tuple], repeat: int, top: int) -> dict:
+    baseline = best_of(BASELINE_MODULE, ".", repeat)
+    report = {"baseline_ms": round(baseline["total_ms"], 1), "modules": []}
+    for folder, module in modules:
+        profile = best_of(module, folder, repeat)
+        # Packages the module loads beyond what the ADK already loads, slowest first
+        extra = {
+            name: ms for name, ms in profile["packages"].items()
+            if name not in baseline["packages"]
+        }
+        report["modules"].append({
+            "module": module,
+            "total_ms": round(profile["total_ms"], 1),
+            "over_baseline_ms": round(profile["total_ms"] - baseline["total_ms"], 1),
+            "deferred_imported": [name for name in DEFERRED_PACKAGES if name in profile["packages"]],
+            "top_packages": [
+                {"package": name, "self_ms": round(ms, 1)}
+                for name, ms in sorted(extra.items(), key=lambda item: item[1], reverse=True)[:top]
+            ],
+        })
+    return report
+
+
+def print_report(report: dict):
+    print(f"{BASELINE_MODULE}: {report['baseline_ms']:.1f} ms")
+    print()
+    print(f"{'module':<36}{'total ms':>10}{'+ADK ms':>10}  slowest packages of its own")
+    for row in report["modules"]:
+        packages = ", ".join(f"{p['package']} {p['self_ms']:.0f}" for p in row["top_packages"])
+        print(f"{row['module']:<36}{row['total_ms']:>10.1f}{row['over_baseline_ms']:>10.1f}  {packages}")
+
+
+def check_report(report: dict, budget_ms: float) -> List[str]:
+    problems = []
+    for row in report["modules"]:
+        if row["deferred_imported"]:
+            problems.append(f"{row['module']} imports {', '.join(row['deferred_imported'])} when it is loaded")
+        if row["over_baseline_ms"] > budget_ms:
+            problems.append(
+                f"{row['module']} takes {row['over_baseline_ms']:.0f} ms to import on top of the ADK "
+                f"(budget {budget_ms:.0f} ms)"
+            )
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time profile of the tool modules.")
+    parser.add_argument("--module", action="append", help="Only profile this module (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="Imports per module; the fastest counts")
+    parser.add_argument("--top", type=int, default=5, help="Packages listed per module")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on an import-time regression")
+    parser.add_argument("--budget_ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="Allowed import time on top of the ADK, per module")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    modules = [(folder, module) for folder, module in TOOL_MODULES if not args.module or module in args.module]
+    report = build_report(modules, args.repeat, args.top)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.check:
+        problems = check_report(report, args.budget_ms)
+        print()
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        print("Import times OK" if not problems else f"{len(problems)} import-time regression(s)")
+        sys.exit(1 if problems else 0)
@@ -0,0 +1,589 @@
+import argparse
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import math
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------- Offline benchmark of the retail pipeline ----------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+# Runs the real tool functions and the image listener against local stand-ins for the
+# orchestrate chat completions endpoint, watsonx.ai vision, Tavily, Salesforce and
+# ServiceNow, and reports throughput and p50/p95/p99 latency per stage.
+#
+#   python src/benchmark/pipeline_benchmark.py --calls 50 --concurrency 4 \
+#       --latency watsonx=800 --errors tavily=0.05
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+IMAGES_DIR = os.path.join(ROOT_DIR, "src", "app", "images")
+for folder in ("src/tools", "src/app", "samples/tools"):
+    sys.path.insert(0, os.path.join(ROOT_DIR, folder))
+
+# Keep the benchmark's caches in memory and off the optional record mirror, and the
+# tools from warming up against the real services
+os.environ.setdefault("WEB_SEARCH_CACHE_PATH", "")
+os.environ.setdefault("RECORD_MIRROR_PATH", "")
+os.environ.setdefault("TOOL_WARM_UP", "false")
+
+# Default stand-in latency in milliseconds, roughly the order of the real services
+DEFAULT_LATENCY_MS = {
+    "orchestrate": 50,
+    "watsonx": 400,
+    "tavily": 150,
+    "salesforce": 80,
+    "servicenow": 80,
+    "images": 5,
+}
+SERVICES = list(DEFAULT_LATENCY_MS)
+STAGES = [
+    "generate_description_from_image",
+    "extract_products_from_image",
+    "web_search",
+    "web_search_multi",
+    "search_product",
+    "resolve_products",
+    "get_case_status",
+    "get_ticket_test",
+    "listener",
+]
+PERCENTILES = (50, 95, 99)
+LISTENER_TIMEOUT_SECONDS = 60
+
+# What the stand-in vision model "sees" on each sample image
+SAMPLE_PRODUCTS = {
+    "coffee-shelf": ["Starbucks Pike Place Roast", "Lavazza Espresso Italiano", "Folgers Classic Roast",
+                     "Dunkin Original Blend"],
+    "shoes": ["Nike Air Max 90", "Adidas Ultraboost", "New Balance 574"],
+    "wine-bottles": ["Barefoot Merlot", "Yellow Tail Shiraz", "Kendall-Jackson Chardonnay"],
+}
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------- Measurement -------------------------------------
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class StageRecorder:
+    """Collects the latency and outcome of every call per stage."""
+
+    def __init__(self):
+        self._samples: Dict[str, List[tuple]] = {}
+        self._walls: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, ok: bool):
+        with self._lock:
+            self._samples.setdefault(stage, []).append((seconds, ok))
+
+    def timed(self, stage: str, fn: Callable, *args, **kwargs):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            self.record(stage, time.perf_counter() - start, ok)
+
+    def set_wall_time(self, stage: str, seconds: float):
+        self._walls[stage] = seconds
+
+    def report(self) -> List[dict]:
+        rows = []
+        for stage, samples in self._samples.items():
+            latencies = sorted(seconds for seconds, _ in samples)
+            wall = self._walls.get(stage)
+            row = {
+                "stage": stage,
+                "calls": len(samples),
+                "errors": sum(1 for _, ok in samples if not ok),
+                "throughput": round(len(samples) / wall, 2) if wall else None,
+            }
+            for p in PERCENTILES:
+                row[f"p{p}_ms"] = round(percentile(latencies, p) * 1000, 1)
+            rows.append(row)
+        return rows
+
+
+def print_report(rows: List[dict]):
+    header = f"{'stage':<34}{'calls':>7}{'errors':>8}{'calls/s':>9}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        throughput = f"{row['throughput']:.2f}" if row["throughput"] is not None else "-"
+        print(f"{row['stage']:<34}{row['calls']:>7}{row['errors']:>8}{throughput:>9}"
+              + "".join(f"{row[f'p{p}_ms']:>10.1f}" for p in PERCENTILES))
+
+
+# -------------------------------------- Stand-ins --------------------------------------
+
+
+class ServiceProfile:
+    """Latency (with relative jitter) and error rate injected into a stand-in service."""
+
+    def __init__(self, latency_ms: float, jitter: float = 0.2, error_rate: float = 0.0, seed: int = 7):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        with self._lock:
+            factor = 1 + self._rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency_ms * factor / 1000)
+
+    def fails(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+
+def start_service(profile: ServiceProfile, route: Callable):
+    """
+    Serves route(method, path, body) -> (status, body) as JSON (or raw bytes) on a local
+    port, after the profile's latency; injected errors answer 503 with Retry-After: 0.
+    Returns (server, url).
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _handle(self, method: str):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length) if length else b""
+            time.sleep(profile.delay())
+            if profile.fails():
+                status, payload, headers = 503, {"error": "injected failure"}, {"Retry-After": "0"}
+            else:
+                try:
+                    status, payload = route(method, self.path, body)
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                headers = {}
+            data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream" if isinstance(payload, bytes) else "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def image_route(folders: List[str]):
+    def route(method, path, body):
+        name = os.path.basename(path.split("?")[0])
+        for folder in folders:
+            candidate = os.path.join(folder, name)
+            if os.path.isfile(candidate):
+                with open(candidate, "rb") as f:
+                    return 200, f.read()
+        return 404, {"error": f"{name} not found"}
+    return route
+
+
+def sample_name(filename: str) -> str:
+    """Maps a (possibly renamed) copy of a sample image back to the sample's stem."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return next((sample for sample in SAMPLE_PRODUCTS if stem.endswith(sample)), stem)
+
+
+def vision_route(known_images: Dict[str, str]):
+    """Answers the stand-in vision model from the SHA-256 of the image it was sent."""
+
+    def route(method, path, body):
+        request = json.loads(body)
+        digest = hashlib.sha256(base64.b64decode(request["image"])).hexdigest()
+        products = SAMPLE_PRODUCTS.get(known_images.get(digest), ["Unbranded product"])
+        if request.get("structured"):
+            content = json.dumps({
+                "products": [
+                    {"product_name": name, "shelf_row": 1 + i // 2, "shelf_position": 1 + i % 2,
+                     "facings": 2, "issues": [{"type": "low_stock"}] if i == 0 else []}
+                    for i, name in enumerate(products)
+                ],
+                "shelf_issues": [{"type": "other", "description": "empty gap on the bottom shelf"}],
+            })
+        else:
+            content = ("A retail shelf with " + ", ".join(products)
+                       + ". The first product is running low and there is an empty gap on the bottom shelf.")
+        return 200, {"content": content}
+
+    return route
+
+
+def tavily_route(method, path, body):
+    query = json.loads(body)["query"]
+    slug = hashlib.sha1(query.lower().encode("utf-8")).hexdigest()[:8]
+    return 200, {
+        "query": query,
+        "results": [
+            {
+                "title": f"{query} - market report {i}",
+                "url": f"https://example.com/{slug}/{i}",
+                "content": f"Demand for {query} grew {3 + i}% year over year. "
+                           f"Shoppers pick premium and sustainable options in the {query} category.",
+                "score": round(1 - i / 10, 2),
+            }
+            for i in range(1, 6)
+        ],
+    }
+
+
+class StandInVisionModel:
+    """Stands in for ChatWatsonx: sends the image to the stand-in watsonx service."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session = requests.Session()
+
+    def invoke(self, messages):
+        message = messages[-1]
+        prompt = next(part["text"] for part in message.content if part["type"] == "text")
+        data_url = next(part["image_url"]["url"] for part in message.content if part["type"] == "image_url")
+        response = self.session.post(
+            f"{self.url}/ml/v1/text/chat",
+            json={"image": data_url.split(",", 1)[1], "structured": "JSON schema" in prompt},
+            timeout=60
+        )
+        response.raise_for_status()
+        return types.SimpleNamespace(content=response.json()["content"])
+
+
+class StandInAgent:
+    """
+    Stands in for the retail market agent behind chat completions: finds the products
+    on the image, searches their market trends and looks them up in the catalog, calling
+    the real tools and recording each as a stage.
+    """
+
+    def __init__(self, recorder: StageRecorder, image_url: str):
+        self.recorder = recorder
+        self.image_url = image_url
+
+    def route(self, method, path, body):
+        from generate_description_from_image import extract_products_from_image
+        from product_resolver import resolve_products
+        from web_search import web_search_multi
+
+        prompt = json.loads(body)["messages"][-1]["content"]
+        match = re.search(r"https?://\S+?/([^/\s]+\.(?:png|jpe?g))", prompt, re.IGNORECASE)
+        if match is None:
+            return 400, {"error": "no image in the prompt"}
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            extraction = self.recorder.timed(
+                "agent: extract_products_from_image", extract_products_from_image,
+                f"{self.image_url}/{match.group(1)}"
+            ).content
+            names = [p["product_name"] for p in extraction.get("products", [])]
+            trends = self.recorder.timed(
+                "agent: web_search_multi", web_search_multi, [f"{name} market trends" for name in names]
+            ).content
+            resolved = self.recorder.timed("agent: resolve_products", resolve_products, names).content
+            in_catalog = [result["name"] for result in resolved.get("results", []) if result["candidates"]]
+            ok = True
+        finally:
+            self.recorder.record("chat completions", time.perf_counter() - start, ok)
+
+        content = (
+            f"Products: {', '.join(names)}. In catalog: {', '.join(in_catalog) or 'none'}.\n"
+            f"Market trends: {trends['text'][:500]}\n"
+            "Recommendation: move the low stock product to eye level and fill the empty gap."
+        )
+        return 200, {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+class StandIns:
+    """Starts every stand-in service and points the tools at them."""
+
+    def __init__(self, profiles: Dict[str, ServiceProfile], recorder: StageRecorder, cold: bool):
+        import generate_description_from_image as vision_tool
+        import http_client
+        import salesforce
+        import servicenow
+        import web_search
+        from standin_server import StandInRecords, start_standin_server
+
+        self.servers = []
+        self.watched_folder = tempfile.mkdtemp(prefix="listener-")
+
+        known_images = {}
+        for name in os.listdir(IMAGES_DIR):
+            with open(os.path.join(IMAGES_DIR, name), "rb") as f:
+                known_images[hashlib.sha256(f.read()).hexdigest()] = sample_name(name)
+        self.image_names = sorted(os.listdir(IMAGES_DIR))
+        self.images_url = self._start(profiles["images"], image_route([IMAGES_DIR, self.watched_folder]))
+
+        watsonx_url = self._start(profiles["watsonx"], vision_route(known_images))
+        vision_tool.is_called_from_orchestrate = False
+        vision_tool.set_model_factory(lambda temperature, max_new_tokens: StandInVisionModel(watsonx_url))
+
+        tavily_url = self._start(profiles["tavily"], tavily_route)
+        web_search.is_called_from_orchestrate = False
+        web_search.tavily_api_key = "standin"
+        web_search.set_search_backend(web_search.TavilyBackend(api_url=tavily_url))
+
+        self.records = StandInRecords(200)
+        for app_id, service in ((salesforce.MY_APP_ID, "salesforce"), (servicenow.MY_APP_ID, "servicenow")):
+            profile = profiles[service]
+            server, url = start_standin_server(
+                self.records, latency=profile.latency_ms / 1000, error_rate=profile.error_rate
+            )
+            self.servers.append(server)
+            creds = types.SimpleNamespace(url=url, access_token="standin")
+            http_client.set_client(app_id, http_client.ApiClient(app_id, credentials_provider=lambda _, c=creds: c))
+
+        agent = StandInAgent(recorder, self.images_url)
+        self.chat_url = self._start(profiles["orchestrate"], agent.route)
+
+        if cold:
+            import lookup_cache
+
+            lookup_cache.MAX_TTL_SECONDS = 0
+            web_search.search_cache.ttl = 0
+
+    def _start(self, profile: ServiceProfile, route: Callable) -> str:
+        server, url = start_service(profile, route)
+        self.servers.append(server)
+        return url
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+        shutil.rmtree(self.watched_folder, ignore_errors=True)
+
+
+# --------------------------------------- Drivers ---------------------------------------
+
+
+def drive(recorder: StageRecorder, stage: str, call: Callable[[int], object], calls: int, concurrency: int):
+    """Runs call(i) for i in range(calls) on `concurrency` threads."""
+
+    def one(i):
+        try:
+            recorder.timed(stage, call, i)
+        except Exception as e:
+            logger.debug("%s call %d failed: %s", stage, i, e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(calls)))
+    recorder.set_wall_time(stage, time.perf_counter() - start)
+
+
+def tool_calls(standins: StandIns) -> Dict[str, Callable[[int], object]]:
+    """One call of each directly driven stage, for call number i."""
+    import salesforce
+    import servicenow
+    from generate_description_from_image import extract_products_from_image, generate_description_from_image
+    from product_resolver import resolve_products
+    from table_search import search_product
+    from web_search import web_search, web_search_multi
+
+    def image_url(i):
+        return f"{standins.images_url}/{standins.image_names[i % len(standins.image_names)]}"
+
+    def products(i):
+        return SAMPLE_PRODUCTS[sample_name(standins.image_names[i % len(standins.image_names)])]
+
+    def checked(response):
+        # Tools report failures in their result instead of raising: an error message,
+        # per-query errors or a non-200 status count as a failed call
+        content = response.content
+        if isinstance(content, dict):
+            status = content.get("status")
+            failure = (content.get("error") or content.get("catalog_error") or content.get("errors")
+                       or (status if status not in (None, 200) else None))
+            if failure:
+                raise RuntimeError(failure)
+        return content
+
+    records = standins.records
+    return {
+        "generate_description_from_image": lambda i: checked(generate_description_from_image(image_url(i))),
+        "extract_products_from_image": lambda i: checked(extract_products_from_image(image_url(i), resolve_products=True)),
+        "web_search": lambda i: checked(web_search(f"{products(i)[i % len(products(i))]} market trends")),
+        "web_search_multi": lambda i: checked(web_search_multi([f"{name} market trends" for name in products(i)])),
+        "search_product": lambda i: checked(search_product(by="category", key="Audio")),
+        "resolve_products": lambda i: checked(resolve_products(products(i))),
+        "get_case_status": lambda i: checked(
+            salesforce.get_case_status(records.cases[i % len(records.cases)]["CaseNumber"])
+        ),
+        "get_ticket_test": lambda i: checked(
+            servicenow.get_ticket_test(records.tickets[i % len(records.tickets)]["number"])
+        ),
+    }
+
+
+def drive_listener(recorder: StageRecorder, standins: StandIns, images: int, rate: float):
+    """
+    Runs the real image listener on a watched folder, drops `images` copies of the sample
+    images into it at `rate` per second, and times each from the copy until its response
+    file is written.
+    """
+    import image_listener
+    from generate_description_from_image import extract_products_from_image
+    from results_store import ResultsStore
+    from watchdog.observers import Observer
+
+    image_listener.url = f"{standins.chat_url}/api/v1/orchestrate/standin/chat/completions"
+    image_listener.bearer_token = "standin"
+    image_listener.watched_folder = standins.watched_folder
+    output_folder = os.path.join(standins.watched_folder, "output")
+    os.makedirs(output_folder, exist_ok=True)
+    image_listener.results_store = ResultsStore(os.path.join(output_folder, "results.sqlite3"))
+    image_listener.store_id = "benchmark"
+    # The product names come from the structured extraction against the vision stand-in
+    image_listener.extract_products = extract_products_from_image
+    image_listener.products_image_url = standins.images_url
+
+    observer = Observer()
+    observer.schedule(image_listener.NewFileHandler(), path=standins.watched_folder, recursive=False)
+    observer.start()
+
+    # The listener only handles created files, so each copy is written next to the folder
+    # and hard-linked in: the listener never sees half an image
+    staging = tempfile.mkdtemp(prefix="staging-", dir=os.path.dirname(standins.watched_folder))
+    dropped = {}
+    start = time.perf_counter()
+    # The listener prints every request and response
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(images):
+            source = standins.image_names[i % len(standins.image_names)]
+            name = f"bench-{i:04d}-{source}"
+            staged = os.path.join(staging, name)
+            shutil.copyfile(os.path.join(IMAGES_DIR, source), staged)
+            dropped[os.path.splitext(name)[0]] = time.perf_counter()
+            os.link(staged, os.path.join(standins.watched_folder, name))
+            if rate > 0:
+                time.sleep(max(0.0, start + (i + 1) / rate - time.perf_counter()))
+
+        pending = dict(dropped)
+        deadline = time.perf_counter() + LISTENER_TIMEOUT_SECONDS
+        while pending and time.perf_counter() < deadline:
+            for stem in list(pending):
+                if os.path.exists(os.path.join(output_folder, f"{stem}.txt")):
+                    recorder.record("listener", time.perf_counter() - pending.pop(stem), True)
+            time.sleep(0.002)
+
+    observer.stop()
+    observer.join()
+    shutil.rmtree(staging, ignore_errors=True)
+    for stem in pending:
+        recorder.record("listener", time.perf_counter() - pending[stem], False)
+    recorder.set_wall_time("listener", time.perf_counter() - start)
+
+
+def parse_settings(values: Optional[List[str]], kind) -> Dict[str, float]:
+    settings = {}
+    for value in values or []:
+        service, _, amount = value.partition("=")
+        if service not in SERVICES:
+            raise SystemExit(f"Unknown service {service!r}, expected one of {', '.join(SERVICES)}")
+        settings[service] = kind(amount)
+    return settings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the retail shelf pipeline.")
+    parser.add_argument("--calls", type=int, default=30, help="Calls per directly driven tool stage")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent calls per tool stage")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated stages ({', '.join(STAGES)})")
+    parser.add_argument("--listener_images", type=int, default=9, help="Images dropped into the listener's folder")
+    parser.add_argument("--rate", type=float, default=1.0, help="Images dropped per second (0 = all at once)")
+    parser.add_argument("--latency", action="append", metavar="SERVICE=MS", help="Stand-in latency, e.g. watsonx=800")
+    parser.add_argument("--errors", action="append", metavar="SERVICE=RATE", help="Stand-in error rate, e.g. tavily=0.05")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative latency jitter of the stand-ins")
+    parser.add_argument("--cold", action="store_true", help="Disable the web search and lookup caches")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    parser.add_argument("--trace", type=float, metavar="SAMPLE_RATE",
+                        help="Trace the tools into a stand-in collector and print a per-span breakdown")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    latencies = {**DEFAULT_LATENCY_MS, **parse_settings(args.latency, float)}
+    error_rates = parse_settings(args.errors, float)
+    profiles = {
+        service: ServiceProfile(latencies[service], args.jitter, error_rates.get(service, 0.0), seed=i)
+        for i, service in enumerate(SERVICES)
+    }
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+
+    if args.trace:
+        import tracing
+        from trace_collector import print_span_summary, start_standin_collector
+
+        collector_server, collector_endpoint, collector = start_standin_collector()
+        tracing.configure(collector_endpoint, args.trace)
+
+    recorder = StageRecorder()
+    standins = StandIns(profiles, recorder, args.cold)
+    try:
+        calls = tool_calls(standins)
+        for stage in stages:
+            if stage == "listener":
+                drive_listener(recorder, standins, args.listener_images, args.rate)
+            elif stage in calls:
+                drive(recorder, stage, calls[stage], args.calls, args.concurrency)
+            else:
+                raise SystemExit(f"Unknown stage {stage!r}")
+    finally:
+        standins.stop()
+
+    rows = recorder.report()
+    print(f"Stand-in latency (ms): {latencies}, error rates: {error_rates or 'none'}")
+    print_report(rows)
+    if args.trace:
+        tracing.flush()
+        print()
+        print_span_summary(collector)
+        collector_server.shutdown()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"latency_ms": latencies, "error_rates": error_rates, "stages": rows}, f, indent=2)
@@ -0,0 +1,55 @@
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+from typing import List
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# --------------------------- Modules shared by the tool packages -------------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+# src/tools and samples/tools are packaged separately (`-p src/tools`, `-p ./tools`), so a
+# module both use is shipped as a copy in each. The first file of every pair is the
+# source of truth.
+#
+#   python src/benchmark/shared_copies.py --check   # exit 1 if a copy differs, for CI
+#   python src/benchmark/shared_copies.py --sync    # overwrite the copies from the source
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+# (source, copy), relative to the repository root
+SHARED_FILES = [
+    ("src/tools/tracing.py", "samples/tools/tracing.py"),
+]
+
+
+def stale_copies() -> List[str]:
+    """The copies that are missing or differ from their source."""
+    stale = []
+    for source, copy in SHARED_FILES:
+        copy_path = os.path.join(ROOT_DIR, copy)
+        if not os.path.exists(copy_path) or not filecmp.cmp(os.path.join(ROOT_DIR, source), copy_path, shallow=False):
+            stale.append(copy)
+    return stale
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keeps the copies of the shared tool modules in sync.")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--check", action="store_true", help="Exit with status 1 if a copy differs from its source")
+    mode.add_argument("--sync", action="store_true", help="Copy every source over its copy")
+    args = parser.parse_args()
+
+    if args.sync:
+        for source, copy in SHARED_FILES:
+            shutil.copyfile(os.path.join(ROOT_DIR, source), os.path.join(ROOT_DIR, copy))
+            print(f"{source} -> {copy}")
+    else:
+        stale = stale_copies()
+        for copy in stale:
+            print(f"FAIL: {copy} differs from its source; run shared_copies.py --sync")
+        print("Shared copies OK" if not stale else f"{len(stale)} stale copy(ies)")
+        sys.exit(1 if stale else 0)
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------------ Stand-in trace collector ---------------------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+# A local OTLP/HTTP JSON traces endpoint for src/tools/tracing.py, and a benchmark of the
+# per-call tracing overhead:
+#
+#   python src/benchmark/trace_collector.py --collector --port 4318   # prints what it receives
+#   python src/benchmark/trace_collector.py --overhead 20000          # us/call per sample rate
+#
+# pipeline_benchmark.py --trace uses the collector for its per-span breakdown.
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT_DIR, "src", "tools"))
+os.environ.setdefault("TOOL_WARM_UP", "false")
+
+import tracing  # noqa: E402
+
+
+class StandInCollector:
+    """Spans received by the stand-in collector, decoded from OTLP/JSON."""
+
+    def __init__(self):
+        self.spans = []
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def receive(self, request: dict):
+        decoded = []
+        for resource_spans in request.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                for s in scope_spans.get("spans", []):
+                    decoded.append({
+                        "trace_id": s["traceId"],
+                        "span_id": s["spanId"],
+                        "parent_id": s.get("parentSpanId"),
+                        "name": s["name"],
+                        "duration_ms": (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6,
+                        "attributes": {a["key"]: next(iter(a["value"].values())) for a in s.get("attributes", [])},
+                        "status": s.get("status", {}).get("code", tracing.STATUS_UNSET),
+                    })
+        with self._lock:
+            self.requests += 1
+            self.spans.extend(decoded)
+
+    def summary(self) -> list:
+        """Count, mean and max duration of the spans per name, slowest total first."""
+        by_name = {}
+        with self._lock:
+            for s in self.spans:
+                by_name.setdefault(s["name"], []).append(s)
+        rows = []
+        for name, spans in by_name.items():
+            durations = [s["duration_ms"] for s in spans]
+            rows.append({
+                "name": name,
+                "count": len(spans),
+                "errors": sum(1 for s in spans if s["status"] == tracing.STATUS_ERROR),
+                "total_ms": round(sum(durations), 1),
+                "mean_ms": round(sum(durations) / len(durations), 2),
+                "max_ms": round(max(durations), 2),
+            })
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+
+def start_standin_collector(port: int = 0):
+    """Serves an OTLP/HTTP JSON traces endpoint locally; returns (server, endpoint, collector)."""
+    collector = StandInCollector()
+
+    class CollectorHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            collector.receive(json.loads(body))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), CollectorHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/v1/traces", collector
+
+
+def print_span_summary(collector: StandInCollector):
+    print(f"{'span':<40}{'count':>7}{'errors':>8}{'total ms':>11}{'mean ms':>10}{'max ms':>10}")
+    for row in collector.summary():
+        print(f"{row['name']:<40}{row['count']:>7}{row['errors']:>8}{row['total_ms']:>11.1f}"
+              f"{row['mean_ms']:>10.2f}{row['max_ms']:>10.2f}")
+
+
+def measure_overhead(calls: int):
+    """Time per traced tool call (with two stage spans) with tracing off and at several sample rates."""
+    from ibm_watsonx_orchestrate.agent_builder.tools import tool
+
+    @tracing.traced
+    @tool
+    def noop_tool(value: int) -> int:
+        """Returns value."""
+        with tracing.span("stage one") as s:
+            s.set_attribute("bytes", value)
+        with tracing.span("stage two"):
+            tracing.current_span().add("rows_scanned", 10)
+        return value
+
+    server, endpoint, collector = start_standin_collector()
+    baseline = None
+    for label, rate in (("off", 0.0), ("sampled ~0%", 1e-12), ("sampled 10%", 0.1), ("sampled 100%", 1.0)):
+        tracing.configure(endpoint if rate else "", rate)
+        start = time.perf_counter()
+        for i in range(calls):
+            noop_tool(i)
+        per_call = (time.perf_counter() - start) / calls * 1e6
+        tracing.flush()
+        baseline = baseline or per_call
+        print(f"{label:<14}{per_call:>8.2f} us/call  (+{per_call - baseline:.2f} us)")
+    print(f"Spans received by the stand-in collector: {len(collector.spans)}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in OTLP collector and tracing overhead benchmark.")
+    parser.add_argument("--collector", action="store_true", help="Run a stand-in collector and print what it receives")
+    parser.add_argument("--port", type=int, default=4318, help="Port of the stand-in collector")
+    parser.add_argument("--overhead", type=int, metavar="CALLS", help="Measure the per-call tracing overhead")
+    args = parser.parse_args()
+
+    if args.overhead:
+        measure_overhead(args.overhead)
+    elif args.collector:
+        server, endpoint, collector = start_standin_collector(args.port)
+        print(f"Collecting spans at {endpoint} (Ctrl+C prints the summary)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print_span_summary(collector)
+    else:
+        parser.print_help()
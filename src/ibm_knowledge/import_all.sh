@@ -7,4 +7,5 @@ orchestrate env activate local
 SCRIPT_DIR=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )
 
 orchestrate knowledge-bases import -f ${SCRIPT_DIR}/knowledge_base/ibm_knowledge_base.yaml
+orchestrate tools import -k python -f ${SCRIPT_DIR}/tools/knowledge_search.py -p ${SCRIPT_DIR} -r ${SCRIPT_DIR}/tools/requirements.txt
 orchestrate agents import -f ${SCRIPT_DIR}/agents/ibm_agent.yaml
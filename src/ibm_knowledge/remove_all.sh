@@ -6,3 +6,4 @@ SCRIPT_DIR=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )
 
 orchestrate knowledge-bases remove -n ibm_knowledge_base
 orchestrate agents remove -n ibm_agent -k native
+orchestrate tools remove -n search_ibm_knowledge
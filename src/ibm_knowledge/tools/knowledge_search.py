@@ -0,0 +1,377 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+from ibm_watsonx_orchestrate.agent_builder.tools import ToolPermission, tool
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------- Local retrieval over the IBM knowledge base -------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+
+# Documents are read from the knowledge_base folder next to this tools folder. Parsed
+# chunks are cached per file content hash in KNOWLEDGE_CACHE_DIR, so each document is
+# only extracted once; adding a document only extracts and indexes that document.
+KNOWLEDGE_BASE_DIR = os.getenv(
+    "KNOWLEDGE_BASE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "knowledge_base")
+)
+KNOWLEDGE_CACHE_DIR = os.getenv(
+    "KNOWLEDGE_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "ibm_knowledge_chunks")
+)
+DOCUMENT_EXTENSIONS = (".pdf", ".txt", ".md")
+
+CHUNK_WORDS = 180
+CHUNK_OVERLAP_WORDS = 40
+# Bumping this invalidates cached chunks made by an older chunker
+CHUNKER_VERSION = 1
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Optional dense retrieval: every chunk also gets a compact hashed bag-of-words/char
+# trigram vector; queries are answered by fusing the BM25 and cosine rankings.
+# Set KNOWLEDGE_EMBEDDINGS=0 to use BM25 only.
+USE_EMBEDDINGS = os.getenv("KNOWLEDGE_EMBEDDINGS", "1") != "0"
+EMBEDDING_DIMENSIONS = 256
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 20
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from",
+    "has", "have", "how", "in", "is", "it", "its", "of", "on", "or", "that", "the",
+    "this", "to", "was", "were", "what", "when", "where", "which", "who", "with",
+})
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_pages(path: str) -> List[str]:
+    """Returns the text of each page of a document (a text file is a single page)."""
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        return [page.extract_text() or "" for page in PdfReader(path).pages]
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return [f.read()]
+
+
+def chunk_pages(pages: List[str]) -> List[dict]:
+    """Splits pages into overlapping windows of about CHUNK_WORDS words."""
+    chunks = []
+    step = CHUNK_WORDS - CHUNK_OVERLAP_WORDS
+    for page_number, text in enumerate(pages, start=1):
+        words = text.split()
+        for start in range(0, max(len(words), 1), step):
+            window = words[start:start + CHUNK_WORDS]
+            if window:
+                chunks.append({"page": page_number, "text": " ".join(window)})
+            if start + CHUNK_WORDS >= len(words):
+                break
+    return chunks
+
+
+def embed(texts: List[str]) -> np.ndarray:
+    """
+    Hashed bag-of-words and character trigram vectors, L2-normalized, as float16:
+    256 dimensions make a 512 byte row per chunk. Trigrams let "computing" and
+    "computer" match partially.
+    """
+    matrix = np.zeros((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in tokenize(text):
+            features = [token] + [token[i:i + 3] for i in range(len(token) - 2)]
+            for feature in features:
+                h = zlib.crc32(feature.encode("utf-8"))
+                matrix[row, h % EMBEDDING_DIMENSIONS] += 1.0 if h & 0x80000000 else -1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix.astype(np.float16)
+
+
+class ChunkCache:
+    """Parsed chunks of each document, stored as JSON files named after the content hash."""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or KNOWLEDGE_CACHE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.directory, f"{sha256}.v{CHUNKER_VERSION}.json")
+
+    def load(self, sha256: str) -> Optional[List[dict]]:
+        try:
+            with open(self._path(sha256), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, sha256: str, chunks: List[dict]):
+        # Written to a temporary file first so that concurrent readers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        os.replace(tmp, self._path(sha256))
+
+
+class KnowledgeIndex:
+    """
+    BM25 inverted index (plus optional embedding matrix) over the chunks of every
+    document in a folder. refresh() picks up added, changed and removed documents:
+    added documents are appended to the index, other changes rebuild it from the
+    cached chunks without extracting any document again.
+    """
+
+    def __init__(self, directory: str = None, cache: ChunkCache = None, use_embeddings: bool = None):
+        self.directory = directory or KNOWLEDGE_BASE_DIR
+        self.cache = cache or ChunkCache()
+        self.use_embeddings = USE_EMBEDDINGS if use_embeddings is None else use_embeddings
+        self._lock = threading.Lock()
+        # path -> (mtime, size, sha256): unchanged files are not hashed again
+        self._files: Dict[str, tuple] = {}
+        self._reset()
+        self.extracted = 0
+
+    def _reset(self):
+        self.chunks: List[dict] = []
+        self._postings = defaultdict(lambda: ([], []))  # term -> (chunk ids, term frequencies)
+        self._frozen = {}
+        self._lengths: List[int] = []
+        self._length_array = np.zeros(0, dtype=np.float32)
+        self._embeddings = np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float16)
+
+    # ---------------------------------- Building ----------------------------------
+
+    def _scan(self) -> Dict[str, tuple]:
+        found = {}
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.lower().endswith(DOCUMENT_EXTENSIONS) and os.path.isfile(path):
+                stat = os.stat(path)
+                known = self._files.get(path)
+                if known and known[:2] == (stat.st_mtime, stat.st_size):
+                    found[path] = known
+                else:
+                    found[path] = (stat.st_mtime, stat.st_size, file_sha256(path))
+        return found
+
+    def _document_chunks(self, path: str, sha256: str) -> List[dict]:
+        chunks = self.cache.load(sha256)
+        if chunks is None:
+            try:
+                chunks = chunk_pages(extract_pages(path))
+            except Exception as e:
+                logger.warning("Could not read %s: %s", path, e)
+                chunks = []
+            self.cache.store(sha256, chunks)
+            self.extracted += 1
+        name = os.path.basename(path)
+        return [{"document": name, "page": c["page"], "text": c["text"]} for c in chunks]
+
+    def _add(self, chunks: List[dict]):
+        base = len(self.chunks)
+        for offset, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk["text"]))
+            for term, tf in counts.items():
+                ids, tfs = self._postings[term]
+                ids.append(base + offset)
+                tfs.append(tf)
+            self._lengths.append(sum(counts.values()))
+        self.chunks.extend(chunks)
+        self._frozen = {}
+        self._length_array = np.asarray(self._lengths, dtype=np.float32)
+        if self.use_embeddings and chunks:
+            self._embeddings = np.vstack([self._embeddings, embed([c["text"] for c in chunks])])
+
+    def refresh(self) -> dict:
+        """Brings the index up to date with the folder; returns what changed."""
+        with self._lock:
+            found = self._scan()
+            added = [p for p in found if p not in self._files]
+            removed = [p for p in self._files if p not in found]
+            changed = [p for p in found if p in self._files and found[p][2] != self._files[p][2]]
+
+            if removed or changed:
+                self._reset()
+                for path, (_, _, sha256) in found.items():
+                    self._add(self._document_chunks(path, sha256))
+            else:
+                for path in added:
+                    self._add(self._document_chunks(path, found[path][2]))
+            self._files = found
+            return {"added": len(added), "changed": len(changed), "removed": len(removed)}
+
+    # ---------------------------------- Searching ----------------------------------
+
+    def _posting_arrays(self, term: str):
+        arrays = self._frozen.get(term)
+        if arrays is None:
+            ids, tfs = self._postings.get(term, ([], []))
+            arrays = self._frozen[term] = (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+        return arrays
+
+    def bm25_scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        if not self.chunks:
+            return scores
+        n = len(self.chunks)
+        average_length = float(self._length_array.mean()) or 1.0
+        for term in set(tokenize(query)):
+            ids, tfs = self._posting_arrays(term)
+            if not len(ids):
+                continue
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self._length_array[ids] / average_length)
+            scores[ids] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+        return scores
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest scores, best first (argpartition, then a sort of k)."""
+        k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[dict]:
+        with self._lock:
+            bm25 = self.bm25_scores(query)
+            candidates = max(top_k * 4, 20)
+            ranked = [i for i in self._top(bm25, candidates) if bm25[i] > 0]
+
+            fused = {i: 1.0 / (RRF_K + rank) for rank, i in enumerate(ranked, start=1)}
+            if self.use_embeddings and len(self._embeddings):
+                cosine = self._embeddings @ embed([query])[0]
+                for rank, i in enumerate(self._top(cosine.astype(np.float32), candidates), start=1):
+                    if cosine[i] > 0:
+                        fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + rank)
+
+            best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+            return [
+                {
+                    "text": self.chunks[i]["text"],
+                    "document": self.chunks[i]["document"],
+                    "page": self.chunks[i]["page"],
+                    "score": round(fused[i], 5),
+                    "citation": f"{self.chunks[i]['document']}, p. {self.chunks[i]['page']}",
+                }
+                for i in best
+            ]
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._files),
+            "chunks": len(self.chunks),
+            "terms": len(self._postings),
+            "documents_extracted": self.extracted,
+            "embedding_bytes": int(self._embeddings.nbytes),
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> KnowledgeIndex:
+    """Returns the shared index, refreshed against the knowledge_base folder."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = KnowledgeIndex()
+    _index.refresh()
+    return _index
+
+
+@tool(
+    name="search_ibm_knowledge",
+    description="Search the IBM knowledge base documents and return the most relevant passages with citations.",
+    permission=ToolPermission.READ_ONLY
+)
+def search_ibm_knowledge(query: str, top_k: int = DEFAULT_TOP_K) -> dict:
+    """
+    Search the IBM knowledge base (IBM history and company information) for passages
+    relevant to a question.
+
+    Parameters:
+    query (str): The question or keywords to search for.
+    top_k (int): Number of passages to return (1-20, default 5).
+
+    Returns:
+    dict: The query and a list of passages, each with its text, document, page, score
+    and a citation ("document, p. page") to quote in the answer.
+    """
+    top_k = max(1, min(int(top_k), MAX_TOP_K))
+    results = get_index().search(query, top_k)
+    return {"query": query, "results": results}
+
+
+def run_benchmark(queries: List[str], repeat: int):
+    index = get_index()
+    timings = []
+    for _ in range(repeat):
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, DEFAULT_TOP_K)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{len(timings)} searches over {index.stats()['chunks']} chunks: "
+          f"p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--query", action="append", help="Question to search for (repeatable)")
+    parser.add_argument("--top_k", type=int, default=DEFAULT_TOP_K, help="Passages per query")
+    parser.add_argument("--dir", help="Folder of documents to index (default: ../knowledge_base)")
+    parser.add_argument("--no_embeddings", action="store_true", help="Rank with BM25 only")
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Time N rounds of the queries")
+    args = parser.parse_args()
+
+    if args.dir:
+        KNOWLEDGE_BASE_DIR = args.dir
+    if args.no_embeddings:
+        USE_EMBEDDINGS = False
+
+    start = time.perf_counter()
+    index = get_index()
+    print(f"Index ready in {time.perf_counter() - start:.2f}s:", index.stats())
+
+    queries = args.query or ["When was IBM founded?"]
+    if args.benchmark:
+        run_benchmark(queries, args.benchmark)
+    else:
+        for query in queries:
+            print(json.dumps(search_ibm_knowledge(query, args.top_k).content, indent=2))
@@ -7,8 +7,16 @@ for connection in tavily.yaml watsonxai.yaml; do
   orchestrate connections import -f ${SCRIPT_DIR}/connections/${connection}
 done
 
+# The product resolver (also used by extract_products_from_image) reads the catalog of
+# samples/tools; a copy ships in the tool package
+cp ${SCRIPT_DIR}/../samples/tools/products.csv ${SCRIPT_DIR}/tools/products.csv
+
 for python_tool in web_search.py generate_description_from_image.py; do
-  orchestrate tools import -k python -f ${SCRIPT_DIR}/tools/${python_tool} -r ${SCRIPT_DIR}/tools/requirements.txt -a watsonxai -a tavily
+  orchestrate tools import -k python -f ${SCRIPT_DIR}/tools/${python_tool} -p ${SCRIPT_DIR}/tools -r ${SCRIPT_DIR}/tools/requirements.txt -a watsonxai -a tavily
+done
+
+for python_tool in recall_lookup.py product_resolver.py; do
+  orchestrate tools import -k python -f ${SCRIPT_DIR}/tools/${python_tool} -p ${SCRIPT_DIR}/tools -r ${SCRIPT_DIR}/tools/requirements.txt
 done
 
 for agent in internet_research_agent.yaml market_analyst_agent.yaml retail_market_agent.yaml; do
@@ -8,7 +8,7 @@ for agent in internet_research_agent market_analyst_agent retail_market_agent; d
   orchestrate agents remove -n ${agent} -k native
 done
 
-for python_tool in web_search generate_description_from_image; do
+for python_tool in web_search web_search_multi generate_description_from_image extract_products_from_image check_product_recalls resolve_products; do
   orchestrate tools remove -n ${python_tool}
 done
 
@@ -1,14 +1,250 @@
+import argparse
+import asyncio
+import copy
+import os
 import re
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator, List, Optional, Sequence, Union
 from ibm_watsonx_orchestrate.agent_builder.tools import tool
 from ibm_watsonx_orchestrate.agent_builder.tools.types import (
     PythonToolKind,
     PluginContext,
     AgentPostInvokePayload,
     AgentPostInvokeResult,
+    ImageContent,
     TextContent,
     Message,
+    Role,
 )
+from tracing import current_span, traced
 
+# ----------------------------------------------------------------------
+# Transform chain configuration
+# ----------------------------------------------------------------------
+DISCLAIMER_HTML = (
+    '<span style="font-size:0.8em; color:#777;">'
+    "Message generated by AI"
+    "</span>"
+)
+# Trailing whitespace tolerated after the suffixes when checking a streamed response
+STREAM_TAIL_ALLOWANCE = 256
+# Mask e-mail addresses and phone numbers in responses
+MASK_PII = os.getenv("POST_INVOKE_MASK_PII", "false").lower() in ("1", "true", "yes")
+
+
+class InlineTransform:
+    """
+    A rewrite of every match of `pattern` in the response, e.g. PII masking or link
+    rewriting. `replacement` is either a literal string or a function of the match.
+    """
+
+    def __init__(self, name: str, pattern: str, replacement: Union[str, Callable[[re.Match], str]]):
+        self.name = name
+        self.pattern = pattern
+        self.replacement = replacement
+        self._regex = re.compile(pattern)
+        # re.sub would expand backslash escapes in a string replacement
+        self._sub_replacement = (
+            replacement if callable(replacement) else replacement.replace("\\", "\\\\")
+        )
+
+    def sub(self, text: str) -> str:
+        return self._regex.sub(self._sub_replacement, text)
+
+
+EMAIL_MASK = InlineTransform("email", r"(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)+", "[email removed]")
+PHONE_MASK = InlineTransform(
+    "phone",
+    r"(?<![\w+])(?:\+?1[ .-]?)?\(?\d{3}\)?[ .-]?\d{3}[ .-]\d{4}(?!\w)",
+    "[phone removed]"
+)
+
+
+def _skip_trailing_space(text: str, end: int) -> int:
+    while end and text[end - 1].isspace():
+        end -= 1
+    return end
+
+
+class PostInvokeChain:
+    """
+    Applies several post-invoke transforms to a response.
+
+    Inline transforms run one after another, each as its own re.sub over the text
+    before the suffix block; combining them into a single alternation was measured
+    to be slower (see --mode chain). Suffixes (footers, the disclaimer) are appended
+    in order; a suffix block that is already at the end of the text is detected by
+    comparing only the tail, so running the chain twice does not duplicate it.
+
+    For streamed responses, stream() and astream() pass the chunks through untouched
+    and append the suffixes at the end of the stream; inline transforms are not
+    applied to streams.
+    """
+
+    def __init__(self, inline: Sequence[InlineTransform] = (), suffixes: Sequence[str] = (),
+                 separator: str = "\n\n"):
+        self.inline = list(inline)
+        self.suffixes = list(suffixes)
+        self.separator = separator
+        self._tail_window = len(self.suffix_text()) + len(separator) + STREAM_TAIL_ALLOWANCE
+
+    def suffix_text(self) -> str:
+        return self.separator.join(self.suffixes)
+
+    def _suffix_block_start(self, text: str):
+        """Returns where the trailing suffixes start and whether all of them are present."""
+        end = _skip_trailing_space(text, len(text))
+        present = 0
+        for suffix in reversed(self.suffixes):
+            if end < len(suffix) or not text.startswith(suffix, end - len(suffix)):
+                break
+            end = _skip_trailing_space(text, end - len(suffix))
+            present += 1
+        return end, present == len(self.suffixes)
+
+    def apply(self, text: str) -> Optional[str]:
+        """Returns the transformed text, or None if no transform changed anything."""
+        end, complete = self._suffix_block_start(text)
+
+        body = text[:end]
+        new_body = body
+        for transform in self.inline:
+            new_body = transform.sub(new_body)
+
+        if complete:
+            if new_body == body:
+                return None
+            # Keep the existing suffix block as it is
+            return new_body + text[end:]
+        return self.separator.join([new_body] + self.suffixes)
+
+    def ending(self, tail: str) -> str:
+        """
+        Returns the text to append to a streamed response that ended with `tail`, or
+        "" if the suffixes are already there.
+        """
+        if not self.suffixes:
+            return ""
+        _, complete = self._suffix_block_start(tail)
+        if complete:
+            return ""
+        if not tail or tail.endswith(self.separator):
+            return self.suffix_text()
+        return self.separator + self.suffix_text()
+
+    def _update_tail(self, tail: str, chunk: str) -> str:
+        return (tail + chunk[-self._tail_window:])[-self._tail_window:]
+
+    def stream(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Yields every chunk as soon as it arrives, then the suffixes."""
+        tail = ""
+        for chunk in chunks:
+            yield chunk
+            tail = self._update_tail(tail, chunk)
+        ending = self.ending(tail)
+        if ending:
+            yield ending
+
+    async def astream(self, chunks: AsyncIterable[str]) -> AsyncIterator[str]:
+        """Async version of stream()."""
+        tail = ""
+        async for chunk in chunks:
+            yield chunk
+            tail = self._update_tail(tail, chunk)
+        ending = self.ending(tail)
+        if ending:
+            yield ending
+
+
+post_invoke_chain = PostInvokeChain(
+    inline=[EMAIL_MASK, PHONE_MASK] if MASK_PII else [],
+    suffixes=[DISCLAIMER_HTML]
+)
+
+def stream_with_disclaimer(chunks: Iterable[str]) -> Iterator[str]:
+    """
+    Streaming mode of the plug-in: passes response chunks through untouched, so
+    time-to-first-token is unaffected, and appends the disclaimer at end of stream.
+    """
+    return post_invoke_chain.stream(chunks)
+
+
+def astream_with_disclaimer(chunks: AsyncIterable[str]) -> AsyncIterator[str]:
+    """Async version of stream_with_disclaimer()."""
+    return post_invoke_chain.astream(chunks)
+
+
+def replace_message(payload, index: int, message: Message):
+    """
+    Returns a copy of the payload with the message at `index` replaced (or appended
+    if `index` is the number of messages). Only the message list is new; all other
+    messages and fields are shared with the original payload, which is left unchanged.
+    """
+    messages = list(payload.messages)
+    if index == len(messages):
+        messages.append(message)
+    else:
+        messages[index] = message
+    return payload.model_copy(update={"messages": messages})
+
+
+def _last_text_part(parts: Sequence) -> Optional[int]:
+    """Index of the last non-empty text part of multi-part content, or None."""
+    for index in range(len(parts) - 1, -1, -1):
+        part = parts[index]
+        if isinstance(part, TextContent) and part.text:
+            return index
+        if isinstance(part, dict) and part.get("type") == "text" and part.get("text"):
+            return index
+    return None
+
+
+def response_text(content) -> Optional[str]:
+    """
+    The text the disclaimer is appended to: the text of TextContent, or the text of the
+    last text part of multi-part (list) content. None if the content has no text.
+    """
+    if isinstance(content, TextContent):
+        return content.text or None
+    if isinstance(content, (list, tuple)):
+        index = _last_text_part(content)
+        if index is None:
+            return None
+        part = content[index]
+        return part.text if isinstance(part, TextContent) else part["text"]
+    return None
+
+
+def with_response_text(content, text: str):
+    """Returns a copy of the content whose response_text() is `text`; other parts are shared."""
+    if isinstance(content, TextContent):
+        return TextContent(type="text", text=text)
+    parts = list(content)
+    index = _last_text_part(parts)
+    part = parts[index]
+    parts[index] = TextContent(type="text", text=text) if isinstance(part, TextContent) else dict(part, text=text)
+    return parts
+
+
+def find_response_text_index(messages: List[Message]) -> Optional[int]:
+    """
+    Returns the index of the message the disclaimer belongs to: the last message if
+    it has text, otherwise the last text message of the agent's response, which may
+    be split over several messages (e.g. text followed by an image). Messages with
+    multi-part content count as text messages if any part is text. Returns None if
+    the response has no text.
+    """
+    if response_text(messages[-1].content):
+        return len(messages) - 1
+    for index in range(len(messages) - 1, -1, -1):
+        message = messages[index]
+        if message.role != Role.ASSISTANT:
+            return None
+        if response_text(message.content):
+            return index
+    return None
+
+@traced
 @tool(
     description="Adds a small grey AI‑generated disclaimer to the end of the agent's response.",
     kind=PythonToolKind.AGENTPOSTINVOKE,
@@ -19,7 +255,9 @@ def add_disclaimer_plugin(
 ) -> AgentPostInvokeResult:
     """
     Post‑invoke plug‑in that appends a disclaimer to the last text message
-    returned by the agent.
+    returned by the agent (for multi-part content, to its last text part). If the
+    agent's response has no text (e.g. only an image or JSON), the disclaimer is
+    added as a message of its own.
     The disclaimer is rendered as small, grey text:
         <span style="font-size:0.8em; color:#777;">This message is generated by AI</span>
     Args:
@@ -43,45 +281,215 @@ def add_disclaimer_plugin(
         return result
 
     # ------------------------------------------------------------------
-    # Work on the **last** message (the one the agent just produced)
+    # Work on the last text message of the agent's response
     # ------------------------------------------------------------------
-    last_msg: Message = agent_post_invoke_payload.messages[-1]
+    messages = agent_post_invoke_payload.messages
+    target_index = find_response_text_index(messages)
 
-    # The plug‑in only knows how to handle plain‑text content.
-    if not isinstance(last_msg.content, TextContent) or not last_msg.content.text:
-        # If it isn’t a text message, leave it untouched.
+    if target_index is None:
+        if messages[-1].role != Role.ASSISTANT or not post_invoke_chain.suffix_text():
+            # Not an agent response – leave it untouched.
+            result.continue_processing = True
+            return result
+        # Non-text response – add the disclaimer as a separate text message.
+        disclaimer_message = Message(
+            role=Role.ASSISTANT,
+            content=TextContent(type="text", text=post_invoke_chain.suffix_text())
+        )
         result.continue_processing = True
+        result.modified_payload = replace_message(agent_post_invoke_payload, len(messages), disclaimer_message)
         return result
 
+    last_msg: Message = messages[target_index]
+
     # ------------------------------------------------------------------
-    # Build the disclaimer HTML
+    # Run the transform chain (masking, footers, disclaimer) in one pass.
+    # If the text already ends with the disclaimer, it is not duplicated.
     # ------------------------------------------------------------------
-    disclaimer_html = (
-        '<span style="font-size:0.8em; color:#777;">'
-        "Message generated by AI"
-        "</span>"
-    )
-
-    # If the existing text already ends with the disclaimer, don’t duplicate it.
-    if not re.search(re.escape(disclaimer_html) + r"\s*$", last_msg.content.text):
-        # Append a line break and the disclaimer.
-        new_text = f"{last_msg.content.text.rstrip()}\n\n{disclaimer_html}"
-    else:
-        new_text = last_msg.content.text
+    text = response_text(last_msg.content)
+    new_text = post_invoke_chain.apply(text)
+    current_span().set_attributes({"chars": len(text), "changed": new_text is not None})
+    if new_text is None:
+        # Nothing changed – pass the payload through without copying it
+        result.continue_processing = True
+        result.modified_payload = agent_post_invoke_payload
+        return result
 
     # ------------------------------------------------------------------
-    # Create a new TextContent and Message instance with the updated text
+    # Create a new message with the updated text (other content parts
+    # of a multi-part message are kept)
     # ------------------------------------------------------------------
-    new_content = TextContent(type="text", text=new_text)
-    new_message = Message(role=last_msg.role, content=new_content)
+    new_message = last_msg.model_copy(update={"content": with_response_text(last_msg.content, new_text)})
 
     # ------------------------------------------------------------------
-    # Produce a deep copy of the payload, replace the last message,
-    # and return the result.
+    # Copy the payload with the message replaced (the other messages
+    # are shared, not copied), and return the result.
     # ------------------------------------------------------------------
-    modified_payload = agent_post_invoke_payload.copy(deep=True)
-    modified_payload.messages[-1] = new_message
+    modified_payload = replace_message(agent_post_invoke_payload, target_index, new_message)
 
     result.continue_processing = True
     result.modified_payload = modified_payload
-    return result
\ No newline at end of file
+    return result
+
+
+def run_payload_benchmark(lengths: List[int], repeat: int):
+    """
+    Compares deep-copying the payload with replace_message for conversations of
+    different lengths, and checks that the caller's payload is not modified.
+    """
+    text = "Based on current market trends, move the cold brew to eye level. " * 50
+    for length in lengths:
+        messages = [
+            Message(role=Role.USER if i % 2 == 0 else Role.ASSISTANT, content=TextContent(type="text", text=text))
+            for i in range(length)
+        ]
+        payload = AgentPostInvokePayload(agent_id="benchmark", messages=messages)
+        snapshot = copy.deepcopy(payload.model_dump())
+        new_message = Message(role=Role.ASSISTANT, content=TextContent(type="text", text=text + "disclaimer"))
+
+        def deep_copy():
+            new_payload = payload.model_copy(deep=True)
+            new_payload.messages[-1] = new_message
+            return new_payload
+
+        timings = []
+        for build in (deep_copy, lambda: replace_message(payload, length - 1, new_message)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                new_payload = build()
+            timings.append((time.perf_counter() - start) * 1e6 / repeat)
+            assert new_payload.messages[-1] is new_message
+        assert payload.model_dump() == snapshot, "caller's payload was modified"
+        print(f"{length:6d} messages: deep copy {timings[0]:10.1f} us, shared {timings[1]:8.1f} us")
+
+
+def run_chain_benchmark(sizes: List[int], repeat: int):
+    """
+    Compares applying PII masking and the disclaimer with plain re.sub calls and an
+    end-anchored re.search against PostInvokeChain, which should cost about the same.
+    """
+    chain = PostInvokeChain(inline=[EMAIL_MASK, PHONE_MASK], suffixes=[DISCLAIMER_HTML])
+    sequential = [re.compile(t.pattern) for t in (EMAIL_MASK, PHONE_MASK)]
+    replacements = [EMAIL_MASK.replacement, PHONE_MASK.replacement]
+
+    def apply_sequentially(text):
+        for pattern, replacement in zip(sequential, replacements):
+            text = pattern.sub(replacement, text)
+        if not re.search(re.escape(DISCLAIMER_HTML) + r"\s*$", text):
+            text = f"{text.rstrip()}\n\n{DISCLAIMER_HTML}"
+        return text
+
+    line = "Move the cold brew to eye level and contact jane.doe@example.com or 555-123-4567. "
+    for size in sizes:
+        text = line * max(1, size // len(line))
+        assert apply_sequentially(text) == chain.apply(text)
+        done = chain.apply(text)
+        assert chain.apply(done) is None, "chain is not idempotent"
+        timings = []
+        for apply in (apply_sequentially, chain.apply):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                apply(text)
+            timings.append((time.perf_counter() - start) * 1e6 / repeat)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            chain.apply(done)
+        recheck = (time.perf_counter() - start) * 1e6 / repeat
+        print(f"{len(text):9d} chars: sequential {timings[0]:10.1f} us, chain {timings[1]:10.1f} us, "
+              f"already transformed {recheck:8.1f} us")
+
+
+def run_stream_benchmark(chunk_count: int, chunk_delay: float):
+    """
+    Measures time to first chunk and to completion for a simulated token stream,
+    buffering the whole response before adding the disclaimer vs streaming mode.
+    """
+
+    async def token_stream():
+        for i in range(chunk_count):
+            await asyncio.sleep(chunk_delay)
+            yield f"token{i} "
+
+    async def buffered():
+        text = "".join([chunk async for chunk in token_stream()])
+        yield post_invoke_chain.apply(text) or text
+
+    async def measure(name, stream):
+        start = time.perf_counter()
+        first = None
+        output = []
+        async for chunk in stream:
+            if first is None:
+                first = time.perf_counter() - start
+            output.append(chunk)
+        total = time.perf_counter() - start
+        print(f"{name:>9}: first chunk {first * 1000:8.1f} ms, complete {total * 1000:8.1f} ms")
+        return "".join(output)
+
+    buffered_text = asyncio.run(measure("buffered", buffered()))
+    streamed_text = asyncio.run(measure("streaming", astream_with_disclaimer(token_stream())))
+    assert streamed_text.endswith(DISCLAIMER_HTML) and buffered_text.endswith(DISCLAIMER_HTML)
+
+
+def run_check():
+    """Checks where the disclaimer goes for text, multi-part and non-text responses."""
+    image = ImageContent(type="image", data="aGVsbG8=", mime_type="image/png")
+
+    def assistant(content):
+        # Multi-part content is built without validation, as the runtime may deliver it
+        return Message.model_construct(role=Role.ASSISTANT, content=content)
+
+    def run(messages):
+        payload = AgentPostInvokePayload(agent_id="check", messages=[Message(
+            role=Role.USER, content=TextContent(type="text", text="What is on the shelf?")
+        )])
+        payload = payload.model_copy(update={"messages": payload.messages + messages})
+        snapshot = copy.deepcopy(payload.messages)
+        result = add_disclaimer_plugin(None, payload).content
+        assert payload.messages == snapshot, "caller's payload was modified"
+        return result.modified_payload.messages if result.modified_payload is not None else None
+
+    checks = {
+        "text": ([assistant(TextContent(type="text", text="Cold brew."))],
+                 lambda out: out[-1].content.text.endswith(DISCLAIMER_HTML)),
+        "list, text then image": ([assistant([TextContent(type="text", text="Cold brew."), image])],
+                                  lambda out: len(out) == 2 and out[-1].content[0].text.endswith(DISCLAIMER_HTML)
+                                  and out[-1].content[1] is image),
+        "list of dict parts": ([assistant([{"type": "text", "text": "A"}, {"type": "text", "text": "B"}])],
+                               lambda out: out[-1].content[0] == {"type": "text", "text": "A"}
+                               and out[-1].content[1]["text"].endswith(DISCLAIMER_HTML)),
+        "text, then image-only list": ([assistant(TextContent(type="text", text="Cold brew.")), assistant([image])],
+                                       lambda out: out[-2].content.text.endswith(DISCLAIMER_HTML)
+                                       and out[-1].content == [image]),
+        "image only": ([assistant(image)], lambda out: out[-1].content.text == DISCLAIMER_HTML),
+    }
+    for name, (messages, ok) in checks.items():
+        out = run(messages)
+        assert ok(out), f"{name}: {out}"
+        again = run(out[1:])
+        assert again == out, f"{name}: disclaimer added twice"
+        print(f"ok {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the post-invoke plug-in.")
+    parser.add_argument("--mode", choices=["payload", "chain", "stream", "check"], default="payload",
+                        help="Benchmark building the modified payload, the transform chain or streaming mode, "
+                             "or check where the disclaimer is added")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Conversation lengths to benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000],
+                        help="Response sizes in characters for the chain benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per length")
+    parser.add_argument("--chunks", type=int, default=100, help="Chunks in the simulated stream")
+    parser.add_argument("--chunk_delay", type=float, default=0.005, help="Seconds between streamed chunks")
+    args = parser.parse_args()
+
+    if args.mode == "check":
+        run_check()
+    elif args.mode == "chain":
+        run_chain_benchmark(args.sizes, args.repeat)
+    elif args.mode == "stream":
+        run_stream_benchmark(args.chunks, args.chunk_delay)
+    else:
+        run_payload_benchmark(args.lengths, args.repeat)
\ No newline at end of file
@@ -1,17 +1,26 @@
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
+from enum import Enum
 import base64
+import json
+import re
 import requests
 import io
 import logging
 import argparse
 import os
+import threading
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_ibm import ChatWatsonx
-from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams
+from pydantic import BaseModel, Field, ValidationError
 from ibm_watsonx_orchestrate.agent_builder.tools import ToolPermission, tool
 from ibm_watsonx_orchestrate.run import connections
 from ibm_watsonx_orchestrate.client.connections import ConnectionType
+from tracing import current_span, redact_url, span, traced
+
+# langchain_ibm and ibm_watsonx_ai take over a second to import, so they are imported
+# on first use instead of when the tool is loaded
+if TYPE_CHECKING:
+    from langchain_core.messages import HumanMessage
+    from langchain_ibm import ChatWatsonx
 
 CONNECTION_WATSONX_AI = 'watsonxai'
 model_id=''
@@ -19,20 +28,77 @@ api_key=''
 space_id=''
 is_called_from_orchestrate=True
 
+# Number of additional model calls made when the structured output does not
+# parse or does not validate against the schema.
+STRUCTURED_MAX_RETRIES = 2
+# Low temperature keeps the model close to the requested JSON format
+EXTRACTION_TEMPERATURE = 0.0
+EXTRACTION_MAX_NEW_TOKENS = 2000
+
+# The first call of either tool creates the models of both in the background. Nothing
+# is started when the module is imported, e.g. by `orchestrate tools import`.
+WARM_UP = os.getenv("TOOL_WARM_UP", "true").lower() in ("1", "true", "yes")
+
 logger = logging.getLogger(__name__)
 
+# Optional replacement for the watsonx.ai chat model, e.g. an offline stand-in for
+# benchmarks: called with (temperature, max_new_tokens), it returns an object whose
+# invoke(messages) returns a message with .content.
+_model_factory = None
+# Models by (model id, API key, space id, temperature, max new tokens)
+_models = {}
+_models_lock = threading.Lock()
+
+
+# -----------------------------------------------------------------------------------------
+# Structured extraction schema
+# -----------------------------------------------------------------------------------------
+
+class ShelfIssueType(str, Enum):
+    OUT_OF_STOCK = "out_of_stock"
+    LOW_STOCK = "low_stock"
+    MISPLACED = "misplaced"
+    DAMAGED = "damaged"
+    MISSING_PRICE_TAG = "missing_price_tag"
+    OTHER = "other"
+
+
+class ShelfIssue(BaseModel):
+    type: ShelfIssueType
+    description: str = ""
+
+
+class ShelfProduct(BaseModel):
+    product_name: str = Field(min_length=1)
+    brand: Optional[str] = None
+    shelf_row: Optional[int] = Field(default=None, ge=1, description="1 = top shelf")
+    shelf_position: Optional[int] = Field(default=None, ge=1, description="1 = leftmost")
+    facings: Optional[int] = Field(default=None, ge=0)
+    issues: List[ShelfIssue] = Field(default_factory=list)
+
+
+class ShelfExtraction(BaseModel):
+    products: List[ShelfProduct] = Field(default_factory=list)
+    shelf_issues: List[ShelfIssue] = Field(default_factory=list)
+
 def encode_image_to_base64(image_url: str) -> Optional[str]:
     headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(image_url, headers=headers)
-    response.raise_for_status()  # Raise an error for bad responses
-    image_bytes = response.content
-    encoded = base64.b64encode(image_bytes).decode('utf-8')
+    with span("image.download", {"url": redact_url(image_url)}) as s:
+        response = requests.get(image_url, headers=headers)
+        s.set_attribute("http.status_code", response.status_code)
+        response.raise_for_status()  # Raise an error for bad responses
+        image_bytes = response.content
+        s.set_attribute("bytes", len(image_bytes))
+    with span("image.encode", {"bytes": len(image_bytes)}):
+        encoded = base64.b64encode(image_bytes).decode('utf-8')
     return encoded
 
 
 def construct_message(image_data: str, prompt_text: str,
                      system_message: str = "",
-                     image_format: str = "jpeg") -> List[HumanMessage]:
+                     image_format: str = "jpeg") -> List["HumanMessage"]:
+    from langchain_core.messages import HumanMessage, SystemMessage
+
     message = HumanMessage(
         content=[
             {"type": "text", "text": prompt_text},
@@ -46,15 +112,98 @@ def construct_message(image_data: str, prompt_text: str,
         return [sys_message, message]
     return [message]
 
-def chat_with_image(model: ChatWatsonx, message: HumanMessage) -> str:
+def chat_with_image(model: "ChatWatsonx", message: "HumanMessage") -> str:
     logger.info("in chat_with_image")
     try:
-        response = model.invoke(message)
+        with span("watsonx.chat", {"model": model_id}) as s:
+            response = model.invoke(message)
+            s.set_attribute("response_chars", len(response.content))
         return response.content
     except Exception as e:
         logger.error(f"Error in chat_with_image: {e}", exc_info=True)
         raise
 
+def load_watsonx_credentials():
+    global model_id
+    global api_key
+    global space_id
+
+    if is_called_from_orchestrate == True:
+        model_id = connections.key_value(CONNECTION_WATSONX_AI)['modelid']
+        api_key = connections.key_value(CONNECTION_WATSONX_AI)['apikey']
+        space_id = connections.key_value(CONNECTION_WATSONX_AI)['spaceid']
+
+def set_model_factory(factory):
+    """Makes create_watsonx_model use factory instead of ChatWatsonx (None restores ChatWatsonx)."""
+    global _model_factory
+    _model_factory = factory
+
+def create_watsonx_model(temperature: float = 0.5, max_new_tokens: int = 1000) -> "ChatWatsonx":
+    """Returns the model for these settings, created (and authenticated) once per process."""
+    if _model_factory is not None:
+        return _model_factory(temperature, max_new_tokens)
+    key = (model_id, api_key, space_id, temperature, max_new_tokens)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams
+            from langchain_ibm import ChatWatsonx
+
+            model = _models[key] = ChatWatsonx(
+                        model_id=model_id,
+                        url="https://us-south.ml.cloud.ibm.com",
+                        apikey=api_key,
+                        space_id=space_id,
+                        params={
+                            GenParams.TEMPERATURE: temperature,
+                            GenParams.MAX_NEW_TOKENS: max_new_tokens
+                        }
+            )
+        return model
+
+def build_extraction_prompt() -> str:
+    schema = json.dumps(ShelfExtraction.model_json_schema())
+    issue_types = ", ".join(issue.value for issue in ShelfIssueType)
+    return (
+        "List every product visible on the shelf in this image. "
+        "Respond with a single JSON object only, without markdown fences or commentary, "
+        f"that validates against this JSON schema: {schema}. "
+        "Number shelf rows from the top (1 = top shelf) and positions from the left (1 = leftmost). "
+        "facings is the number of identical product fronts visible side by side. "
+        f"Issue types must be one of: {issue_types}. "
+        "Use shelf_issues for problems not tied to a single product, such as empty gaps."
+    )
+
+def parse_extraction(raw: str) -> ShelfExtraction:
+    """Parses the model output into a ShelfExtraction, tolerating markdown fences and
+    leading or trailing prose around the JSON object."""
+    text = raw.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1).strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("no JSON object found in model output")
+    return ShelfExtraction.model_validate_json(text[start:end + 1])
+
+def resolve_against_catalog(extraction: ShelfExtraction) -> dict:
+    """Resolves all extracted product names against the product catalog in one batch.
+    Returns a mapping of product name to the most similar catalog rows, each with a
+    similarity score (empty if nothing in the catalog is similar). Raises OSError if
+    the catalog cannot be read."""
+    from product_resolver import get_index
+
+    queries = {}
+    for product in extraction.products:
+        name = product.product_name
+        # The brand is often read separately from the name on the label
+        if product.brand and product.brand.lower() not in name.lower():
+            name = f"{product.brand} {name}"
+        queries.setdefault(product.product_name, name)
+    candidates = get_index().resolve(list(queries.values()))
+    return dict(zip(queries, candidates))
+
+@traced
 @tool
 def generate_description_from_image(image_url: str) -> str:
     """
@@ -66,14 +215,8 @@ def generate_description_from_image(image_url: str) -> str:
     Returns:
     str: The generated description of the image.
     """
-    global model_id
-    global api_key
-    global space_id
-
-    if is_called_from_orchestrate == True:
-        model_id = connections.key_value(CONNECTION_WATSONX_AI)['modelid']
-        api_key = connections.key_value(CONNECTION_WATSONX_AI)['apikey']
-        space_id = connections.key_value(CONNECTION_WATSONX_AI)['spaceid']
+    load_watsonx_credentials()
+    start_warm_up()
 
     # Set up logging
     logging.basicConfig(
@@ -81,16 +224,7 @@ def generate_description_from_image(image_url: str) -> str:
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
 
-    watsonx_model = ChatWatsonx(
-                        model_id=model_id,
-                        url="https://us-south.ml.cloud.ibm.com",
-                        apikey=api_key,
-                        space_id=space_id,
-                        params={
-                            GenParams.TEMPERATURE: 0.5,
-                            GenParams.MAX_NEW_TOKENS: 1000
-                        }
-    )
+    watsonx_model = create_watsonx_model()
 
 
     logger.info("generate_description_from_image call for URL %s", image_url)
@@ -113,6 +247,107 @@ def generate_description_from_image(image_url: str) -> str:
 
     return description
 
+@traced
+@tool
+def extract_products_from_image(image_url: str, resolve_products: bool = False) -> dict:
+    """
+    Takes an image URL of a product shelf and returns the products on it as structured JSON,
+    so that no further parsing of a free-text description is needed.
+
+    Parameters:
+    image_url (str): The URL of the image file.
+    resolve_products (bool): If true, also find the most similar products in the product
+        catalog for each product name and include them.
+
+    Returns:
+    dict: {"products": [{"product_name", "brand", "shelf_row", "shelf_position", "facings",
+        "issues": [{"type", "description"}]}], "shelf_issues": [...]}.
+        Issue types are out_of_stock, low_stock, misplaced, damaged, missing_price_tag or other.
+        When resolve_products is true, "catalog_matches" maps each product name to its most
+        similar catalog rows, each with a similarity "score" between 0 and 1. If the catalog
+        cannot be read, "catalog_error" says why instead.
+        If the model output cannot be validated, {"error": ..., "raw_output": ...} is returned.
+    """
+    load_watsonx_credentials()
+    start_warm_up()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    watsonx_model = create_watsonx_model(temperature=EXTRACTION_TEMPERATURE, max_new_tokens=EXTRACTION_MAX_NEW_TOKENS)
+
+    logger.info("extract_products_from_image call for URL %s", image_url)
+
+    base64_image = encode_image_to_base64(image_url)
+    prompt_text = build_extraction_prompt()
+
+    extraction = None
+    raw_output = ""
+    error = ""
+    for attempt in range(STRUCTURED_MAX_RETRIES + 1):
+        if error:
+            # Show the model what was wrong with its previous answer
+            text = (
+                f"{prompt_text} Your previous answer was rejected ({error}). "
+                "Return only the corrected JSON object."
+            )
+        else:
+            text = prompt_text
+        message = construct_message(image_data=base64_image, prompt_text=text, image_format="jpeg")
+        raw_output = chat_with_image(model=watsonx_model, message=message)
+        try:
+            extraction = parse_extraction(raw_output)
+            break
+        except (ValueError, ValidationError) as e:
+            error = str(e).splitlines()[0]
+            current_span().add("retries")
+            logger.warning("Structured output rejected on attempt %d: %s", attempt + 1, error)
+
+    if extraction is None:
+        return {"error": f"Model output did not match the schema: {error}", "raw_output": raw_output}
+
+    result = extraction.model_dump(mode="json")
+    current_span().set_attribute("products", len(extraction.products))
+    if resolve_products:
+        with span("catalog.resolve", {"products": len(extraction.products)}) as s:
+            try:
+                result["catalog_matches"] = resolve_against_catalog(extraction)
+            except OSError as e:
+                # Tell the agent instead of returning no matches, which reads as "not in the catalog"
+                logger.error("Catalog resolution failed: %s", e)
+                s.set_error(str(e))
+                result["catalog_error"] = f"The product catalog is not available: {e}"
+    return result
+
+def warm_up():
+    """Creates the models both tools use, if the watsonx.ai connection can be read."""
+    # Tool workers get their connections as WXO_* environment variables; reading a
+    # connection that is not there logs an error, so only try if it is
+    if is_called_from_orchestrate and f"WXO_SECURITY_SCHEMA_{CONNECTION_WATSONX_AI}" not in os.environ:
+        return
+    try:
+        load_watsonx_credentials()
+        if model_id and api_key:
+            create_watsonx_model()
+            create_watsonx_model(temperature=EXTRACTION_TEMPERATURE, max_new_tokens=EXTRACTION_MAX_NEW_TOKENS)
+    except Exception as e:
+        logger.debug("watsonx.ai models not created during warm-up: %s", e)
+
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+
+def start_warm_up():
+    """Runs warm_up() in the background, once per process, unless TOOL_WARM_UP is off."""
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started or not WARM_UP:
+            return
+        _warm_up_started = True
+    threading.Thread(target=warm_up, name="warm_up", daemon=True).start()
+
 async def main(image_url):
     result = await generate_description_from_image(image_url)
     return result
@@ -120,6 +355,8 @@ async def main(image_url):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--url", required=True, help="Image URL")
+    parser.add_argument("--structured", action="store_true", help="Return the products as structured JSON")
+    parser.add_argument("--resolve", action="store_true", help="Resolve structured products against the product catalog")
 
     args = parser.parse_args()
 
@@ -129,5 +366,9 @@ if __name__ == "__main__":
     space_id=os.getenv("WATSONX_SPACE_ID")
     is_called_from_orchestrate=False
 
-    description = generate_description_from_image(args.url)
-    print("Generated Description:", description)
\ No newline at end of file
+    if args.structured:
+        products = extract_products_from_image(args.url, resolve_products=args.resolve)
+        print(json.dumps(products.content, indent=2))
+    else:
+        description = generate_description_from_image(args.url)
+        print("Generated Description:", description)
\ No newline at end of file
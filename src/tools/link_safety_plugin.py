@@ -1,5 +1,19 @@
+import argparse
+import copy
+import hashlib
+import http.client
+import ipaddress
+import os
 import re
-from typing import List
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urljoin, urlsplit, urlunsplit
 from ibm_watsonx_orchestrate.agent_builder.tools import tool
 from ibm_watsonx_orchestrate.agent_builder.tools.types import (
     PythonToolKind,
@@ -10,31 +24,429 @@ from ibm_watsonx_orchestrate.agent_builder.tools.types import (
     TextContent,
     Role
 )
+from tracing import current_span, propagate, span, traced
 
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
 
-SAFE_DOMAINS = [r"imgur\.com", r"i\.imgur\.com"]
-SAFE_EXTENSIONS = [r"\.png", r"\.jpg", r"\.jpeg", r"\.gif", r"\.webp"]
+# A domain also allows all of its subdomains, e.g. "imgur.com" allows "i.imgur.com".
+SAFE_DOMAINS = ["imgur.com"]
+SAFE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".gif", ".webp"]
+# Optional file with additional safe domains, one per line ('#' starts a comment)
+SAFE_DOMAINS_FILE = os.getenv("LINK_SAFETY_ALLOWLIST", "")
+
+# Optional redirect resolution: links that are not safe by their text (e.g. URL
+# shorteners) are followed with HEAD requests and judged by their final destination.
+RESOLVE_REDIRECTS = os.getenv("LINK_SAFETY_RESOLVE_REDIRECTS", "false").lower() in ("1", "true", "yes")
+# Total seconds spent resolving the links of one message
+RESOLVE_TIME_BUDGET = float(os.getenv("LINK_SAFETY_RESOLVE_BUDGET", "1.5"))
+MAX_REDIRECTS = 5
+MAX_PARALLEL_RESOLVES = 8
+VERDICT_TTL_SECONDS = float(os.getenv("LINK_SAFETY_VERDICT_TTL", "3600"))
+# Links that could not be resolved within the budget are blocked and not retried for this long
+UNRESOLVED_VERDICT_TTL_SECONDS = 60
+VERDICT_CACHE_SIZE = 10000
+
+# Digests of messages already scanned and found clean, so that each turn only scans the
+# messages that are new to this worker
+SCANNED_CACHE_SIZE = 10000
+
+# The authority is matched up to the first whitespace, "/", "\", "?" or "#", including any
+# "user@" part, so that urlsplit() reads the host a browser would connect to
+# ("https://imgur.com@evil.com" is evil.com); trailing punctuation is not part of it.
+URL_PATTERN = re.compile(r'https?://[^\s/\\?#]*[^\s/\\?#.,;:!\'")\]}>][/\w\.-]*(?:\?\S*)?')
 
 BLOCK_MESSAGE = (
     "I'm sorry, but your message contains a link that does not meet our safety requirements. "
     "Currently, I only support links from Imgur or direct image files (PNG, JPG, JPEG, GIF)."
 )
 
-def is_link_safe(url: str) -> bool:
-    """Checks if a URL is safe based on domain or file extension."""
-    for domain in SAFE_DOMAINS:
-        if re.search(domain, url, re.IGNORECASE):
+class LinkMatcher:
+    """
+    Decides whether links are safe. Each URL is parsed once; its host is checked
+    against a set of allowed domains by walking the host's label suffixes (so the
+    cost does not depend on the size of the allowlist), and the file extension is
+    checked on the parsed path.
+    """
+
+    def __init__(self, domains: Iterable[str], extensions: Iterable[str]):
+        self.domains = frozenset(d.strip().lower().strip(".") for d in domains if d.strip())
+        self.extensions = tuple(e.lower() for e in extensions)
+
+    def is_host_allowed(self, host: str) -> bool:
+        host = host.lower().rstrip(".")
+        while host:
+            if host in self.domains:
+                return True
+            dot = host.find(".")
+            if dot == -1:
+                return False
+            host = host[dot + 1:]
+        return False
+
+    def is_safe(self, url: str) -> bool:
+        try:
+            parts = urlsplit(url)
+            host = parts.hostname or ""
+        except ValueError:
+            return False
+        if self.is_host_allowed(host):
             return True
+        return parts.path.lower().endswith(self.extensions)
+
+    def find_unsafe_link(self, text: str) -> Optional[str]:
+        """Returns the first unsafe link in the text, or None if all links are safe."""
+        if "://" not in text:
+            return None
+        for match in URL_PATTERN.finditer(text):
+            if not self.is_safe(match.group(0)):
+                return match.group(0)
+        return None
+
+
+def normalize_url(url: str) -> str:
+    """Lower-cases scheme and host, drops default ports and the fragment."""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    port = parts.port
+    netloc = host if port is None or (scheme, port) in (("http", 80), ("https", 443)) else f"{host}:{port}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+class VerdictCache:
+    """Thread-safe LRU cache of link verdicts with a time to live."""
+
+    def __init__(self, ttl: float = VERDICT_TTL_SECONDS, max_entries: int = VERDICT_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bool]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, verdict = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return verdict
+
+    def put(self, key: str, verdict: bool, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), verdict)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def public_address(hostname: str, allow_private: bool = False) -> str:
+    """
+    Resolves the host name once and returns the address to connect to. Raises ValueError
+    unless every address of the host is public: loopback, private (RFC 1918), link-local
+    (e.g. the 169.254.169.254 metadata service), shared, reserved and multicast addresses
+    are not public.
+    """
+    try:
+        infos = socket.getaddrinfo(hostname, None, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ValueError(f"cannot resolve {hostname!r}: {e}")
+    if not infos:
+        raise ValueError(f"cannot resolve {hostname!r}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not allow_private and (not address.is_global or address.is_multicast):
+            raise ValueError(f"refusing to request {hostname!r}: not a public address")
+    return infos[0][4][0]
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """An HTTP connection to an address resolved beforehand; Host still names the host."""
+
+    def __init__(self, host: str, address: str, port: int, timeout: float):
+        super().__init__(host, port, timeout=timeout)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """An HTTPS connection to an address resolved beforehand; SNI, Host and the
+    certificate check still use the host name."""
 
-    for ext in SAFE_EXTENSIONS:
-        if re.search(ext + r"(\?.*)?$", url, re.IGNORECASE):
+    def __init__(self, host: str, address: str, port: int, timeout: float):
+        self.ssl_context = ssl.create_default_context()
+        super().__init__(host, port, timeout=timeout, context=self.ssl_context)
+        self.address = address
+
+    def connect(self):
+        sock = socket.create_connection((self.address, self.port), self.timeout)
+        self.sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+
+
+class RedirectResolver:
+    """
+    Follows a redirect chain hop by hop with HEAD requests, within a deadline. Only
+    http and https URLs on hosts with public addresses are requested, so that a pasted
+    link cannot make the runtime call itself or its internal network; a chain that
+    would leave them raises ValueError and counts as unresolved. Each host is resolved
+    once and the request goes to the address that was checked, so a DNS answer that
+    changes between the check and the request (DNS rebinding) cannot redirect it.
+    """
+
+    def __init__(self, matcher: "LinkMatcher", max_redirects: int = MAX_REDIRECTS, allow_private: bool = False):
+        self.matcher = matcher
+        self.max_redirects = max_redirects
+        # Only for the local stand-in server of the benchmark
+        self.allow_private = allow_private
+
+    def _next_location(self, parts, address: str, timeout: float) -> Optional[str]:
+        if parts.scheme == "https":
+            connection = _PinnedHTTPSConnection(parts.hostname, address, parts.port or 443, timeout)
+        else:
+            connection = _PinnedHTTPConnection(parts.hostname, address, parts.port or 80, timeout)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        try:
+            connection.request("HEAD", target, headers={"User-Agent": "Mozilla/5.0"})
+            response = connection.getresponse()
+            if 300 <= response.status < 400:
+                return response.getheader("Location")
+            # Error pages (including 405 for servers without HEAD) end the chain
+            return None
+        finally:
+            connection.close()
+
+    def resolve(self, url: str, deadline: float) -> str:
+        """Returns the final URL. Stops early at hosts on the allowlist."""
+        current = url
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(current)
+            if parts.scheme not in ("http", "https"):
+                raise ValueError(f"refusing to follow a {parts.scheme or 'relative'} link from {url}")
+            host = parts.hostname or ""
+            if self.matcher.is_host_allowed(host):
+                return current
+            address = public_address(host, self.allow_private)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"time budget exhausted resolving {url}")
+            location = self._next_location(parts, address, remaining)
+            if not location:
+                return current
+            current = urljoin(current, location)
+        raise ValueError(f"too many redirects for {url}")
+
+
+class LinkVerifier:
+    """
+    Checks all links of a message. Without a resolver, links are judged by their text.
+    With a resolver, links that fail the text check are followed to their final
+    destination concurrently, within a time budget per message; their verdicts are
+    cached by normalized URL so repeated links are not resolved again.
+    """
+
+    def __init__(self, matcher: "LinkMatcher", resolver: Optional[RedirectResolver] = None,
+                 cache: Optional[VerdictCache] = None, time_budget: float = RESOLVE_TIME_BUDGET):
+        self.matcher = matcher
+        self.resolver = resolver
+        self.cache = cache if cache is not None else VerdictCache()
+        self.time_budget = time_budget
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_RESOLVES,
+                                                    thread_name_prefix="link_safety")
+            return self._executor
+
+    def _resolved_verdict(self, url: str, deadline: float) -> bool:
+        final_url = self.resolver.resolve(url, deadline)
+        return self.matcher.is_safe(final_url)
+
+    def verdicts(self, links: Iterable[str]) -> Dict[str, bool]:
+        """Returns a verdict (True = safe) for every distinct link."""
+        verdicts = {}
+        pending = {}
+        for link in links:
+            if link in verdicts or link in pending:
+                continue
+            if self.matcher.is_safe(link):
+                verdicts[link] = True
+            elif self.resolver is None:
+                verdicts[link] = False
+            else:
+                try:
+                    key = normalize_url(link)
+                except ValueError:
+                    verdicts[link] = False
+                    continue
+                cached = self.cache.get(key)
+                if cached is not None:
+                    verdicts[link] = cached
+                else:
+                    pending[link] = key
+
+        current_span().add("links", len(verdicts) + len(pending))
+        if pending:
+            with span("links.resolve", {"links": len(pending)}) as s:
+                deadline = time.monotonic() + self.time_budget
+                executor = self._get_executor()
+                resolve = propagate(self._resolved_verdict)
+                futures = {link: executor.submit(resolve, link, deadline) for link in pending}
+                wait(futures.values(), timeout=self.time_budget)
+                for link, future in futures.items():
+                    if future.done() and future.exception() is None:
+                        verdicts[link] = future.result()
+                        self.cache.put(pending[link], verdicts[link])
+                    else:
+                        # Unresolved within the budget: keep the verdict of the text check
+                        verdicts[link] = False
+                        self.cache.put(pending[link], False, ttl=UNRESOLVED_VERDICT_TTL_SECONDS)
+                        s.add("unresolved")
+        return verdicts
+
+    def find_unsafe_link(self, text: str) -> Optional[str]:
+        """Returns the first unsafe link in the text, or None if all links are safe."""
+        if "://" not in text:
+            return None
+        if self.resolver is None:
+            return self.matcher.find_unsafe_link(text)
+        links = URL_PATTERN.findall(text)
+        verdicts = self.verdicts(links)
+        for link in links:
+            if not verdicts[link]:
+                return link
+        return None
+
+
+def content_text(content) -> str:
+    """
+    Collects the text of any message content that can carry links: plain strings,
+    text and JSON content, resource URIs and text, and lists of content parts.
+    Binary parts such as images contribute nothing.
+    """
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, TextContent):
+        return content.text
+    if isinstance(content, (list, tuple)):
+        return "\n".join(filter(None, (content_text(part) for part in content)))
+    if isinstance(content, dict):
+        return "\n".join(filter(None, (content_text(value) for value in content.values())))
+    parts = []
+    for attribute in ("text", "uri"):
+        value = getattr(content, attribute, None)
+        if isinstance(value, (str, list, tuple, dict)):
+            parts.append(content_text(value))
+    return "\n".join(filter(None, parts))
+
+
+class ScannedMessages:
+    """Thread-safe LRU set of the digests of message texts that were found clean."""
+
+    def __init__(self, max_entries: int = SCANNED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def __contains__(self, digest: bytes) -> bool:
+        with self._lock:
+            if digest not in self._entries:
+                return False
+            self._entries.move_to_end(digest)
             return True
 
-    return False
+    def add(self, digest: bytes):
+        with self._lock:
+            self._entries[digest] = True
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def is_block_reply(message: Message) -> bool:
+    return message.role == Role.ASSISTANT and content_text(message.content) == BLOCK_MESSAGE
+
 
+def find_unsafe_link_in_history(messages: List[Message]) -> Optional[str]:
+    """
+    Returns the first unsafe link in the conversation. Every user message is checked,
+    as is the last message whatever its role; other assistant messages are not, since
+    they legitimately cite web sources. A message answered with BLOCK_MESSAGE was
+    blocked on its own turn and is not reported again.
+    Messages found clean before are only hashed, not scanned, so a turn costs a hash
+    per earlier message plus a scan of the new ones. The digests only save work: a
+    worker that has not seen a message scans it and reaches the same verdict.
+    """
+    last_index = len(messages) - 1
+    scanned = 0
+    unsafe_link = None
+    for index, message in enumerate(messages):
+        if message.role != Role.USER and index != last_index:
+            continue
+        if index < last_index and is_block_reply(messages[index + 1]):
+            continue
+        text = content_text(message.content)
+        if not text:
+            continue
+        digest = ScannedMessages.digest(text)
+        if digest in scanned_messages:
+            continue
+        scanned += 1
+        unsafe_link = link_verifier.find_unsafe_link(text)
+        if unsafe_link is not None:
+            break
+        scanned_messages.add(digest)
+    current_span().set_attributes({"messages": len(messages), "messages_scanned": scanned})
+    return unsafe_link
+
+
+def load_domains_file(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.split("#", 1)[0].strip() for line in f if line.split("#", 1)[0].strip()]
+
+
+def replace_last_message(payload, message: Message):
+    """
+    Returns a copy of the payload whose last message is replaced. Only the message
+    list is new; all other messages and fields are shared with the original payload,
+    which is left unchanged.
+    """
+    return payload.model_copy(update={"messages": [*payload.messages[:-1], message]})
+
+
+link_matcher = LinkMatcher(
+    SAFE_DOMAINS + (load_domains_file(SAFE_DOMAINS_FILE) if SAFE_DOMAINS_FILE else []),
+    SAFE_EXTENSIONS
+)
+
+link_verifier = LinkVerifier(
+    link_matcher,
+    RedirectResolver(link_matcher) if RESOLVE_REDIRECTS else None
+)
+
+scanned_messages = ScannedMessages()
+
+def is_link_safe(url: str) -> bool:
+    """Checks if a URL is safe based on domain or file extension."""
+    return link_matcher.is_safe(url)
+
+@traced
 @tool(
     description="Checks user input for URLs and blocks unsafe links.",
     kind=PythonToolKind.AGENTPREINVOKE,
@@ -51,44 +463,208 @@ def link_safety_plugin(
             modified_payload=agent_pre_invoke_payload
         )
 
-    last_msg = agent_pre_invoke_payload.messages[-1]
+    # 2. Scan the messages not scanned before, including non-text content
+    unsafe_link = find_unsafe_link_in_history(agent_pre_invoke_payload.messages)
 
-    # Extract text content safely
-    if hasattr(last_msg.content, 'text'):
-        user_text = last_msg.content.text
-    elif isinstance(last_msg.content, str):
-        user_text = last_msg.content
-    else:
-        user_text = ""
+    if unsafe_link is not None:
+        # BLOCK LOGIC
+        block_content = TextContent(type="text", text=BLOCK_MESSAGE)
+        block_msg = Message(role=Role.ASSISTANT, content=block_content)
+
+        new_payload = replace_last_message(agent_pre_invoke_payload, block_msg)
 
-    # 2. Handle empty text
-    if not user_text:
         return AgentPreInvokeResult(
-            continue_processing=True, 
-            modified_payload=agent_pre_invoke_payload
+            continue_processing=False, 
+            modified_payload=new_payload
         )
 
-    url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*(?:\?\S*)?'
-    found_links = re.findall(url_pattern, user_text)
-
-    if found_links:
-        for link in found_links:
-            if not is_link_safe(link):
-                # BLOCK LOGIC
-                block_content = TextContent(type="text", text=BLOCK_MESSAGE)
-                block_msg = Message(role=Role.ASSISTANT, content=block_content)
-
-                new_payload = agent_pre_invoke_payload.model_copy(deep=True)
-                new_payload.messages[-1] = block_msg
-
-                return AgentPreInvokeResult(
-                    continue_processing=False, 
-                    modified_payload=new_payload
-                )
-
     # 3. SUCCESS CASE (Safe links or no links)
     # CRITICAL FIX: You must return the payload here, otherwise the agent receives nothing.
     return AgentPreInvokeResult(
         continue_processing=True, 
         modified_payload=agent_pre_invoke_payload
-    )
\ No newline at end of file
+    )
+
+
+def run_benchmark(domain_count: int, message_count: int, links_per_message: int, filler_words: int):
+    """Compares the regex-per-pattern link check with LinkMatcher on large messages."""
+
+    domains = [f"shop{i}.example{i % 97}.com" for i in range(domain_count)] + SAFE_DOMAINS
+    domain_patterns = [re.escape(d) for d in domains]
+    extension_patterns = [re.escape(e) for e in SAFE_EXTENSIONS]
+
+    def regex_is_link_safe(url):
+        for domain in domain_patterns:
+            if re.search(domain, url, re.IGNORECASE):
+                return True
+        for ext in extension_patterns:
+            if re.search(ext + r"(\?.*)?$", url, re.IGNORECASE):
+                return True
+        return False
+
+    def regex_find_unsafe(text):
+        for link in re.findall(URL_PATTERN.pattern, text):
+            if not regex_is_link_safe(link):
+                return link
+        return None
+
+    filler = " ".join(["shelf"] * filler_words)
+    messages = []
+    for m in range(message_count):
+        links = [
+            f"https://cdn{m}.shop{(m * links_per_message + k) % domain_count}.example"
+            f"{((m * links_per_message + k) % domain_count) % 97}.com/p/{k}?ref=x"
+            for k in range(links_per_message)
+        ]
+        # Every tenth message ends in a link that must be blocked
+        tail = " https://scam.example.net/login" if m % 10 == 9 else " https://i.imgur.com/a.jpeg"
+        messages.append(f"{filler} " + f" {filler} ".join(links) + tail)
+
+    matcher = LinkMatcher(domains, SAFE_EXTENSIONS)
+    for name, check in (("regex per pattern", regex_find_unsafe), ("LinkMatcher", matcher.find_unsafe_link)):
+        start = time.perf_counter()
+        unsafe = sum(1 for text in messages if check(text) is not None)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>18}: {elapsed * 1000 / message_count:8.3f} ms/message, {unsafe} blocked")
+
+
+def run_payload_benchmark(lengths: List[int], repeat: int):
+    """
+    Compares deep-copying the payload with replace_last_message when blocking a link,
+    for conversations of different lengths, and checks that the caller's payload is
+    not modified.
+    """
+    text = "Here is the shelf photo you asked about. " * 50
+    for length in lengths:
+        messages = [
+            Message(role=Role.USER if i % 2 == 0 else Role.ASSISTANT, content=TextContent(type="text", text=text))
+            for i in range(length - 1)
+        ]
+        messages.append(Message(role=Role.USER, content=TextContent(type="text", text="see https://scam.example.net")))
+        payload = AgentPreInvokePayload(agent_id="benchmark", messages=messages)
+        snapshot = copy.deepcopy(payload.model_dump())
+        block_msg = Message(role=Role.ASSISTANT, content=TextContent(type="text", text=BLOCK_MESSAGE))
+
+        def deep_copy():
+            new_payload = payload.model_copy(deep=True)
+            new_payload.messages[-1] = block_msg
+            return new_payload
+
+        timings = []
+        for build in (deep_copy, lambda: replace_last_message(payload, block_msg)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                new_payload = build()
+            timings.append((time.perf_counter() - start) * 1e6 / repeat)
+            assert new_payload.messages[-1] is block_msg
+        assert payload.model_dump() == snapshot, "caller's payload was modified"
+        print(f"{length:6d} messages: deep copy {timings[0]:10.1f} us, shared {timings[1]:8.1f} us")
+
+
+def run_history_benchmark(lengths: List[int]):
+    """
+    Times the check of a conversation on a worker that has not seen it and on the next
+    turn, when only the new message is scanned, and checks which old links are reported.
+    """
+    global scanned_messages
+    text = "Here is the shelf photo https://i.imgur.com/qfiugNJ.jpeg, what do you see? " * 20
+    for length in lengths:
+        messages = [
+            Message(role=Role.USER if i % 2 == 0 else Role.ASSISTANT, content=TextContent(type="text", text=f"{i} {text}"))
+            for i in range(length)
+        ]
+        scanned_messages = ScannedMessages()
+        start = time.perf_counter()
+        find_unsafe_link_in_history(messages)
+        cold = (time.perf_counter() - start) * 1000
+        messages.append(Message(role=Role.USER, content=TextContent(type="text", text=f"next {text}")))
+        start = time.perf_counter()
+        find_unsafe_link_in_history(messages)
+        warm = (time.perf_counter() - start) * 1000
+        print(f"{length:6d} messages: unseen conversation {cold:8.2f} ms, next turn {warm:6.2f} ms")
+
+    def user(content):
+        return Message(role=Role.USER, content=TextContent(type="text", text=content))
+
+    def assistant(content):
+        return Message(role=Role.ASSISTANT, content=TextContent(type="text", text=content))
+
+    scanned_messages = ScannedMessages()
+    unsafe = "see https://scam.example.net/login"
+    old_unsafe = [user(unsafe), assistant("Sure."), user("thanks")]
+    blocked_before = [user(unsafe), assistant(BLOCK_MESSAGE), user("thanks")]
+    assert find_unsafe_link_in_history(old_unsafe) == "https://scam.example.net/login"
+    assert find_unsafe_link_in_history(blocked_before) is None
+    print("unsafe link in an earlier message: blocked; already blocked on its turn: allowed")
+
+
+class _StandInRedirectHandler(BaseHTTPRequestHandler):
+    """Local stand-in for URL shorteners: /good redirects to Imgur, /bad to an unsafe
+    page through a second hop, and /slow answers after the resolve budget."""
+
+    def do_HEAD(self):
+        path = urlsplit(self.path).path
+        if path == "/good":
+            self.send_response(301)
+            self.send_header("Location", "https://i.imgur.com/qfiugNJ.jpeg")
+        elif path == "/bad":
+            self.send_response(302)
+            self.send_header("Location", "/hop")
+        elif path == "/hop":
+            self.send_response(302)
+            self.send_header("Location", "/landing")
+        elif path == "/slow":
+            time.sleep(RESOLVE_TIME_BUDGET * 2)
+            self.send_response(200)
+        else:
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_resolver_benchmark(repeat: int):
+    """Resolves shortened links against a local stand-in server, cold and cached."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInRedirectHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    verifier = LinkVerifier(link_matcher, RedirectResolver(link_matcher, allow_private=True), VerdictCache())
+    try:
+        for path in ("/good", "/bad", "/slow"):
+            text = f"Please check {base}{path} and {base}{path}?ref=1"
+            start = time.perf_counter()
+            unsafe = verifier.find_unsafe_link(text)
+            cold = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            for _ in range(repeat):
+                verifier.find_unsafe_link(text)
+            warm = (time.perf_counter() - start) * 1000 / repeat
+            verdict = "blocked" if unsafe else "allowed"
+            print(f"{path:>6}: {verdict}, first check {cold:8.2f} ms, repeated {warm:6.3f} ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the link safety check.")
+    parser.add_argument("--mode", choices=["links", "payload", "resolve", "history"], default="links",
+                        help="Benchmark link matching, building the blocked payload, redirect resolution "
+                             "or the conversation history check")
+    parser.add_argument("--domains", type=int, default=2000, help="Size of the safe domain allowlist")
+    parser.add_argument("--messages", type=int, default=50, help="Number of messages to check")
+    parser.add_argument("--links", type=int, default=20, help="Links per message")
+    parser.add_argument("--filler", type=int, default=500, help="Filler words between links")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Conversation lengths for the payload and history benchmarks")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per payload benchmark")
+    args = parser.parse_args()
+
+    if args.mode == "payload":
+        run_payload_benchmark(args.lengths, args.repeat)
+    elif args.mode == "resolve":
+        run_resolver_benchmark(args.repeat)
+    elif args.mode == "history":
+        run_history_benchmark(args.lengths)
+    else:
+        run_benchmark(args.domains, args.messages, args.links, args.filler)
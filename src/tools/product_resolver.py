@@ -0,0 +1,429 @@
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from ibm_watsonx_orchestrate.agent_builder.tools import ToolPermission, tool
+from tracing import current_span, traced
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------ Fuzzy resolution of names to catalog rows -----------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+
+# Product names read off a shelf image ("Tech Gear Pro Mouse", "Echowave speaker") rarely
+# match the catalog exactly. The name, sku and supplier of every catalog row are indexed at
+# load time as separate TF-IDF vectors of their words and of the character trigrams of
+# each word, and a name resolves to the rows whose best field has the highest cosine
+# similarity (weighted by the field). Trigrams make the match tolerant of typos, split or
+# joined words and missing suffixes; scoring the fields separately keeps a long supplier
+# name from diluting a good match on the product name.
+#
+# The catalog is samples/tools/products.csv, the one search_product (table_search.py)
+# reads. import-all.sh copies it next to this file, so that it ships in the tool package;
+# in the repository, the resolver reads it where it is.
+SHARED_PRODUCTS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "samples", "tools", "products.csv")
+PRODUCTS_CSV = os.getenv(
+    "PRODUCTS_CSV",
+    os.path.normpath(SHARED_PRODUCTS_CSV) if os.path.exists(SHARED_PRODUCTS_CSV)
+    else os.path.join(os.path.dirname(os.path.abspath(__file__)), "products.csv")
+)
+
+# Weight of each field's similarity in a row's score
+FIELD_WEIGHTS = {"name": 1.0, "sku": 1.0, "supplier": 0.5}
+NGRAM = 3
+# The last word of a name usually says what the product is ("mouse", "keyboard"), so it
+# weighs more than the brand and model words before it
+HEAD_WORD_WEIGHT = 1.5
+
+DEFAULT_TOP_K = 3
+# Candidates less similar than this are not returned. On the sample catalog, names of
+# catalog products score 0.25 and more against them and unrelated names 0.1 or less.
+MIN_SCORE = 0.2
+MAX_TOP_K = 20
+MAX_NAMES = 200
+# Fields scored exactly per name, after a first pass over the rarer features
+CANDIDATES_PER_NAME = 512
+# Features found in more than this share of the fields (e.g. the trigram "ing") are
+# skipped when collecting candidates; they still count when the candidates are scored
+COMMON_FEATURE_SHARE = 0.02
+# Only features with more fields than this can be skipped, so small catalogs use them all
+COMMON_FEATURE_MIN_FIELDS = 1000
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _token_features(token: str) -> List[str]:
+    padded = f"#{token}#"
+    return [f"w:{token}"] + [f"g:{padded[i:i + NGRAM]}" for i in range(len(padded) - NGRAM + 1)]
+
+
+def extract_features(text: str) -> List[str]:
+    """
+    The words of a text ("w:mouse") and the character trigrams of each word, padded at
+    both ends ("g:#mo", "g:mou", ..., "g:se#"), so that "keybord" still shares most
+    features with "keyboard" and "Tech Gear" with "TechGear".
+    """
+    return [feature for token in _tokens(text) for feature in _token_features(token)]
+
+
+class ProductIndex:
+    """
+    TF-IDF vectors of the catalog fields (one per non-empty name, sku and supplier),
+    stored as a feature -> fields inverted index and a field -> features forward index
+    (both as flat numpy arrays with offsets).
+    resolve() answers a batch of names in two vectorized passes: candidate fields are
+    collected from the postings of each name's rarer features, then scored exactly from
+    their forward index entries and reduced to the best field of each row.
+    """
+
+    def __init__(self, rows: List[dict], fields: Dict[str, float] = None):
+        self.rows = rows
+        self.fields = fields or FIELD_WEIGHTS
+        vocabulary: Dict[str, int] = {}
+        doc_rows, doc_weights, pair_docs, pair_features = [], [], [], []
+        for row_id, row in enumerate(rows):
+            for field, field_weight in self.fields.items():
+                features = {vocabulary.setdefault(f, len(vocabulary)) for f in extract_features(row.get(field) or "")}
+                if not features:
+                    continue
+                pair_docs.extend([len(doc_rows)] * len(features))
+                pair_features.extend(features)
+                doc_rows.append(row_id)
+                doc_weights.append(field_weight)
+
+        self.vocabulary = vocabulary
+        # Each indexed field is a document of its own; doc d belongs to row _doc_rows[d]
+        self._doc_rows = np.asarray(doc_rows, dtype=np.int64)
+        self._doc_weights = np.asarray(doc_weights, dtype=np.float32)
+        n = len(doc_rows)
+        pair_docs = np.asarray(pair_docs, dtype=np.int64)
+        pair_features = np.asarray(pair_features, dtype=np.int32)
+        document_frequency = np.bincount(pair_features, minlength=len(vocabulary))
+        self._unknown_idf = math.log(n + 1) + 1
+        self.idf = (np.log((n + 1) / (document_frequency + 1)) + 1).astype(np.float32)
+        pair_weights = self.idf[pair_features]
+        self.norms = np.sqrt(np.bincount(pair_docs, weights=pair_weights ** 2, minlength=n)).astype(np.float32)
+        self._common = document_frequency > max(COMMON_FEATURE_MIN_FIELDS, COMMON_FEATURE_SHARE * n)
+
+        # Inverted index: docs and weights of feature f are at _post_offsets[f]:_post_offsets[f + 1]
+        order = np.argsort(pair_features, kind="stable")
+        self._post_docs = pair_docs[order]
+        self._post_weights = pair_weights[order]
+        self._post_offsets = np.concatenate([[0], np.cumsum(document_frequency)])
+        # Forward index: features and weights of doc d are at _doc_offsets[d]:_doc_offsets[d + 1]
+        # (the pairs were added doc by doc)
+        self._doc_features = pair_features
+        self._doc_feature_weights = pair_weights
+        self._doc_offsets = np.concatenate([[0], np.cumsum(np.bincount(pair_docs, minlength=n))])
+
+    def _query_vector(self, name: str):
+        """Known feature ids of a name (sorted) with their weights, and the vector norm."""
+        tokens = _tokens(name)
+        boosts: Dict[str, float] = {}
+        for i, token in enumerate(tokens):
+            boost = HEAD_WORD_WEIGHT if len(tokens) > 1 and i == len(tokens) - 1 else 1.0
+            for feature in _token_features(token):
+                boosts[feature] = max(boosts.get(feature, 0.0), boost)
+        known = sorted((self.vocabulary[f], boost) for f, boost in boosts.items() if f in self.vocabulary)
+        ids = np.asarray([feature_id for feature_id, _ in known], dtype=np.int64)
+        weights = self.idf[ids] * np.asarray([boost for _, boost in known], dtype=np.float32)
+        # Features the catalog does not have (typos, other words) still lengthen the vector
+        unknown = sum(boost ** 2 for f, boost in boosts.items() if f not in self.vocabulary)
+        norm = math.sqrt(float((weights ** 2).sum()) + unknown * self._unknown_idf ** 2)
+        return ids, weights, norm
+
+    def resolve(self, names: List[str], top_k: int = DEFAULT_TOP_K) -> List[List[dict]]:
+        """Returns the top_k catalog rows of each name with their similarity (0-1), best first."""
+        n = len(self._doc_rows)
+        queries = [self._query_vector(name) for name in names]
+
+        # First pass: dot products over the rarer features of every name at once
+        keys, contributions = [], []
+        for q, (ids, weights, _) in enumerate(queries):
+            selected = ~self._common[ids] if len(ids) else ids.astype(bool)
+            if len(ids) and not selected.any():
+                selected[:] = True
+            for feature_id, weight in zip(ids[selected], weights[selected]):
+                start, end = self._post_offsets[feature_id], self._post_offsets[feature_id + 1]
+                keys.append(self._post_docs[start:end] + q * n)
+                contributions.append(self._post_weights[start:end] * weight)
+        if not keys:
+            return [[] for _ in names]
+        pairs, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        partial = np.bincount(inverse, weights=np.concatenate(contributions))
+        query_ids, doc_ids = np.divmod(pairs, n)
+        partial *= self._doc_weights[doc_ids] / self.norms[doc_ids]
+
+        # Second pass: exact cosine of the best candidate fields of each name, then the
+        # best field of each row
+        bounds = np.searchsorted(query_ids, np.arange(len(names) + 1))
+        results = []
+        for q, (ids, weights, norm) in enumerate(queries):
+            start, end = bounds[q], bounds[q + 1]
+            if start == end:
+                results.append([])
+                continue
+            candidates = doc_ids[start:end]
+            if end - start > CANDIDATES_PER_NAME:
+                candidates = candidates[np.argpartition(-partial[start:end], CANDIDATES_PER_NAME)[:CANDIDATES_PER_NAME]]
+            scores = self._cosine(candidates, ids, weights, norm) * self._doc_weights[candidates]
+            order = np.argsort(-scores, kind="stable")
+            # The first occurrence of a row in score order is its best field
+            _, first = np.unique(self._doc_rows[candidates[order]], return_index=True)
+            best = order[np.sort(first)][:top_k]
+            results.append([
+                dict(self.rows[self._doc_rows[candidates[i]]], score=round(float(scores[i]), 3))
+                for i in best if scores[i] >= MIN_SCORE
+            ])
+        return results
+
+    def _cosine(self, candidates: np.ndarray, ids: np.ndarray, weights: np.ndarray, norm: float) -> np.ndarray:
+        starts, ends = self._doc_offsets[candidates], self._doc_offsets[candidates + 1]
+        lengths = ends - starts
+        # Positions of all features of all candidates in the flat forward index
+        owner = np.repeat(np.arange(len(candidates)), lengths)
+        positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+        features = self._doc_features[positions]
+        # Look the features up in the (sorted) query vector
+        slot = np.minimum(np.searchsorted(ids, features), len(ids) - 1)
+        shared = ids[slot] == features
+        dots = np.bincount(owner[shared], weights=self._doc_feature_weights[positions][shared] * weights[slot][shared],
+                           minlength=len(candidates))
+        return dots / np.maximum(self.norms[candidates] * norm, 1e-9)
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self.rows),
+            "fields": len(self._doc_rows),
+            "features": len(self.vocabulary),
+            "index_bytes": int(self._post_docs.nbytes + self._post_weights.nbytes + self._doc_features.nbytes
+                               + self._doc_feature_weights.nbytes + self.norms.nbytes + self._doc_rows.nbytes),
+        }
+
+
+def load_rows(path: str = None) -> List[dict]:
+    with open(path or PRODUCTS_CSV, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> ProductIndex:
+    """Returns the shared index of the products CSV, rebuilt when the file changes."""
+    global _index, _index_mtime
+    with _index_lock:
+        mtime = os.path.getmtime(PRODUCTS_CSV)
+        if _index is None or mtime != _index_mtime:
+            _index = ProductIndex(load_rows())
+            _index_mtime = mtime
+        return _index
+
+
+@traced
+@tool(
+    name="resolve_products",
+    description="""
+        Find the catalog products that best match one or more product names, for example
+        the product names found on a shelf image.
+
+        Unlike search_product, the names do not have to match exactly: spelling mistakes,
+        missing or extra words, split or joined words and SKU fragments are tolerated.
+        Pass all names at once. For each name the best matching products are returned with
+        a similarity score between 0 and 1 (1 = same name). The product itself usually scores
+        above 0.6; candidates below about 0.5 are only similar products (same brand or same
+        kind of product), and a name without any candidates is not in the catalog.
+
+        Each product record contains the same fields as search_product returns, plus score.
+        """,
+    permission=ToolPermission.READ_ONLY
+)
+def resolve_products(names: List[str], top_k: int = DEFAULT_TOP_K) -> dict:
+    """
+    Resolve product names to catalog products by similarity.
+
+    Args:
+        names (List[str]): The product names to resolve (up to 200)
+        top_k (int): Number of candidates per name (1-20, default 3)
+
+    Returns:
+        dict: A dictionary containing either:
+            - Success: {'status': 200, 'results': [{'name': str, 'candidates': List[dict]}], 'count': int}
+            - Error: {'status': int, 'error': str, 'message': str, 'outward': str}
+
+    Example:
+        >>> resolve_products(names=["Tech Gear mouse", "echowave speakr"])
+        {'status': 200, 'results': [{'name': 'Tech Gear mouse', 'candidates': [{'sku': 'TGM-MSE-001', ..., 'score': 0.693}, ...]}, ...], 'count': 2}
+    """
+    names = [name.strip() for name in names or [] if name and name.strip()]
+    if not names:
+        return {
+            "status": 400,
+            "error": "Bad Request",
+            "message": "No product names given.",
+            "outward": "Please provide at least one product name to look for."
+        }
+    if len(names) > MAX_NAMES:
+        return {
+            "status": 400,
+            "error": "Bad Request",
+            "message": f"Too many product names: {len(names)} (at most {MAX_NAMES}).",
+            "outward": f"Please resolve at most {MAX_NAMES} product names at a time."
+        }
+    top_k = max(1, min(int(top_k), MAX_TOP_K))
+
+    try:
+        index = get_index()
+    except FileNotFoundError:
+        return {
+            "status": 500,
+            "error": "File Not Found",
+            "message": f"Products CSV file not found at {PRODUCTS_CSV}",
+            "outward": "Unable to access product catalog. Please contact support."
+        }
+
+    candidates = index.resolve(names, top_k)
+    current_span().set_attributes({
+        "names": len(names),
+        "rows": len(index.rows),
+        "resolved": sum(1 for found in candidates if found),
+    })
+    return {
+        "status": 200,
+        "results": [{"name": name, "candidates": found} for name, found in zip(names, candidates)],
+        "count": len(names)
+    }
+
+
+# ------------------------------------- Benchmark ------------------------------------------
+
+def synthetic_catalog(size: int, seed: int = 49) -> List[dict]:
+    """`size` made-up catalog rows built from the words of the sample catalog."""
+    rng = random.Random(seed)
+    sample = load_rows()
+    brands = sorted({row["name"].split()[0] for row in sample})
+    words = sorted({word for row in sample for word in row["name"].split()[1:]})
+    suppliers = sorted({row["supplier"] for row in sample})
+    syllables = ["ax", "bel", "cor", "dyn", "el", "fin", "gro", "hal", "ion", "jet", "kin", "lum", "mor", "nex",
+                 "or", "pix", "qua", "ro", "syn", "tek", "ul", "vox", "wav", "xi", "yor", "zen"]
+    rows = []
+    for i in range(size):
+        brand = rng.choice(brands) if rng.random() < 0.2 else \
+            "".join(rng.choice(syllables) for _ in range(rng.randint(2, 3))).capitalize()
+        name = f"{brand} {' '.join(rng.sample(words, rng.randint(1, 3)))}"
+        rows.append({
+            "product_id": f"PRD-{i:07d}",
+            "sku": f"{brand[:4].upper()}-{rng.choice(words)[:3].upper()}-{i:07d}",
+            "name": name,
+            "supplier": rng.choice(suppliers),
+        })
+    return rows
+
+
+def with_typo(name: str, rng: random.Random) -> str:
+    """The name with one character dropped, doubled or swapped with its neighbour."""
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 2)
+    edit = rng.choice(["drop", "double", "swap"])
+    if edit == "drop":
+        return name[:i] + name[i + 1:]
+    if edit == "double":
+        return name[:i] + name[i] + name[i:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+# Names and the catalog rows expected among their top candidates on the sample
+# products.csv (None: no candidates at all), as (name, first, also in the top 3)
+SAMPLE_CHECKS = [
+    ("Tech Gear Pro mouse", "TechGear Pro Mouse", []),
+    ("echowave portable speakr", "EchoWave Portable Speaker", []),
+    ("VIZN-MON", "ViznView 27-inch Monitor", []),
+    ("TGM-MSE-001", "TechGear Pro Mouse", []),
+    ("usb c cable", "LinkCord USB-C 6ft", []),
+    ("Wireles Mouse", None, ["TechGear Pro Mouse", "PrecisionClick Gaming Mouse"]),
+    ("TechGear keybord", None, ["MechType RGB Keyboard", "TypeMaster Mechanical Keyboard"]),
+    ("banana smoothie", None, None),
+]
+
+
+def run_check() -> bool:
+    """Resolves SAMPLE_CHECKS against the products CSV; returns whether all passed."""
+    names = [name for name, _, _ in SAMPLE_CHECKS]
+    passed = True
+    for (name, first, expected), found in zip(SAMPLE_CHECKS, get_index().resolve(names, DEFAULT_TOP_K)):
+        found_names = [candidate["name"] for candidate in found]
+        if expected is None:
+            ok = not found
+        else:
+            ok = (first is None or found_names[:1] == [first]) and all(e in found_names for e in expected)
+        passed &= ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name!r}: {[(c['name'], c['score']) for c in found]}")
+    return passed
+
+
+def run_benchmark(size: int, batch: int, rounds: int):
+    rng = random.Random(0)
+    rows = synthetic_catalog(size)
+    start = time.perf_counter()
+    index = ProductIndex(rows)
+    print(f"Indexed {size} rows in {time.perf_counter() - start:.1f}s:", index.stats())
+
+    timings = []
+    correct = 0
+    for _ in range(rounds):
+        targets = [rng.randrange(size) for _ in range(batch)]
+        names = [with_typo(rows[t]["name"].lower(), rng) for t in targets]
+        start = time.perf_counter()
+        results = index.resolve(names, DEFAULT_TOP_K)
+        timings.append((time.perf_counter() - start) / batch)
+        # Synthetic rows can share a name, so any row with the target's name counts
+        correct += sum(
+            1 for t, found in zip(targets, results)
+            if any(candidate["name"] == rows[t]["name"] for candidate in found)
+        )
+    timings.sort()
+    print(f"{rounds} batches of {batch} names with a typo: per name p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms; "
+          f"target in top {DEFAULT_TOP_K}: {correct / (rounds * batch):.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", action="append", help="Product name to resolve (repeatable)")
+    parser.add_argument("--top_k", type=int, default=DEFAULT_TOP_K, help="Candidates per name")
+    parser.add_argument("--csv", help="Catalog CSV (default: samples/tools/products.csv)")
+    parser.add_argument("--benchmark", type=int, metavar="ROWS", help="Time resolution over a synthetic catalog of ROWS rows")
+    parser.add_argument("--batch", type=int, default=40, help="Names per batch in the benchmark")
+    parser.add_argument("--check", action="store_true", help="Check the expected matches on the sample catalog")
+    args = parser.parse_args()
+
+    if args.csv:
+        PRODUCTS_CSV = args.csv
+
+    if args.check:
+        sys.exit(0 if run_check() else 1)
+    elif args.benchmark:
+        run_benchmark(args.benchmark, args.batch, 50)
+    else:
+        names = args.name or ["Tech Gear Pro mouse", "echowave portable speakr", "VIZN-MON"]
+        print(json.dumps(resolve_products(names, args.top_k).content, indent=2))
+
+# orchestrate tools import -k python -f ./src/tools/product_resolver.py -p ./src/tools -r ./src/tools/requirements.txt
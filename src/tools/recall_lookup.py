@@ -0,0 +1,530 @@
+from ibm_watsonx_orchestrate.agent_builder.tools import ToolPermission, tool
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+import numpy as np
+import requests
+from tracing import span, traced
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------------ Local index of recall notices ----------------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+# Recall notices are downloaded from a feed into a local snapshot file, indexed by their
+# normalized product and brand tokens, and checked for a whole list of products at once.
+# Products without a matching notice are returned as "not_found", so that the agent only
+# searches the web for those.
+#
+# RECALL_FEED selects where notices come from:
+#   openfda  - the openFDA food enforcement reports (https://open.fda.gov/apis/food/enforcement/)
+#   standin  - generated notices, for offline testing
+#   none     - only the files in RECALL_DATA_DIR
+RECALL_FEED = os.getenv("RECALL_FEED", "openfda")
+RECALL_FEED_URL = os.getenv("RECALL_FEED_URL", "https://api.fda.gov/food/enforcement.json")
+OPENFDA_API_KEY = os.getenv("OPENFDA_API_KEY", "")
+# Only notices reported within this many days are downloaded
+RECALL_FEED_DAYS = int(os.getenv("RECALL_FEED_DAYS", "730"))
+# The openFDA API returns at most 1000 reports per request and skips at most 25000
+FEED_PAGE_SIZE = 1000
+FEED_MAX_RECORDS = 26000
+REQUEST_TIMEOUT_SECONDS = 30
+
+# The snapshot is refreshed in the background once it is older than this; an old
+# snapshot keeps answering while the new one downloads
+RECALL_CACHE_PATH = os.getenv(
+    "RECALL_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "recall_notices.json")
+)
+REFRESH_SECONDS = float(os.getenv("RECALL_REFRESH_SECONDS", str(6 * 3600)))
+# The index is built in the background on the first call (the download takes up to
+# FEED_MAX_RECORDS / FEED_PAGE_SIZE requests). A call waits this long for it, then
+# answers with every product as not found, to be searched on the web.
+INDEX_WAIT_SECONDS = float(os.getenv("RECALL_INDEX_WAIT_SECONDS", "2"))
+# Optional folder of additional notices as .json or .csv files (e.g. supplier notices)
+RECALL_DATA_DIR = os.getenv("RECALL_DATA_DIR", "")
+
+# A notice matches a product when it contains at least this share of the product's
+# tokens, weighted by how rare each token is among all notices. A product naming a
+# known brand only matches notices that contain one of its brand tokens.
+MATCH_THRESHOLD = float(os.getenv("RECALL_MATCH_THRESHOLD", "0.7"))
+MAX_MATCHES_PER_PRODUCT = 3
+# Products scored together; each needs a float32 row of scores over all notices
+CHECK_BLOCK_ROWS = 64
+# openFDA status values of recalls that are still in progress
+ACTIVE_STATUSES = frozenset({"ongoing", "pending"})
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Words that do not tell products apart: fillers, package types and units
+STOPWORDS = frozenset({
+    "a", "an", "and", "by", "for", "in", "of", "on", "or", "the", "to", "with",
+    "bag", "bar", "bottle", "box", "can", "case", "ct", "count", "each", "fl", "g", "jar",
+    "kg", "lb", "lbs", "ml", "net", "oz", "pack", "package", "pk", "product", "size", "wt",
+})
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """
+    Lower case words without accents, possessives, numbers and STOPWORDS, with a plural
+    "s" removed, so that "Trader Joe's Chocolates 12 oz" gives ["trader", "joe", "chocolate"].
+    """
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    text = re.sub(r"'s\b", "", text.lower())
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text):
+        if token in STOPWORDS or token.isdigit():
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _iso_date(value) -> str:
+    """openFDA dates are YYYYMMDD; everything else is passed through."""
+    value = str(value or "").strip()
+    if re.fullmatch(r"\d{8}", value):
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    return value
+
+
+def normalize_record(raw: dict, source: str) -> Optional[dict]:
+    """
+    Converts an openFDA enforcement report, or a notice that already uses our field
+    names, into {"recall_number", "product", "brand", "reason", "issued", "reported",
+    "status", "classification", "source"}. Returns None without a product.
+    """
+    product = raw.get("product") or raw.get("product_description") or ""
+    if not product.strip():
+        return None
+    return {
+        "recall_number": str(raw.get("recall_number") or raw.get("event_id") or ""),
+        "product": " ".join(product.split()),
+        "brand": raw.get("brand") or raw.get("recalling_firm") or "",
+        "reason": " ".join((raw.get("reason") or raw.get("reason_for_recall") or "").split()),
+        "issued": _iso_date(raw.get("issued") or raw.get("recall_initiation_date")),
+        "reported": _iso_date(raw.get("reported") or raw.get("report_date")),
+        "status": raw.get("status") or "",
+        "classification": raw.get("classification") or "",
+        "source": raw.get("source") or source,
+    }
+
+
+def load_record_files(directory: str) -> List[dict]:
+    """Reads the notices in every .json and .csv file of a folder."""
+    records = []
+    if not directory or not os.path.isdir(directory):
+        return records
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        try:
+            if name.lower().endswith(".json"):
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                # An openFDA response, a snapshot, or a plain list of notices
+                rows = (data.get("results") or data.get("records") or []) if isinstance(data, dict) else data
+            elif name.lower().endswith(".csv"):
+                with open(path, encoding="utf-8", newline="") as f:
+                    rows = list(csv.DictReader(f))
+            else:
+                continue
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read recall notices from %s: %s", path, e)
+            continue
+        records.extend(r for r in (normalize_record(row, name) for row in rows) if r)
+    return records
+
+
+class OpenFdaFeed:
+    """Downloads the food enforcement reports of the last `days` days from openFDA."""
+
+    name = "openfda"
+
+    def __init__(self, url: str = RECALL_FEED_URL, days: int = RECALL_FEED_DAYS, api_key: str = OPENFDA_API_KEY):
+        self.url = url
+        self.days = days
+        self.api_key = api_key
+        self.session = requests.Session()
+
+    def fetch(self) -> List[dict]:
+        end = date.today()
+        start = end - timedelta(days=self.days)
+        params = {
+            "search": f"report_date:[{start:%Y%m%d} TO {end:%Y%m%d}]",
+            "sort": "report_date:desc",
+            "limit": FEED_PAGE_SIZE,
+        }
+        if self.api_key:
+            params["api_key"] = self.api_key
+
+        records = []
+        for skip in range(0, FEED_MAX_RECORDS, FEED_PAGE_SIZE):
+            response = self.session.get(self.url, params=dict(params, skip=skip), timeout=REQUEST_TIMEOUT_SECONDS)
+            # openFDA answers 404 when a page is past the last report
+            if response.status_code == 404:
+                break
+            response.raise_for_status()
+            page = response.json().get("results", [])
+            records.extend(r for r in (normalize_record(row, self.name) for row in page) if r)
+            if len(page) < FEED_PAGE_SIZE:
+                break
+        return records
+
+
+class StandInFeed:
+    """
+    Offline replacement for the recall feed. Returns a few fixed notices (including the
+    Spring & Mulberry chocolate used in the lab) and `count` generated ones.
+    """
+
+    name = "standin"
+
+    FIXED = [
+        {"recall_number": "F-0001-2025", "product": "Spring & Mulberry Mint Leaf Dark Chocolate Bar, 2.1 oz",
+         "brand": "Spring & Mulberry", "reason": "Undeclared milk.", "issued": "2025-02-14",
+         "status": "Ongoing", "classification": "Class II"},
+        {"recall_number": "F-0002-2025", "product": "Jif Creamy Peanut Butter 16 oz jar",
+         "brand": "The J.M. Smucker Company", "reason": "Potential Salmonella contamination.",
+         "issued": "2025-05-20", "status": "Ongoing", "classification": "Class I"},
+        {"recall_number": "F-0003-2024", "product": "Quaker Chewy Granola Bars, Chocolate Chip",
+         "brand": "Quaker Oats", "reason": "Potential Salmonella contamination.", "issued": "2024-01-11",
+         "status": "Terminated", "classification": "Class II"},
+    ]
+    BRANDS = ["Acme", "Blue Ridge", "Golden Valley", "Harbor", "Maple Grove", "Northstar", "Prairie", "Summit"]
+    PRODUCTS = ["almond milk", "apple juice", "baby spinach", "cheddar cheese", "chicken nuggets", "cold brew coffee",
+                "frozen blueberries", "granola", "greek yogurt", "ice cream", "oat cereal", "potato chips",
+                "salsa", "sourdough bread", "tortilla chips", "trail mix"]
+    REASONS = ["Undeclared peanuts.", "Potential Listeria monocytogenes contamination.", "Foreign material (plastic).",
+               "Undeclared wheat.", "Potential Salmonella contamination."]
+
+    def __init__(self, count: int = 200, latency: float = 0.0):
+        self.count = count
+        self.latency = latency
+
+    def fetch(self) -> List[dict]:
+        if self.latency:
+            time.sleep(self.latency)
+        rng = random.Random(48)
+        records = [normalize_record(r, self.name) for r in self.FIXED]
+        for i in range(self.count):
+            brand = rng.choice(self.BRANDS)
+            issued = date(2026, 1, 1) - timedelta(days=rng.randrange(RECALL_FEED_DAYS))
+            records.append(normalize_record({
+                "recall_number": f"F-{1000 + i:04d}-{issued.year}",
+                "product": f"{brand} {rng.choice(['Organic ', 'Classic ', ''])}{rng.choice(self.PRODUCTS)}",
+                "brand": f"{brand} Foods",
+                "reason": rng.choice(self.REASONS),
+                "issued": issued.isoformat(),
+                "status": rng.choice(["Ongoing", "Ongoing", "Completed", "Terminated"]),
+                "classification": rng.choice(["Class I", "Class II", "Class III"]),
+            }, self.name))
+        return records
+
+
+class RecallIndex:
+    """
+    Inverted index from normalized tokens to notices. check() scores a whole list of
+    products against all notices in one pass over the posting arrays.
+    """
+
+    def __init__(self, records: List[dict], source: str = "", updated_at: float = 0.0):
+        self.records = records
+        self.source = source
+        self.updated_at = updated_at
+        postings = defaultdict(list)
+        self._brand_tokens = set()
+        for record_id, record in enumerate(records):
+            for token in set(normalize_tokens(f"{record['product']} {record['brand']}")):
+                postings[token].append(record_id)
+            self._brand_tokens.update(normalize_tokens(record["brand"]))
+        self._postings: Dict[str, np.ndarray] = {t: np.asarray(ids, dtype=np.int64) for t, ids in postings.items()}
+        n = max(len(records), 1)
+        self._idf = {t: math.log(1 + n / len(ids)) for t, ids in self._postings.items()}
+        # Tokens no notice contains weigh as much as the rarest possible token
+        self._unknown_idf = math.log(1 + n)
+        self._active = np.asarray([r["status"].lower() in ACTIVE_STATUSES for r in records], dtype=bool)
+        # Newest first among equal scores
+        self._issued_rank = np.argsort(np.argsort([r["issued"] for r in records], kind="stable"))
+
+    def check(self, products: List[str], include_closed: bool = False,
+              threshold: float = MATCH_THRESHOLD) -> List[List[dict]]:
+        """Returns the matching notices of each product, best match first."""
+        matches = []
+        for block in range(0, len(products), CHECK_BLOCK_ROWS):
+            matches.extend(self._check_block(products[block:block + CHECK_BLOCK_ROWS], include_closed, threshold))
+        return matches
+
+    def _check_block(self, products: List[str], include_closed: bool, threshold: float) -> List[List[dict]]:
+        # One row per product: the summed weights of the tokens it shares with each notice,
+        # and whether the notice contains one of the brand tokens the product names
+        scores = np.zeros((len(products), len(self.records)), dtype=np.float32)
+        brand_hits = np.zeros(scores.shape, dtype=bool)
+        totals = np.zeros(len(products), dtype=np.float32)
+        names_brand = np.zeros(len(products), dtype=bool)
+        for p, product in enumerate(products):
+            for token in set(normalize_tokens(product)):
+                ids = self._postings.get(token)
+                if ids is None:
+                    totals[p] += self._unknown_idf
+                    continue
+                totals[p] += self._idf[token]
+                scores[p, ids] += self._idf[token]
+                if token in self._brand_tokens:
+                    names_brand[p] = True
+                    brand_hits[p, ids] = True
+
+        np.divide(scores, totals[:, None], out=scores, where=totals[:, None] > 0)
+        keep = (scores >= threshold) & (brand_hits | ~names_brand[:, None])
+        if not include_closed:
+            keep &= self._active
+
+        matches = []
+        for p in range(len(products)):
+            ids = np.flatnonzero(keep[p])
+            # Best score first, then the most recently issued
+            best = ids[np.lexsort((-self._issued_rank[ids], -scores[p, ids]))[:MAX_MATCHES_PER_PRODUCT]]
+            matches.append([dict(self.records[i], score=round(float(scores[p, i]), 3)) for i in best])
+        return matches
+
+    def stats(self) -> dict:
+        return {
+            "notices": len(self.records),
+            "active": int(self._active.sum()),
+            "tokens": len(self._postings),
+            "source": self.source,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.updated_at)) if self.updated_at else None,
+        }
+
+
+def get_feed():
+    """Returns the feed selected by RECALL_FEED, or None to use RECALL_DATA_DIR only."""
+    if _feed is not None:
+        return _feed
+    if RECALL_FEED == "standin":
+        return StandInFeed()
+    if RECALL_FEED == "openfda":
+        return OpenFdaFeed()
+    return None
+
+
+def set_feed(feed):
+    """Replaces the recall feed, e.g. with a StandInFeed for tests, and drops the loaded index."""
+    global _feed, _index
+    with _index_lock:
+        _feed = feed
+        _index = None
+        _index_ready.clear()
+
+
+def read_snapshot(path: str = None) -> Optional[dict]:
+    try:
+        with open(path or RECALL_CACHE_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def download_snapshot(feed, path: str = None) -> dict:
+    """Downloads the notices of a feed and writes them to the snapshot file."""
+    path = path or RECALL_CACHE_PATH
+    with span("recalls.download", {"feed": feed.name}) as s:
+        records = feed.fetch()
+        s.set_attribute("notices", len(records))
+    snapshot = {"source": feed.name, "fetched_at": time.time(), "records": records}
+    # Written to a temporary file first so that other tool workers never read half a file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp, path)
+    return snapshot
+
+
+def build_index(snapshot: Optional[dict]) -> RecallIndex:
+    snapshot = snapshot or {}
+    records = list(snapshot.get("records", [])) + load_record_files(RECALL_DATA_DIR)
+    return RecallIndex(records, snapshot.get("source", "files"), snapshot.get("fetched_at", 0.0))
+
+
+_feed = None
+_index = None
+_index_lock = threading.Lock()
+_index_ready = threading.Event()
+# Held while the index is loaded or refreshed in the background
+_refreshing = threading.Lock()
+
+
+def _set_index(index: RecallIndex):
+    global _index
+    with _index_lock:
+        _index = index
+        _index_ready.set()
+
+
+def load_index(feed) -> RecallIndex:
+    """Builds the index from the snapshot file, downloading it if there is none, and swaps it in."""
+    snapshot = read_snapshot()
+    if feed is not None and (snapshot is None or snapshot.get("source") != feed.name):
+        try:
+            snapshot = download_snapshot(feed)
+        except Exception as e:
+            # Every product then counts as not found and is searched on the web
+            logger.warning("Could not download the recall notices from %s: %s", feed.name, e)
+    index = build_index(snapshot)
+    _set_index(index)
+    return index
+
+
+def refresh_index(feed=None) -> Optional[RecallIndex]:
+    """Downloads a new snapshot and swaps it in; keeps the current index on failure."""
+    feed = feed or get_feed()
+    try:
+        index = build_index(download_snapshot(feed))
+    except Exception as e:
+        logger.warning("Could not refresh the recall notices from %s: %s", feed.name, e)
+        return _index
+    _set_index(index)
+    return index
+
+
+def _in_background(job, feed):
+    """Runs job(feed) on a background thread, unless a load or refresh is running already."""
+    if not _refreshing.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            job(feed)
+        except Exception as e:
+            logger.warning("Could not build the recall index: %s", e)
+        finally:
+            _refreshing.release()
+
+    threading.Thread(target=run, name="recall_index", daemon=True).start()
+
+
+def get_index(timeout: Optional[float] = None) -> Optional[RecallIndex]:
+    """
+    Returns the shared index, or None if it is not built within `timeout` seconds (None
+    waits until it is). The first call starts building it in the background from the
+    snapshot file, downloading the snapshot if there is none; a snapshot older than
+    REFRESH_SECONDS is refreshed in the background.
+    """
+    feed = get_feed()
+    if _index is None:
+        _in_background(load_index, feed)
+        _index_ready.wait(timeout)
+    index = _index
+    if index is not None and feed is not None and time.time() - index.updated_at > REFRESH_SECONDS:
+        _in_background(refresh_index, feed)
+    return index
+
+
+@traced
+@tool(
+    name="check_product_recalls",
+    description="Check a list of products against the local index of recall notices in one call.",
+    permission=ToolPermission.READ_ONLY
+)
+def check_product_recalls(products: List[str], include_closed: bool = False) -> dict:
+    """
+    Check products for recall notices in the locally cached recall dataset (FDA
+    enforcement reports). Pass all product names at once, e.g. every product returned
+    by generate_description_from_image.
+
+    Parameters:
+    products (List[str]): Product names, ideally with their brand.
+    include_closed (bool): Also return recalls that are completed or terminated.
+
+    Returns:
+    dict: {"recalls": [{"product", "notices": [{"recall_number", "product", "brand",
+        "reason", "issued", "status", "classification", "score"}]}] for the products
+        with a notice, "not_found": products without a notice in the dataset (search
+        the web for these only), "dataset": {"notices", "active", "source", "updated_at", ...}}.
+        While the dataset is still loading, every product is in "not_found" and
+        "message" says so.
+    """
+    names = []
+    for product in products or []:
+        if product and product.strip() and product.strip() not in names:
+            names.append(product.strip())
+
+    with span("recalls.check", {"products": len(names)}) as s:
+        index = get_index(INDEX_WAIT_SECONDS)
+        if index is None:
+            s.set_attribute("index_ready", False)
+            return {
+                "recalls": [],
+                "not_found": names,
+                "dataset": {"notices": 0, "status": "loading"},
+                "message": "The recall index is not ready yet. Search the web for recalls of these products."
+            }
+        matches = index.check(names, include_closed=include_closed)
+        recalls = [{"product": name, "notices": found} for name, found in zip(names, matches) if found]
+        not_found = [name for name, found in zip(names, matches) if not found]
+        s.set_attributes({"matched": len(recalls), "not_found": len(not_found), "notices": len(index.records)})
+    return {"recalls": recalls, "not_found": not_found, "dataset": index.stats()}
+
+
+def run_benchmark(batch_size: int, repeat: int):
+    """Times check() for batches of products taken from the notices plus unknown products."""
+    index = get_index()
+    rng = random.Random(0)
+    timings = []
+    for _ in range(repeat):
+        batch = [rng.choice(index.records)["product"] for _ in range(batch_size // 2)]
+        batch += [f"Unknown brand product {i}" for i in range(batch_size - len(batch))]
+        start = time.perf_counter()
+        index.check(batch)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"{repeat} checks of {batch_size} products over {len(index.records)} notices: "
+          f"p50 {timings[len(timings) // 2] * 1000:.2f} ms, p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--product", action="append", help="Product name to check (repeatable)")
+    parser.add_argument("--feed", choices=["openfda", "standin", "none"], help="Recall feed (default: RECALL_FEED)")
+    parser.add_argument("--standin_notices", type=int, default=200, help="Generated notices of the stand-in feed")
+    parser.add_argument("--data_dir", help="Folder of additional .json/.csv notices")
+    parser.add_argument("--cache", help="Snapshot file (default: RECALL_CACHE_PATH)")
+    parser.add_argument("--refresh", action="store_true", help="Download a new snapshot first")
+    parser.add_argument("--include_closed", action="store_true", help="Also list completed and terminated recalls")
+    parser.add_argument("--benchmark", type=int, metavar="BATCH", help="Time checks of BATCH products")
+    args = parser.parse_args()
+
+    if args.feed:
+        RECALL_FEED = args.feed
+    if args.data_dir:
+        RECALL_DATA_DIR = args.data_dir
+    if args.cache:
+        RECALL_CACHE_PATH = args.cache
+    if RECALL_FEED == "standin":
+        set_feed(StandInFeed(args.standin_notices))
+    if args.refresh and get_feed() is not None:
+        refresh_index()
+
+    start = time.perf_counter()
+    index = get_index()
+    print(f"Index ready in {time.perf_counter() - start:.2f}s:", index.stats())
+
+    if args.benchmark:
+        run_benchmark(args.benchmark, 200)
+    else:
+        products = args.product or ["Spring & Mulberry chocolates"]
+        print(json.dumps(check_product_recalls(products, args.include_closed).content, indent=2))
@@ -0,0 +1,414 @@
+import atexit
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+# ------------------------------ Spans for tools and plugins ------------------------------
+# -----------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------
+
+# A small tracer that sends OpenTelemetry spans (OTLP over HTTP, JSON encoding) to a
+# collector, e.g. the Langfuse OTel endpoint in src/langfuse/langfuse.yaml:
+#
+#   OTEL_EXPORTER_OTLP_TRACES_ENDPOINT=https://cloud.langfuse.com/api/public/otel/v1/traces
+#   OTEL_EXPORTER_OTLP_HEADERS="Authorization=Basic <base64 of public_key:secret_key>"
+#
+# Every tool and plugin decorated with @traced gets a span per call, and the tools add a
+# child span per stage (image download, watsonx.ai call, Tavily search, CSV scan,
+# Salesforce request, ...) with attributes such as bytes, rows_scanned, cache_hit and
+# retries. User input is kept out of the spans: queries are recorded with redact_text()
+# and URLs with redact_url().
+#
+# Tracing is off unless an endpoint is set; span() then returns a shared no-op span.
+# samples/tools/tracing.py is a copy of this file, so that both tool packages ship it.
+# This file is the source of truth: `python src/benchmark/shared_copies.py --sync`
+# copies it over, and `--check` fails while the two differ. The stand-in collector and
+# the overhead benchmark are in src/benchmark/trace_collector.py.
+
+TRACES_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "")
+# "key=value,key2=value2", as for the OpenTelemetry SDKs
+TRACES_HEADERS = os.getenv("OTEL_EXPORTER_OTLP_HEADERS", "")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "retail-tools")
+# Share of traces that are recorded, decided once per trace from its trace id
+SAMPLE_RATE = float(os.getenv("OTEL_TRACES_SAMPLER_ARG", "1.0"))
+TRACING_DISABLED = os.getenv("OTEL_SDK_DISABLED", "false").lower() in ("1", "true", "yes")
+# Record user text (search queries) in spans as is instead of as a length and a hash
+TRACE_CONTENT = os.getenv("OTEL_TRACE_CONTENT", "false").lower() in ("1", "true", "yes")
+# String attributes are cut to this many characters
+MAX_ATTRIBUTE_CHARS = 256
+
+# Spans are sent in batches from a background thread
+EXPORT_INTERVAL_SECONDS = 2.0
+EXPORT_BATCH_SIZE = 512
+EXPORT_TIMEOUT_SECONDS = 5
+# Spans beyond this many waiting to be sent are dropped
+MAX_QUEUED_SPANS = 10000
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+SPAN_KIND_INTERNAL = 1
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("current_span", default=None)
+_enabled = False
+_sample_rate = 1.0
+_exporter = None
+
+
+class _NoOpSpan:
+    """Returned by span() when nothing is recorded; every method does nothing."""
+
+    __slots__ = ()
+    recording = False
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_attributes(self, attributes: dict):
+        pass
+
+    def add(self, key: str, amount: float = 1):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoOpSpan()
+
+
+class _UnsampledTrace:
+    """Root of a trace that is not sampled: spans below it are not recorded either."""
+
+    __slots__ = ("_token",)
+    recording = False
+
+    def __enter__(self):
+        self._token = _current.set(NOOP_SPAN)
+        return NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+
+class Span:
+    """A recorded span; use as a context manager, it is exported when it ends."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+                 "attributes", "status", "message", "_token")
+    recording = True
+
+    def __init__(self, name: str, trace_id: int, parent_id: Optional[int], attributes: Optional[dict]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64) or 1
+        self.parent_id = parent_id
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = STATUS_UNSET
+        self.message = ""
+        self.start_ns = 0
+        self.end_ns = 0
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: dict):
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float = 1):
+        """Adds to a counter attribute, e.g. retries or rows_scanned."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.message = message
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        if _exporter is not None:
+            _exporter.submit(self)
+        return False
+
+
+def span(name: str, attributes: Optional[dict] = None):
+    """
+    A child span of the current span (or a new trace), for use as a context manager:
+
+        with span("watsonx.chat", {"model": model_id}) as s:
+            ...
+            s.set_attribute("bytes", len(content))
+    """
+    if not _enabled:
+        return NOOP_SPAN
+    parent = _current.get()
+    if parent is None:
+        trace_id = random.getrandbits(128) or 1
+        # Same decision as the SDKs' TraceIdRatioBased sampler
+        if (trace_id & 0xFFFFFFFFFFFFFFFF) >= _sample_rate * 2 ** 64:
+            return _UnsampledTrace()
+        return Span(name, trace_id, None, attributes)
+    if parent is NOOP_SPAN:
+        return NOOP_SPAN
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+def current_span():
+    """The innermost active span, or the no-op span; e.g. for cache hits seen deep in a call."""
+    current = _current.get()
+    return NOOP_SPAN if current is None else current
+
+
+def redact_text(text: str) -> str:
+    """
+    A span attribute for user text: its length and a short hash, which still show
+    repeated queries, or the text itself with OTEL_TRACE_CONTENT set.
+    """
+    if TRACE_CONTENT:
+        return text
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+    return f"<{len(text)} chars, sha256:{digest}>"
+
+
+def redact_url(url: str) -> str:
+    """A span attribute for a URL, without credentials, query string and fragment."""
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname or ""
+        if parts.port:
+            host = f"{host}:{parts.port}"
+    except ValueError:
+        return "<invalid url>"
+    return urlunsplit((parts.scheme, host, parts.path, "", ""))
+
+
+def propagate(fn):
+    """Wraps fn to run in the caller's trace context, for work submitted to thread pools."""
+    if not _enabled:
+        return fn
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# ---------------------------------------- Export ----------------------------------------
+
+
+def _attribute_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_attribute_value(v) for v in value]}}
+    return {"stringValue": str(value)[:MAX_ATTRIBUTE_CHARS]}
+
+
+def _attributes(attributes: dict) -> list:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items()]
+
+
+def encode_spans(spans: list, service_name: str = None) -> dict:
+    """OTLP/JSON export request for spans."""
+    encoded = []
+    for s in spans:
+        record = {
+            "traceId": f"{s.trace_id:032x}",
+            "spanId": f"{s.span_id:016x}",
+            "name": s.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.end_ns),
+            "attributes": _attributes(s.attributes),
+            "status": {"code": s.status, "message": s.message} if s.message else {"code": s.status},
+        }
+        if s.parent_id is not None:
+            record["parentSpanId"] = f"{s.parent_id:016x}"
+        encoded.append(record)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": service_name or SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": encoded}],
+        }]
+    }
+
+
+def parse_headers(value: str) -> dict:
+    headers = {}
+    for pair in value.split(","):
+        key, sep, val = pair.partition("=")
+        if sep and key.strip():
+            headers[key.strip()] = urllib.request.unquote(val.strip())
+    return headers
+
+
+class SpanExporter:
+    """Queues ended spans and posts them to the collector in batches from a daemon thread."""
+
+    def __init__(self, endpoint: str, headers: Optional[dict] = None, service_name: str = None):
+        self.endpoint = endpoint
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.service_name = service_name
+        self._queue = deque()
+        self._wake = threading.Condition()
+        self._thread = None
+        self._stopped = False
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, s: Span):
+        if len(self._queue) >= MAX_QUEUED_SPANS:
+            self.dropped += 1
+            return
+        self._queue.append(s)
+        if self._thread is None:
+            self._start()
+        if len(self._queue) >= EXPORT_BATCH_SIZE:
+            with self._wake:
+                self._wake.notify()
+
+    def _start(self):
+        with self._wake:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            with self._wake:
+                self._wake.wait(EXPORT_INTERVAL_SECONDS)
+            self.flush()
+
+    def flush(self):
+        """Sends every queued span."""
+        while self._queue:
+            batch = []
+            while self._queue and len(batch) < EXPORT_BATCH_SIZE:
+                batch.append(self._queue.popleft())
+            self._send(batch)
+
+    def _send(self, batch: list):
+        body = json.dumps(encode_spans(batch, self.service_name)).encode("utf-8")
+        request = urllib.request.Request(self.endpoint, data=body, headers=self.headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=EXPORT_TIMEOUT_SECONDS) as response:
+                response.read()
+            self.exported += len(batch)
+        except (urllib.error.URLError, OSError) as e:
+            self.failed += len(batch)
+            logger.warning("Could not export %d spans to %s: %s", len(batch), self.endpoint, e)
+
+    def shutdown(self):
+        self._stopped = True
+        with self._wake:
+            self._wake.notify()
+        self.flush()
+
+    def stats(self) -> dict:
+        return {"queued": len(self._queue), "exported": self.exported, "dropped": self.dropped,
+                "failed": self.failed}
+
+
+def configure(endpoint: str = None, sample_rate: float = None, headers: Optional[dict] = None,
+              service_name: str = None):
+    """
+    (Re)configures tracing; without arguments from the OTEL_* environment variables.
+    An empty endpoint or a sample rate of 0 turns tracing off.
+    """
+    global _enabled, _sample_rate, _exporter
+    endpoint = TRACES_ENDPOINT if endpoint is None else endpoint
+    _sample_rate = SAMPLE_RATE if sample_rate is None else sample_rate
+    if _exporter is not None:
+        _exporter.shutdown()
+        _exporter = None
+    _enabled = bool(endpoint) and _sample_rate > 0 and not TRACING_DISABLED
+    if _enabled:
+        headers = parse_headers(TRACES_HEADERS) if headers is None else headers
+        _exporter = SpanExporter(endpoint, headers, service_name)
+
+
+def flush():
+    if _exporter is not None:
+        _exporter.flush()
+
+
+def get_tracing_stats() -> dict:
+    """Export counters of the span exporter."""
+    return _exporter.stats() if _exporter is not None else {"enabled": False}
+
+
+_traced_classes = {}
+
+
+def _traced_class(tool_class):
+    """Subclass of a tool class whose calls get a span named after the tool."""
+    traced_class = _traced_classes.get(tool_class)
+    if traced_class is not None:
+        return traced_class
+
+    def __call__(self, *args, **kwargs):
+        if not _enabled:
+            return tool_class.__call__(self, *args, **kwargs)
+        name = self.fn.__name__
+        kind = getattr(self.kind, "value", self.kind)
+        with span(f"tool {name}", {"tool.name": name, "tool.kind": str(kind)}) as s:
+            response = tool_class.__call__(self, *args, **kwargs)
+            # The tools report most failures in their result rather than raising
+            content = getattr(response, "content", None)
+            if isinstance(content, dict) and content.get("error"):
+                s.set_error(str(content["error"]))
+            return response
+
+    traced_class = type(tool_class.__name__, (tool_class,), {"__call__": __call__})
+    _traced_classes[tool_class] = traced_class
+    return traced_class
+
+
+def traced(tool_object):
+    """
+    Gives every call of a tool or plugin a span named after it. Apply it above @tool:
+
+        @traced
+        @tool(...)
+        def web_search(query: str) -> dict:
+
+    The decorated function is left as it is, since the ADK reads its signature,
+    docstring and source file; only the tool object gets a subclass that adds the span.
+    """
+    tool_object.__class__ = _traced_class(type(tool_object))
+    return tool_object
+
+
+atexit.register(flush)
+configure()
+
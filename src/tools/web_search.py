@@ -1,33 +1,628 @@
 from ibm_watsonx_orchestrate.agent_builder.tools import ToolPermission, tool
-from langchain_community.tools.tavily_search import TavilySearchResults
 from ibm_watsonx_orchestrate.run import connections
 from ibm_watsonx_orchestrate.client.connections import ConnectionType
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from requests.adapters import HTTPAdapter
 import argparse
+import hashlib
+import json
+import logging
+import math
 import os
+import re
+import requests
+import sqlite3
+import tempfile
+import threading
+import time
 from dotenv import load_dotenv
+from tracing import current_span, propagate, redact_text, span, traced
 
 CONNECTION_TAVILY = 'tavily'
 tavily_api_key=''
 is_called_from_orchestrate=True
 
+MAX_RESULTS = 5
+
+# Search configuration, shared by web_search and web_search_multi. WEB_SEARCH_BACKEND=standin
+# answers queries with generated results and never touches the network, for offline testing.
+SEARCH_BACKEND = os.getenv("WEB_SEARCH_BACKEND", "tavily")
+TAVILY_API_URL = os.getenv("TAVILY_API_URL", "https://api.tavily.com")
+MAX_PARALLEL_QUERIES = int(os.getenv("WEB_SEARCH_MAX_WORKERS", "5"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("WEB_SEARCH_RATE_LIMIT", "5"))
+REQUEST_TIMEOUT_SECONDS = 30
+CONNECT_TIMEOUT_SECONDS = 5
+# The first call of either tool prepares what the other needs (the thread pool, the
+# search backend and its connection) in the background. Nothing is
+# started when the module is imported, e.g. by `orchestrate tools import`.
+WARM_UP = os.getenv("TOOL_WARM_UP", "true").lower() in ("1", "true", "yes")
+
+# Result cache configuration. Set WEB_SEARCH_CACHE_PATH to an empty string to keep
+# the cache in memory only.
+CACHE_TTL_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "1024"))
+CACHE_PATH = os.getenv(
+    "WEB_SEARCH_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "web_search_cache.sqlite3")
+)
+# Cache statistics are logged every this many lookups
+STATS_LOG_INTERVAL = 100
+
+# Approximate number of tokens the compacted search output may use in the LLM context.
+# Set WEB_SEARCH_TOKEN_BUDGET=0 to return the raw search results instead.
+TOKEN_BUDGET = int(os.getenv("WEB_SEARCH_TOKEN_BUDGET", "800"))
+# Passages whose word trigrams overlap this much with an already kept passage are dropped
+NEAR_DUPLICATE_THRESHOLD = 0.7
+MIN_PASSAGE_WORDS = 4
+
+# Words that do not change what a market-trend query is about
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in",
+    "is", "it", "of", "on", "or", "the", "to", "what", "whats", "which", "with",
+})
+PUNCTUATION = ".,;:!?\"'()[]{}"
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query for use as a cache key: lower case, collapsed whitespace,
+    surrounding punctuation and stopwords removed, so that "Coffee  trends in 2025" and
+    "coffee trends 2025?" share one entry. Word order is kept, because it can change
+    what is asked ("apple juice vs orange" is not "orange juice vs apple").
+    """
+    words = [word.strip(PUNCTUATION) for word in query.lower().split()]
+    words = [word for word in words if word]
+    kept = [word for word in words if word not in STOPWORDS]
+    # A query made only of stopwords keeps its words
+    return " ".join(kept or words)
+
+
+def cache_key(backend_name: str, query: str) -> str:
+    """Cache key of a query; web_search and web_search_multi share entries through it."""
+    return f"{backend_name}:{MAX_RESULTS}:{normalize_query(query)}"
+
+
+def search_result(result: dict) -> dict:
+    """One search result in the shape both tools cache and return."""
+    return {
+        "title": result.get("title", ""),
+        "url": result["url"],
+        "content": result.get("content", ""),
+        "score": result.get("score", 0.0)
+    }
+
+
+class _Flight:
+    """A fetch in progress that concurrent callers of the same key wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SearchCache:
+    """
+    Two-tier TTL cache for search results: an in-memory LRU in front of an optional
+    SQLite file that survives restarts. Concurrent lookups of the same key that miss
+    are coalesced into a single fetch.
+    """
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES,
+                 path: str = CACHE_PATH):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if path:
+            self._open_db(path)
+
+    def _open_db(self, path: str):
+        try:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache "
+                "(key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.execute("DELETE FROM search_cache WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning("Persistent search cache disabled (%s): %s", path, e)
+            self._db = None
+
+    def _lookup(self, key: str):
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return value
+            del self._memory[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT expires_at, value FROM search_cache WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+            if row is not None:
+                value = json.loads(row[1])
+                self._remember(key, row[0], value)
+                self.disk_hits += 1
+                return value
+        return None
+
+    def _remember(self, key: str, expires_at: float, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _store(self, key: str, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, value)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO search_cache (key, expires_at, value) VALUES (?, ?, ?)",
+                        (key, expires_at, json.dumps(value))
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning("Could not persist search result: %s", e)
+
+    def get_or_fetch(self, key: str, fetch, cacheable=lambda value: True):
+        """
+        Returns the cached value for key, or calls fetch() to produce it. Only one
+        fetch per key runs at a time; other callers wait for its result.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self._maybe_log_stats()
+                current_span().set_attribute("cache_hit", True)
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+            self._maybe_log_stats()
+        # A coalesced lookup waits for another caller's fetch instead of making its own
+        current_span().set_attribute("cache_hit", not leader)
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = fetch()
+            if cacheable(flight.value):
+                self._store(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.event.set()
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits + self.coalesced
+        lookups = hits + self.misses
+        return {
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self._memory),
+        }
+
+    def _maybe_log_stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.coalesced + self.misses
+        if lookups % STATS_LOG_INTERVAL == 0:
+            logger.info("web_search cache stats: %s", self.stats())
+
+
+search_cache = SearchCache()
+
+
+def get_cache_stats() -> dict:
+    """Hit-rate metrics of the web_search result cache."""
+    return search_cache.stats()
+
+
+class RateLimiter:
+    """Spaces out calls so that no more than `rate` start per second across all threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            current_span().set_attribute("rate_limit_wait_ms", round(wait * 1000, 1))
+            time.sleep(wait)
+
+
+class TavilyBackend:
+    """Calls the Tavily search REST API over one pooled, keep-alive HTTP session."""
+
+    name = "tavily"
+
+    def __init__(self, api_url: str = TAVILY_API_URL, pool_size: int = MAX_PARALLEL_QUERIES):
+        self.api_url = api_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def search(self, query: str, api_key: str, max_results: int = MAX_RESULTS) -> list:
+        response = self.session.post(
+            f"{self.api_url}/search",
+            headers={"Authorization": f"Bearer {api_key}"},
+            json={"query": query, "max_results": max_results},
+            timeout=REQUEST_TIMEOUT_SECONDS
+        )
+        response.raise_for_status()
+        return [search_result(r) for r in response.json().get("results", [])]
+
+    def connect(self):
+        """Opens a pooled connection to the API ahead of the first search."""
+        try:
+            self.session.head(self.api_url, timeout=CONNECT_TIMEOUT_SECONDS).close()
+        except requests.RequestException as e:
+            logger.debug("Could not connect to %s ahead of time: %s", self.api_url, e)
+
+
+class StandInBackend:
+    """
+    Offline replacement for Tavily. Returns deterministic results derived from the
+    query, including one page shared by every query so URL deduplication is exercised.
+    """
+
+    name = "standin"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def search(self, query: str, api_key: str, max_results: int = MAX_RESULTS) -> list:
+        if self.latency:
+            time.sleep(self.latency)
+        slug = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()[:8]
+        results = [
+            {
+                "title": "Retail market trends overview",
+                "url": "https://example.com/retail-market-trends",
+                "content": f"General retail market trends, including {query}.",
+                "score": 0.5
+            }
+        ]
+        for i in range(1, max_results):
+            results.append({
+                "title": f"{query} - result {i}",
+                "url": f"https://example.com/{slug}/{i}",
+                "content": f"Stand-in search result {i} for {query}.",
+                "score": round(1.0 - i / (max_results + 1), 3)
+            })
+        return results
+
+
+_backend = None
+_executor = None
+_backend_lock = threading.Lock()
+rate_limiter = RateLimiter(RATE_LIMIT_PER_SECOND)
+
+
+def get_search_backend():
+    """Returns the search backend shared by both tools, created on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = StandInBackend() if SEARCH_BACKEND == "standin" else TavilyBackend()
+        return _backend
+
+
+def set_search_backend(backend):
+    """Replaces the search backend of both tools, e.g. with a StandInBackend for tests."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _backend_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_QUERIES, thread_name_prefix="web_search")
+        return _executor
+
+
+def merge_results(results_by_query: dict) -> List[dict]:
+    """
+    Merges per-query result lists into one list with each URL once. Pages found by
+    more queries rank first, then by best search score, then by first appearance.
+    """
+    merged = OrderedDict()
+    for query, results in results_by_query.items():
+        for result in results:
+            url = result["url"].rstrip("/")
+            entry = merged.get(url)
+            if entry is None:
+                merged[url] = dict(result, url=url, queries=[query])
+            else:
+                entry["queries"].append(query)
+                if result.get("score", 0.0) > entry.get("score", 0.0):
+                    entry["score"] = result["score"]
+    order = {url: i for i, url in enumerate(merged)}
+    return sorted(
+        merged.values(),
+        key=lambda r: (-len(r["queries"]), -r.get("score", 0.0), order[r["url"]])
+    )
+
+
+def search_many(queries: List[str], api_key: str, backend=None) -> dict:
+    """Runs the queries concurrently within the rate limit and merges the results."""
+    backend = backend or get_search_backend()
+    # Identical queries after normalization are only searched once
+    unique = OrderedDict()
+    for query in queries:
+        if query and query.strip():
+            unique.setdefault(normalize_query(query), query.strip())
+
+    def run(query):
+        key = cache_key(backend.name, query)
+
+        def fetch():
+            rate_limiter.acquire()
+            return backend.search(query, api_key, MAX_RESULTS)
+
+        with span("search", {"query": redact_text(query), "backend": backend.name}) as s:
+            results = search_cache.get_or_fetch(key, fetch)
+            s.set_attribute("results", len(results))
+            return results
+
+    futures = {query: get_executor().submit(propagate(run), query) for query in unique.values()}
+    results_by_query = {}
+    errors = {}
+    for query, future in futures.items():
+        try:
+            results_by_query[query] = future.result()
+        except Exception as e:
+            logger.warning("web_search_multi query %r failed: %s", query, e)
+            errors[query] = str(e)
+
+    return {
+        "results": merge_results(results_by_query),
+        "queries": list(unique.values()),
+        "errors": errors
+    }
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English text (about four characters per token)."""
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _shingles(words: List[str]) -> set:
+    if len(words) < 3:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def compact_results(results, query: str, token_budget: Optional[int] = None) -> dict:
+    """
+    Reduces search results to the passages most relevant to the query.
+
+    Result contents are split into sentences, near-duplicate sentences across all
+    results are dropped, the rest are ranked by IDF-weighted overlap with the query
+    (ties favour higher ranked results) and kept until the token budget is used up.
+    Kept passages are returned in reading order, tagged with the number of their source.
+
+    Returns {"text": str, "sources": [{"id", "title", "url"}]}.
+    """
+    if token_budget is None:
+        token_budget = TOKEN_BUDGET
+    if isinstance(results, str):
+        # Search errors come back as a message; pass them through unchanged
+        return {"text": results, "sources": []}
+
+    passages = []
+    seen_shingles = []
+    for source_index, result in enumerate(results):
+        content = result.get("content") or ""
+        for position, sentence in enumerate(re.split(r"(?<=[.!?])\s+", content)):
+            sentence = " ".join(sentence.split())
+            words = _words(sentence)
+            if len(words) < MIN_PASSAGE_WORDS:
+                continue
+            shingles = _shingles(words)
+            if any(
+                len(shingles & other) / min(len(shingles), len(other)) >= NEAR_DUPLICATE_THRESHOLD
+                for other in seen_shingles
+            ):
+                continue
+            seen_shingles.append(shingles)
+            passages.append((source_index, position, sentence, set(words)))
+
+    query_terms = set(_words(query)) - STOPWORDS
+    document_frequency = {
+        term: sum(1 for passage in passages if term in passage[3]) for term in query_terms
+    }
+    total = len(passages)
+
+    def relevance(passage):
+        source_index, position, _, words = passage
+        score = sum(
+            math.log(1 + total / document_frequency[term])
+            for term in query_terms if term in words
+        )
+        return score - 0.01 * source_index - 0.001 * position
+
+    selected = []
+    used = 0
+    for passage in sorted(passages, key=relevance, reverse=True):
+        cost = estimate_tokens(passage[2]) + 2
+        if used + cost > token_budget:
+            continue
+        selected.append(passage)
+        used += cost
+
+    source_ids = {}
+    lines = []
+    for source_index, _, sentence, _ in sorted(selected, key=lambda p: (p[0], p[1])):
+        source_id = source_ids.setdefault(source_index, len(source_ids) + 1)
+        lines.append(f"[{source_id}] {sentence}")
+
+    sources = [
+        {
+            "id": source_id,
+            "title": results[source_index].get("title", ""),
+            "url": results[source_index].get("url", "")
+        }
+        for source_index, source_id in source_ids.items()
+    ]
+    return {"text": "\n".join(lines), "sources": sources}
+
+
+@traced
 @tool(
         {"app_id": CONNECTION_TAVILY, "type": ConnectionType.KEY_VALUE}
 )
-def web_search(query: str) -> str:
-    """Use Tavily to search the web and return the top results for a given query string."""
+def web_search(query: str) -> dict:
+    """
+    Use Tavily to search the web and return the top results for a given query string.
+
+    Returns:
+    dict: {"text": the passages most relevant to the query, each prefixed with the
+        [id] of its source, "sources": [{"id", "title", "url"}]}. With a token budget of 0,
+        {"results": [{"title", "url", "content", "score"}]} instead. If the search failed,
+        "error" holds the message.
+    """
 
     global tavily_api_key
 
+    start_warm_up()
     if is_called_from_orchestrate == True:
         tavily_api_key = connections.key_value(CONNECTION_TAVILY)['apikey']
 
-    search = TavilySearchResults(max_results=5, tavily_api_key=tavily_api_key)
-    results = search.run(query)
-    return results
+    backend = get_search_backend()
+
+    def fetch():
+        rate_limiter.acquire()
+        return backend.search(query, tavily_api_key, MAX_RESULTS)
+
+    with span("search", {"query": redact_text(query), "backend": backend.name}) as s:
+        try:
+            results = search_cache.get_or_fetch(cache_key(backend.name, query), fetch)
+            s.set_attribute("results", len(results))
+        except Exception as e:
+            # Failed searches are not cached; the agent gets the message instead of results
+            logger.warning("web_search query %r failed: %s", query, e)
+            s.set_error(str(e))
+            results = f"Search failed: {e}"
+    if TOKEN_BUDGET <= 0:
+        if not isinstance(results, list):
+            return {"results": [], "error": str(results)}
+        return {"results": results}
+    with span("compact_results", {"token_budget": TOKEN_BUDGET}) as s:
+        compacted = compact_results(results, query)
+        s.set_attribute("tokens", estimate_tokens(compacted["text"]))
+    if not isinstance(results, list):
+        compacted["error"] = str(results)
+    return compacted
+
+@traced
+@tool(
+        {"app_id": CONNECTION_TAVILY, "type": ConnectionType.KEY_VALUE}
+)
+def web_search_multi(queries: List[str]) -> dict:
+    """
+    Use Tavily to search the web for several query strings at once, for example one query
+    per product found on a shelf image. Prefer this over calling web_search repeatedly.
+
+    Parameters:
+    queries (List[str]): The search strings.
+
+    Returns:
+    dict: {"text": the passages most relevant to the queries, each prefixed with the [id]
+        of its source, "sources": [{"id", "title", "url"}], "queries": [...],
+        "errors": {query: message}}. Each source appears once, and sources found by
+        more queries are preferred.
+    """
+
+    global tavily_api_key
+
+    start_warm_up()
+    if is_called_from_orchestrate == True:
+        tavily_api_key = connections.key_value(CONNECTION_TAVILY)['apikey']
+
+    found = search_many(queries, tavily_api_key)
+    if TOKEN_BUDGET <= 0:
+        return found
+    # Scale the budget with the number of queries so every product gets some coverage
+    token_budget = TOKEN_BUDGET * max(1, len(found["queries"]))
+    with span("compact_results", {"token_budget": token_budget, "results": len(found["results"])}) as s:
+        compacted = compact_results(found["results"], " ".join(found["queries"]), token_budget=token_budget)
+        s.set_attribute("tokens", estimate_tokens(compacted["text"]))
+    compacted["queries"] = found["queries"]
+    compacted["errors"] = found["errors"]
+    return compacted
+
+def warm_up():
+    """Creates the thread pool and the search backend with a connection to the search API."""
+    get_executor()
+    backend = get_search_backend()
+    if hasattr(backend, "connect"):
+        backend.connect()
+
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+
+def start_warm_up():
+    """Runs warm_up() in the background, once per process, unless TOOL_WARM_UP is off."""
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started or not WARM_UP:
+            return
+        _warm_up_started = True
+    threading.Thread(target=warm_up, name="warm_up", daemon=True).start()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--input", required=True, help="Search string")
+    parser.add_argument("--input", required=True, action="append", help="Search string (repeat for a multi-query search)")
+    parser.add_argument("--standin", action="store_true", help="Use the offline stand-in search backend")
+    parser.add_argument("--stats", action="store_true", help="Print cache statistics after the search")
+    parser.add_argument("--token_budget", type=int, help="Token budget for the compacted output (0 = raw results)")
 
     args = parser.parse_args()
 
@@ -35,5 +630,17 @@ if __name__ == "__main__":
     tavily_api_key=os.getenv("TAVILY_API_KEY")
     is_called_from_orchestrate=False
 
-    results = web_search(args.input)
-    print("Search results:", results)
\ No newline at end of file
+    if args.token_budget is not None:
+        TOKEN_BUDGET = args.token_budget
+
+    if args.standin:
+        set_search_backend(StandInBackend())
+
+    if len(args.input) > 1 or args.standin:
+        results = web_search_multi(args.input)
+        print("Search results:", json.dumps(results.content, indent=2))
+    else:
+        results = web_search(args.input[0])
+        print("Search results:", results.content)
+    if args.stats:
+        print("Cache stats:", get_cache_stats())